@@ -62,6 +62,10 @@ class MatadorCommandLine:
             if self.subcommand == "swaps":
                 from matador.swaps import AtomicSwapper
 
+                if self.args.get("lazy") and self.args.get("view"):
+                    raise SystemExit(
+                        "Cannot view swapped structures that are generated with --lazy."
+                    )
                 self.query = DBQuery(self.client, self.collections, **self.args)
                 if self.args.get("hull_cutoff") is not None:
                     self.hull = QueryConvexHull(query=self.query, **self.args)
@@ -115,6 +119,8 @@ class MatadorCommandLine:
                     action=action,
                     mongo_settings=self.settings,
                     override=kwargs.get("no_quickstart"),
+                    batch_size=self.args.get("batch_size") or 1000,
+                    dry_run=self.args.get("dryrun"),
                 )
 
             if self.subcommand == "hulldiff":
@@ -130,11 +136,24 @@ class MatadorCommandLine:
                 from matador.export import query2files
 
                 if self.args.get("write_n") is not None:
-                    self.cursor = [
+                    self.cursor = (
                         doc
                         for doc in self.cursor
                         if len(doc["stoichiometry"]) == self.args.get("write_n")
-                    ]
+                    )
+                    # only a lazy cursor of swaps is left to be streamed
+                    if not self.args.get("lazy"):
+                        self.cursor = list(self.cursor)
+                if self.args.get("lazy"):
+                    from itertools import chain
+
+                    # peek at a lazy cursor to check whether it is empty
+                    self.cursor = iter(self.cursor)
+                    first_doc = next(self.cursor, None)
+                    if first_doc is None:
+                        self.cursor = []
+                    else:
+                        self.cursor = chain([first_doc], self.cursor)
                 if not self.cursor:
                     print_failure("No structures left to export.")
                 query2files(
@@ -712,6 +731,17 @@ def main(no_quickstart=False):
     changes_flags.add_argument(
         "-u", "--undo", action="store_true", help="undo changeset"
     )
+    changes_flags.add_argument(
+        "-d",
+        "--dryrun",
+        action="store_true",
+        help="report how many structures --undo would remove, without removing them",
+    )
+    changes_flags.add_argument(
+        "--batch_size",
+        type=int,
+        help="number of structures to remove at once with --undo (DEFAULT: 1000)",
+    )
 
     collection_flags = argparse.ArgumentParser(add_help=False)
     collection_flags.add_argument(
@@ -841,6 +871,17 @@ def main(no_quickstart=False):
     query_flags.add_argument(
         "--write_n", type=int, help="export only those structures with n species"
     )
+    query_flags.add_argument(
+        "--archive",
+        type=str,
+        choices=["tar", "tar.gz", "zip"],
+        help="export query into a single archive of this type, rather than a folder",
+    )
+    query_flags.add_argument(
+        "--workers",
+        type=int,
+        help="number of processes to use to format exported files or refine structures",
+    )
 
     swap_flags = argparse.ArgumentParser(add_help=False)
     swap_flags.add_argument(
@@ -853,6 +894,13 @@ def main(no_quickstart=False):
         "to Na, and -sw [V]As:[Li,K,Rb]Na will swap all group V elements to As and all of Li,"
         "K and Rb to Na.",
     )
+    swap_flags.add_argument(
+        "--lazy",
+        action="store_true",
+        help="generate swapped structures one at a time, dropping duplicates as they are "
+        "made, and stream them straight to the exported files without storing them all "
+        "(--uniq is ignored).",
+    )
     diff_flags = argparse.ArgumentParser(add_help=False)
     diff_flags.add_argument(
         "-cmp",
@@ -893,6 +941,16 @@ def main(no_quickstart=False):
     refine_flags.add_argument(
         "--new_doi", type=str, help="new doi to add to structures in query"
     )
+    refine_flags.add_argument(
+        "--chunk_size",
+        type=int,
+        help="number of structures to update in the database at once (DEFAULT: 1000)",
+    )
+    refine_flags.add_argument(
+        "--checkpoint",
+        type=str,
+        help="file in which to record progress, such that an interrupted refine can be resumed",
+    )
 
     stats_flags = argparse.ArgumentParser(add_help=False)
     stats_flags.add_argument(
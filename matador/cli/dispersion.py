@@ -37,6 +37,11 @@ def main():
     parser.add_argument(
         "--labels", type=str, nargs="*", help="list of legend labels, comma separated"
     )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="store scraped data in binary sidecar files and reuse them if the files are unchanged",
+    )
     parser.add_argument("--dos_only", action="store_true", help="only plot DOS")
     parser.add_argument("--bs_only", action="store_true", help="only plot dispersion")
     parser.add_argument(
@@ -143,6 +143,20 @@ def main():
         default=False,
         help="run all res files at kpoint spacings defined in kpt.conv file",
     )
+    parser.add_argument(
+        "--conv_workers",
+        type=int,
+        default=1,
+        help="number of convergence test singlepoints to run at once, "
+        "splitting the cores between them, each in its own compute subdirectory",
+    )
+    parser.add_argument(
+        "--workflow_workers",
+        type=int,
+        default=1,
+        help="number of independent steps of phonon, spectral and magres workflows "
+        "to run at once, splitting the cores between them, each in its own subdirectory",
+    )
     parser.add_argument(
         "--memcheck",
         action="store_true",
@@ -157,6 +171,34 @@ def main():
         "default value is taken from .matadorrc.",
     )
     parser.add_argument("--maxmem", type=int, help="override max memory for memcheck")
+    parser.add_argument(
+        "--memcheck_cache",
+        action="store_true",
+        default=False,
+        help="cache memcheck estimates and run times in memcheck_cache.jsonl, skipping "
+        "the dryrun when a model fitted to the cache predicts the job will fit in memory",
+    )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        default=False,
+        help="pack jobs of different sizes onto this node using memcheck estimates, "
+        "starting new jobs as others finish without exceeding the max memory, and "
+        "running each on the same share of the cores as of the memory; "
+        "requires --ncores, the most cores for any one job",
+    )
+    parser.add_argument(
+        "--db",
+        type=str,
+        help="insert the results of finished calculations directly into this database "
+        "collection, skipping any already present, without a separate import",
+    )
+    parser.add_argument(
+        "--db_batch_size",
+        type=int,
+        default=20,
+        help="number of finished calculations to buffer before inserting them into --db",
+    )
     parser.add_argument(
         "--killcheck",
         action="store_true",
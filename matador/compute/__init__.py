@@ -12,6 +12,22 @@ The batch submodule contains the :class:`BatchRun` class for running several
 independent :class:`ComputeTask` instances on a folder of structures, without
 clashes.
 
+The scheduler submodule provides a memory-aware packer, used by
+:class:`BatchRun` to run jobs of different sizes on the same node.
+
+The memcheck submodule provides a persistent cache of CASTEP dryrun memory
+estimates, and a model fitted to it that allows dryruns to be skipped.
+
+The supervisor submodule provides an event-driven supervisor for
+subprocesses, used by :class:`ComputeTask` to wait on its executables.
+
+The walltime submodule predicts the duration of relaxation blocks from the
+CASTEP timings so far, used by :class:`ComputeTask` to stop cleanly before
+the walltime.
+
+The staging submodule links or copies files in and out of compute
+directories, skipping any that are unchanged.
+
 The slurm submodule provides a wrapper to useful slurm commands, and to
 writing slurm job submission files.
 
@@ -9,21 +9,24 @@ high-throughput.
 
 
 from collections import defaultdict
+from contextlib import contextmanager
 import multiprocessing as mp
 import os
 import glob
 import time
 import random
 import psutil
+from psutil import virtual_memory
 from matador.utils.print_utils import print_failure, print_warning
 from matador.compute.queueing import get_queue_manager
 from matador.scrapers.castep_scrapers import cell2dict, param2dict
 from matador.compute.compute import ComputeTask
+from matador.compute.scheduler import job_ncores, schedule_jobs
 from matador.utils.errors import (
     InputError,
     CalculationError,
+    CriticalError,
     MaxMemoryEstimateExceeded,
-    NodeCollisionError,
 )
 
 
@@ -77,7 +80,10 @@ class BatchRun:
             "intel": False,
             "conv_cutoff": False,
             "conv_kpt": False,
+            "conv_workers": 1,
+            "workflow_workers": 1,
             "memcheck": False,
+            "memcheck_cache": False,
             "maxmem": None,
             "killcheck": True,
             "scratch_prefix": None,
@@ -91,6 +97,9 @@ class BatchRun:
             "limit": None,
             "profile": False,
             "polltime": 30,
+            "pack": False,
+            "db": None,
+            "db_batch_size": 20,
         }
         self.args = {}
         self.args.update(prop_defaults)
@@ -152,6 +161,11 @@ class BatchRun:
 
         # assign number of cores
         self.all_cores = psutil.cpu_count(logical=False)
+        if self.args.get("pack") and self.args.get("ncores") is None:
+            # the default would give each job the whole node, leaving nothing to pack
+            raise InputError(
+                "Job packing requires the most cores for any one job, --ncores."
+            )
         if self.args.get("ncores") is None:
             if self.queue_mgr is None:
                 self.args["ncores"] = int(self.all_cores / self.nprocesses)
@@ -208,6 +222,9 @@ class BatchRun:
                 process. Useful for testing.
 
         """
+        if self.args.get("pack"):
+            return self.spawn_packed()
+
         procs = []
         error_queue = mp.Queue()
         for proc_id in range(self.nprocesses):
@@ -240,15 +257,7 @@ class BatchRun:
                     failed_seeds.append(result[2])
 
             if errors:
-                error_message = ""
-                for error in errors:
-                    error_message += "Process {} raised error(s): {}. ".format(
-                        error[0], error[1]
-                    )
-                    if len({type(error[1]) for error in errors}) == 1:
-                        raise errors[0][1]
-                    raise type(errors[0][1])(error_message)
-                raise BundledErrors(error_message)
+                _raise_process_errors(errors)
         # the only errors that reach here are fatal, e.g. WalltimeError, CriticalError, InputError, KeyboardInterrupt
         except RuntimeError as err:
             result = [proc.join(timeout=2) for proc in procs]
@@ -267,7 +276,206 @@ class BatchRun:
         except OSError:
             pass
 
-    def perform_new_calculations(self, res_list, error_queue, proc_id):
+    def spawn_packed(self):
+        """Pack jobs of different sizes onto this node using their memcheck
+        estimates, starting new jobs whenever running ones finish, such that the
+        total memory estimate of running jobs never exceeds 90% of the maximum
+        memory, and the total number of cores never exceeds those available.
+
+        Each job runs on the same share of the node's cores as its memory
+        estimate is of the maximum memory, up to `ncores` (see
+        :func:`matador.compute.scheduler.job_ncores`), so that small jobs
+        leave cores free for others. Jobs are only claimed, and their memory
+        estimated with a CASTEP dryrun, as the node has room for them, so that
+        other nodes can share the remaining jobs. Any jobs that were claimed but
+        never started, e.g. after a fatal error, are released again.
+
+        """
+        if self.mode != "castep":
+            raise InputError("Job packing requires CASTEP memcheck estimates.")
+
+        if self.queue_mgr is not None:
+            total_cores = self.queue_mgr.ntasks
+        else:
+            total_cores = self.all_cores
+        if self.maxmem is not None:
+            max_mem = 0.9 * self.maxmem
+        else:
+            max_mem = 0.9 * float(virtual_memory().available) / 1024**2
+
+        job_queue = JobQueue(
+            jobs_fname=self.paths["jobs_fname"],
+            ignore_jobs_file=self.args.get("ignore_jobs_file"),
+        )
+        # one sink in this process batches the results of all the jobs
+        try:
+            result_sink = self._make_result_sink()
+        except (Exception, SystemExit) as err:
+            raise CriticalError("Unable to connect to database: {}".format(err))
+
+        claimed = []
+        started = set()
+
+        def claim_jobs():
+            """Claim and estimate the remaining jobs one at a time,
+            as the scheduler asks for them.
+
+            """
+            for res in sorted(self.file_lists["res"]):
+                if self.limit is not None and len(claimed) >= self.limit:
+                    return
+                if not os.path.isfile(res) or job_queue.is_taken(res):
+                    continue
+                # claim the job before the dryrun so other nodes do not estimate it too
+                if not job_queue.claim(res):
+                    continue
+                try:
+                    mem = self.estimate_memory(res)
+                except MaxMemoryEstimateExceeded as exc:
+                    print_warning("Skipping {}: {}".format(res, exc))
+                    job_queue.release(res)
+                    continue
+                except CalculationError as exc:
+                    print_warning("Skipping {}: {}".format(res, exc))
+                    with open(self.paths["failures_fname"], "a") as job_file:
+                        job_file.write(res + "\n")
+                    continue
+                # let other nodes with more memory have a go at the oversized jobs
+                if mem > max_mem:
+                    with open(self.paths["memory_fname"], "a") as job_file:
+                        job_file.write(
+                            "{} {:.2f}GB/{:.2f}GB\n".format(
+                                res, mem / 1024, max_mem / 1024
+                            )
+                        )
+                    job_queue.release(res)
+                    continue
+                ncores = job_ncores(mem, max_mem, total_cores, self.args["ncores"])
+                job = {"res": res, "ncores": ncores, "mem": mem}
+                claimed.append(job)
+                yield job
+
+        procs = []
+        errors = []
+        # use a managed queue so that finished processes never block on flushing it
+        manager = mp.Manager()
+        error_queue = manager.Queue()
+        result_queue = manager.Queue() if result_sink is not None else None
+
+        def push_results():
+            while result_queue is not None and not result_queue.empty():
+                result_sink.push(result_queue.get())
+
+        def launch(job):
+            proc = mp.Process(
+                target=self._perform_packed_calculation,
+                args=(job, error_queue, len(procs), result_queue),
+            )
+            proc.start()
+            procs.append(proc)
+            started.add(job["res"])
+            return proc
+
+        def on_finish(job, proc):
+            push_results()
+            while not error_queue.empty():
+                result = error_queue.get()
+                if isinstance(result[1], Exception):
+                    errors.append(result)
+            # stop starting new jobs after a fatal error
+            return not errors
+
+        try:
+            schedule_jobs(
+                claim_jobs(), launch, total_cores, max_mem, on_finish=on_finish
+            )
+            if errors:
+                _raise_process_errors(errors)
+        except RuntimeError as err:
+            for proc in procs:
+                proc.join(timeout=2)
+                if proc.is_alive():
+                    proc.terminate()
+            try:
+                # Guard against failures to write to stdout
+                print_failure("Fatal error(s) reported:")
+                print_warning(err)
+            except OSError:
+                pass
+            raise err
+        finally:
+            # let other nodes run the jobs that were claimed but never started
+            for job in claimed:
+                if job["res"] not in started:
+                    job_queue.release(job["res"])
+            # insert any results still buffered, even if stopping early
+            if result_sink is not None:
+                push_results()
+                result_sink.flush()
+            manager.shutdown()
+
+        try:
+            # Guard against failures to write to stdout
+            print("Nothing left to do.")
+        except OSError:
+            pass
+
+    def estimate_memory(self, res):
+        """Estimate the memory required to run the given structure
+        with a CASTEP dryrun on the requested number of cores.
+
+        Parameters:
+            res (str): structure filename.
+
+        Returns:
+            float: the memory estimate in MB.
+
+        """
+        args = dict(self.args)
+        args["memcheck"] = True
+        relaxer = ComputeTask(
+            node=None,
+            res=res,
+            param_dict=self.param_dict,
+            cell_dict=self.cell_dict,
+            mode=self.mode,
+            paths=self.paths,
+            compute_dir=None,
+            maxmem=self.maxmem,
+            start=False,
+            **args,
+        )
+        return relaxer.estimate_memory()
+
+    def _perform_packed_calculation(self, job, error_queue, proc_id, result_queue=None):
+        """Run a single job that has already been claimed and packed onto
+        the node with the number of cores assigned to it.
+
+        Parameters:
+            job (dict): the job to run, containing the structure filename
+                under `res` and the number of cores under `ncores`.
+            error_queue (multiprocessing.Queue): queue to push exceptions to
+            proc_id (int): process id for logging
+
+        Keyword arguments:
+            result_queue (multiprocessing.Queue): queue to send the results
+                of finished calculations through to the result sink of the
+                parent process, if any.
+
+        """
+        from matador.db.sink import QueueSink
+
+        self.args["ncores"] = job["ncores"]
+        self.args["memcheck"] = False
+        self.limit = None
+        result_sink = QueueSink(result_queue) if result_queue is not None else None
+        self.perform_new_calculations(
+            [job["res"]], error_queue, proc_id, claimed=True, result_sink=result_sink
+        )
+
+    def perform_new_calculations(
+        self, res_list, error_queue, proc_id, claimed=False, result_sink=None
+    ):
         """Perform all calculations that have not already
         failed or finished to completion.
 
@@ -276,52 +484,92 @@ class BatchRun:
             error_queue (multiprocessing.Queue): queue to push exceptions to
             proc_id (int): process id for logging
 
+        Keyword arguments:
+            claimed (bool): whether the jobs have already been claimed
+                by this run, e.g. when packing.
+            result_sink (DatabaseSink): sink for finished results, if not
+                connecting to the `db` collection in this process.
+
         """
-        job_count = 0
         if isinstance(res_list, str):
             res_list = [res_list]
+        job_queue = JobQueue(
+            jobs_fname=self.paths["jobs_fname"],
+            ignore_jobs_file=self.args.get("ignore_jobs_file"),
+        )
+        try:
+            if result_sink is None:
+                result_sink = self._make_result_sink()
+        # the connection exits on failure, which must not kill this process silently
+        except (Exception, SystemExit) as err:
+            error_queue.put(
+                (
+                    proc_id,
+                    CriticalError("Unable to connect to database: {}".format(err)),
+                    "",
+                )
+            )
+            return
+        try:
+            self._perform_new_calculations(
+                res_list, error_queue, proc_id, job_queue, result_sink, claimed=claimed
+            )
+        finally:
+            # insert any results still buffered, even if this process is stopping early
+            if result_sink is not None:
+                result_sink.flush()
+
+    def _make_result_sink(self):
+        """Connect to the collection requested by the `db` argument, if any,
+        in the current process.
+
+        Returns:
+            DatabaseSink: a sink for the results of finished calculations,
+                or None if no collection was requested.
+
+        """
+        if self.args.get("db") is None:
+            return None
+
+        from matador.db import make_connection_to_collection
+        from matador.db.sink import DatabaseSink
+
+        _, _, collections = make_connection_to_collection(
+            self.args["db"], import_mode=True, override=True
+        )
+        return DatabaseSink(
+            next(iter(collections.values())), batch_size=self.args["db_batch_size"]
+        )
+
+    def _perform_new_calculations(
+        self, res_list, error_queue, proc_id, job_queue, result_sink, claimed=False
+    ):
+        """Loop over the structures on behalf of :meth:`perform_new_calculations`.
+
+        Parameters:
+            res_list (:obj:`list` of :obj:`str`): list of structure filenames.
+            error_queue (multiprocessing.Queue): queue to push exceptions to
+            proc_id (int): process id for logging
+            job_queue (JobQueue): the queue used to claim jobs.
+            result_sink (DatabaseSink): sink for finished results, or None.
+
+        Keyword arguments:
+            claimed (bool): whether the jobs have already been claimed.
+
+        """
+        job_count = 0
         for res in res_list:
             try:
-                if not os.path.isfile(res):
+                if not claimed and (not os.path.isfile(res) or job_queue.is_taken(res)):
                     continue
-                # probe once then sleep for a random amount up to 5 seconds
-                # before checking again for a lock file, just to protect
-                # against collisions in large array jobs on slower parallel file systems
-                _ = os.path.isfile("{}.lock".format(res))
-                time.sleep(2 * random.random())
-                # wait some additional time if this is a slurm array job
-                if self.queue_mgr is not None:
-                    extra_wait = (
-                        self.queue_mgr.array_id % 10 if self.queue_mgr.array_id else 0
-                    )
-                    time.sleep(extra_wait)
-                locked = os.path.isfile("{}.lock".format(res))
-                if not self.args.get("ignore_jobs_file"):
-                    listed = self._check_jobs_file(res)
-                else:
-                    listed = []
-                running = any([listed, locked])
-                if not running:
-                    # check we haven't reached job limit
-                    if self.limit is not None and job_count >= self.limit:
-                        error_queue.put((proc_id, job_count, res))
-                        return
-
-                    # check 3 more times if a lock exists with random up to 1 second
-                    # waits each time
-                    for _ in range(3):
-                        time.sleep(random.random())
-                        if os.path.isfile("{}.lock".format(res)):
-                            raise NodeCollisionError(
-                                "Another node wrote this file when I wanted to, skipping..."
-                            )
-                    with open(res + ".lock", "a") as job_file:
-                        pass
 
-                    # write to jobs file
-                    with open(self.paths["jobs_fname"], "a") as job_file:
-                        job_file.write(res + "\n")
+                # check we haven't reached job limit
+                if self.limit is not None and job_count >= self.limit:
+                    error_queue.put((proc_id, job_count, res))
+                    return
 
+                # atomically claim the job, skipping it if another process got there first
+                if claimed or job_queue.claim(res):
                     # create full relaxer object for creation and running of job
                     job_count += 1
                     relaxer = ComputeTask(
@@ -334,21 +582,14 @@ class BatchRun:
                         compute_dir=self.compute_dir,
                         timings=(self.max_walltime, self.start_time),
                         maxmem=self.maxmem,
+                        result_sink=result_sink,
                         **self.args,
                     )
                     # if memory check failed, let other nodes have a go
                     if not relaxer.enough_memory:
                         with open(self.paths["memory_fname"], "a") as job_file:
                             job_file.write(res + "\n")
-                        if os.path.isfile("{}.lock".format(res)):
-                            os.remove("{}.lock".format(res))
-                        with open(self.paths["jobs_fname"], "r+") as job_file:
-                            flines = job_file.readlines()
-                            job_file.seek(0)
-                        for line in flines:
-                            if res not in line:
-                                job_file.write(line)
-                            job_file.truncate()
+                        job_queue.release(res)
 
                     elif relaxer.success:
                         with open(self.paths["completed_fname"], "a") as job_file:
@@ -359,7 +600,7 @@ class BatchRun:
 
             # catch memory errors and reset so another node can try
             except MaxMemoryEstimateExceeded:
-                reset_single_seed(res)
+                job_queue.release(res)
                 continue
 
             # ignore any other individual calculation errors or node collisions that were caught here
@@ -368,7 +609,7 @@ class BatchRun:
 
             # reset txt/lock for an input error, but throw it to prevent other calcs
             except InputError as err:
-                reset_single_seed(res)
+                job_queue.release(res)
                 error_queue.put((proc_id, err, res))
                 return
             # push globally-fatal errors to queue, and return to prevent further calcs
@@ -483,22 +724,161 @@ class BatchRun:
         else:
             self.args["conv_kpt"] = None
 
-    def _check_jobs_file(self, res):
-        """Check if structure is listed in jobs.txt file.
+
+class JobQueue:
+    """A queue of structure files shared between competing processes,
+    potentially on different nodes, where each job is claimed by exclusively
+    creating its ``<res>.lock`` file. As the creation either atomically succeeds
+    or fails, exactly one process will claim each job without needing to wait
+    and re-check for collisions. Claimed jobs are also appended to the jobs file,
+    whose new lines are read whenever it changes, so that jobs that have stopped
+    and released their lock file (e.g. at the walltime) are not claimed again.
+
+    """
+
+    def __init__(self, jobs_fname="jobs.txt", ignore_jobs_file=False):
+        """Initialise the queue around the given jobs file.
+
+        Keyword arguments:
+            jobs_fname (str): the file that lists all started jobs.
+            ignore_jobs_file (bool): whether to ignore the jobs
+                listed in the jobs file, only checking lock files.
+
+        """
+        self.jobs_fname = jobs_fname
+        self.ignore_jobs_file = ignore_jobs_file
+        self.listed = set()
+        self._jobs_file_stat = None
+        self._jobs_file_offset = 0
+        self._last_job_line = b""
+
+    @staticmethod
+    def lock_fname(res):
+        """Return the lock file name for the given structure file."""
+        return "{}.lock".format(res)
+
+    def _reload_jobs_file(self):
+        """Read any lines appended to the jobs file since it was last read.
+        The whole file is only re-read if the last line read is no longer
+        where it was, i.e. the file has been rewritten by :meth:`release`.
+
+        """
+        try:
+            stat = os.stat(self.jobs_fname)
+        except FileNotFoundError:
+            self.listed = set()
+            self._jobs_file_stat = None
+            self._jobs_file_offset = 0
+            self._last_job_line = b""
+            return
+
+        stat_key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if stat_key == self._jobs_file_stat:
+            return
+
+        offset = self._jobs_file_offset
+        with open(self.jobs_fname, "rb") as job_file:
+            if offset > stat.st_size:
+                offset = 0
+            elif offset:
+                job_file.seek(offset - len(self._last_job_line))
+                if job_file.read(len(self._last_job_line)) != self._last_job_line:
+                    offset = 0
+            if offset == 0:
+                self.listed = set()
+                self._last_job_line = b""
+            job_file.seek(offset)
+            new_lines = job_file.read()
+
+        # leave any partially written line to be read next time
+        complete = new_lines.rfind(b"\n") + 1
+        new_lines = new_lines[:complete].splitlines(keepends=True)
+        self.listed.update(line.decode().strip() for line in new_lines)
+        if new_lines:
+            self._last_job_line = new_lines[-1]
+        self._jobs_file_offset = offset + complete
+        self._jobs_file_stat = stat_key
+
+    def is_taken(self, res):
+        """Check whether the job has been started already, either
+        by this run or a previous one.
 
         Parameters:
-            res (str): structure name.
+            res (str): structure filename.
 
         Returns:
-            bool: True if already listed in jobs file.
+            bool: True if the job is locked or listed in the jobs file.
 
         """
-        with open(self.paths["jobs_fname"], "r") as job_file:
-            flines = job_file.readlines()
-            for line in flines:
-                if res in line:
-                    return True
-        return False
+        if os.path.isfile(self.lock_fname(res)):
+            return True
+        if self.ignore_jobs_file:
+            return False
+        self._reload_jobs_file()
+        return res in self.listed
+
+    def claim(self, res):
+        """Try to claim the job by exclusively creating its lock file,
+        and list it in the jobs file if successful.
+
+        Parameters:
+            res (str): structure filename.
+
+        Returns:
+            bool: True if this process claimed the job, False if another
+                process has already claimed it.
+
+        """
+        try:
+            fd = os.open(self.lock_fname(res), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+
+        with open(self.jobs_fname, "a") as job_file:
+            with _locked(job_file):
+                job_file.write(res + "\n")
+
+        return True
+
+    def release(self, res):
+        """Remove the lock file and jobs file entry for the given
+        job, so that another process can claim it.
+
+        Parameters:
+            res (str): structure filename.
+
+        """
+        if os.path.isfile(self.jobs_fname):
+            # hold the lock for the whole rewrite so no concurrent claims are lost
+            with open(self.jobs_fname, "r+") as job_file:
+                with _locked(job_file):
+                    flines = job_file.readlines()
+                    job_file.seek(0)
+                    for line in flines:
+                        if line.strip() != res:
+                            job_file.write(line)
+                    job_file.truncate()
+        self.listed.discard(res)
+        if os.path.isfile(self.lock_fname(res)):
+            os.remove(self.lock_fname(res))
+
+
+@contextmanager
+def _locked(file_obj):
+    """Hold an exclusive advisory lock on an open file, where supported."""
+    try:
+        import fcntl
+    except ImportError:
+        yield file_obj
+        return
+
+    fcntl.flock(file_obj.fileno(), fcntl.LOCK_EX)
+    try:
+        yield file_obj
+    finally:
+        file_obj.flush()
+        fcntl.flock(file_obj.fileno(), fcntl.LOCK_UN)
 
 
 class BundledErrors(Exception):
@@ -507,6 +887,23 @@ class BundledErrors(Exception):
     """
 
 
+def _raise_process_errors(errors):
+    """Raise the errors collected from several processes, either
+    directly if they are all of the same type, or bundled together.
+
+    Parameters:
+        errors (list): list of tuples of process id and exception.
+
+    """
+    error_message = ""
+    for error in errors:
+        error_message += "Process {} raised error(s): {}. ".format(error[0], error[1])
+        if len({type(error[1]) for error in errors}) == 1:
+            raise errors[0][1]
+        raise type(errors[0][1])(error_message)
+    raise BundledErrors(error_message)
+
+
 def reset_job_folder(debug=False):
     """Remove all lock files and clean up jobs.txt
     ready for job restart.
@@ -541,26 +938,3 @@ def reset_job_folder(debug=False):
             flines = f.readlines()
 
     return len(res_list)
-
-
-def reset_single_seed(seed):
-    """Remove the file lock and jobs.txt entry
-    for a single seed.
-
-    Parameters:
-        seed (str): the seedname to remove.
-
-    """
-    if os.path.isfile("jobs.txt"):
-        with open("jobs.txt", "r+") as f:
-            flines = f.readlines()
-            f.seek(0)
-            for line in flines:
-                line = line.strip()
-                if seed in line:
-                    continue
-                f.write(line)
-            f.truncate()
-            flines = f.readlines()
-    if os.path.isfile(seed + ".lock"):
-        os.remove(seed + ".lock")
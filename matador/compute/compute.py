@@ -21,7 +21,17 @@ from psutil import virtual_memory
 from matador import __version__
 from matador.scrapers.castep_scrapers import cell2dict
 from matador.scrapers.castep_scrapers import res2dict, castep2dict
+from matador.scrapers.castep_scrapers import CastepOutputReader
 from matador.calculators import CastepCalculator
+from matador.compute.memcheck import (
+    MEMCHECK_CACHE_FNAME,
+    MemcheckCache,
+    MemcheckModel,
+    get_memcheck_features,
+)
+from matador.compute.staging import stage_files
+from matador.compute.supervisor import ProcessSupervisor
+from matador.compute.walltime import WalltimePredictor
 from matador.crystal import Crystal
 from matador.export import doc2cell, doc2param, doc2res
 from matador.utils.errors import (
@@ -79,6 +89,9 @@ class ComputeTask:
             custom_params (bool): use custom per-structure param file
                 (DEFAULT: False)
             output_queue (multiprocessing.Queue): write results to queue rather than file.
+            result_sink (DatabaseSink): push the results of completed calculations
+                to this sink, e.g. a :class:`matador.db.sink.DatabaseSink` that
+                inserts them into the database (DEFAULT: None).
             rough (int): number of small "rough" calculations (DEFAULT: 4)
             rough_iter (int): number of iterations per rough calculation
                 (DEFAULT: 2)
@@ -108,6 +121,15 @@ class ComputeTask:
                 usage, do not proceed if fails (DEFAULT: False)
             maxmem (int): maximum memory allowed in MB for memcheck
                 (DEFAULT: None)
+            memcheck_cache (bool): store memcheck results and run times in
+                `memcheck_cache.jsonl` in the root folder, reusing them for
+                identical calculations and skipping the dryrun when a model
+                fitted to the cache confidently predicts the memory usage
+                is within limits (DEFAULT: False)
+            conv_workers (int): number of convergence test singlepoints to run
+                concurrently, splitting the cores between them (DEFAULT: 1)
+            workflow_workers (int): number of independent workflow steps to run
+                concurrently, splitting the cores between them (DEFAULT: 1)
             killcheck (bool): check for file called $seed.kill during
                 operation, and kill executable if present (DEFAULT: True)
             compute_dir (str): folder to run computations in; default is
@@ -133,12 +155,14 @@ class ComputeTask:
             "mode": "castep",
             "executable": "castep",
             "memcheck": False,
+            "memcheck_cache": False,
             "rough": 4,
             "rough_iter": 2,
             "fine_iter": 20,
             "spin": None,
             "squeeze": False,
             "output_queue": None,
+            "result_sink": None,
             "redirect": None,
             "reopt": False,
             "compute_dir": None,
@@ -150,6 +174,8 @@ class ComputeTask:
             "kpts_1D": False,
             "conv_cutoff": False,
             "conv_kpt": False,
+            "conv_workers": 1,
+            "workflow_workers": 1,
             "slurm": False,
             "intel": False,
             "exec_test": True,
@@ -164,6 +190,7 @@ class ComputeTask:
 
         self.paths = None
         self.output_queue = None
+        self.result_sink = None
         self.final_result = None
         self.executable = None
 
@@ -177,6 +204,7 @@ class ComputeTask:
         self._num_retries = 0
         self._max_num_retries = 2
         self.maxmem = None
+        self._memcheck_features = None
         self.cell_dict = None
         self.param_dict = None
         self.res_dict = None
@@ -331,6 +359,7 @@ class ComputeTask:
 
         """
 
+        start_time = time.time()
         try:
             try:
                 # run through CASTEP specific features
@@ -352,16 +381,22 @@ class ComputeTask:
             LOG.error("Full traceback:\n{}".format(tb.format_exc()))
             for handler in LOG.handlers[:]:
                 handler.close()
+                LOG.removeHandler(handler)
             raise exc
 
         if self.success:
             LOG.info(
                 "ComputeTask finished successfully for {seed}".format(seed=self.seed)
             )
+            if self._memcheck_features is not None:
+                self._get_memcheck_cache().add(
+                    self._memcheck_features, time_secs=time.time() - start_time
+                )
         else:
             LOG.info("ComputeTask failed cleanly for {seed}".format(seed=self.seed))
         for handler in LOG.handlers[:]:
             handler.close()
+            LOG.removeHandler(handler)
 
     def run_castep(self):
         """Set up and run CASTEP calculation on the prepared structure,
@@ -465,6 +500,9 @@ class ComputeTask:
 
         try:
             # run convergence tests
+            workflow_kwargs = {"max_workers": self.workflow_workers}
+            workflow_kwargs.update(self.workflow_kwargs)
+
             if any([self.conv_cutoff_bool, self.conv_kpt_bool]):
                 success = self.run_convergence_tests(self.calc_doc)
 
@@ -483,28 +521,28 @@ class ComputeTask:
                 from matador.workflows.castep import castep_full_phonon
 
                 success = castep_full_phonon(
-                    self, self.calc_doc, self.seed, **self.workflow_kwargs
+                    self, self.calc_doc, self.seed, **workflow_kwargs
                 )
 
             elif self.calc_doc["task"].upper() in ["SPECTRAL"]:
                 from matador.workflows.castep import castep_full_spectral
 
                 success = castep_full_spectral(
-                    self, self.calc_doc, self.seed, **self.workflow_kwargs
+                    self, self.calc_doc, self.seed, **workflow_kwargs
                 )
 
             elif self.calc_doc["task"].upper() in ["MAGRES"]:
                 from matador.workflows.castep import castep_full_magres
 
                 success = castep_full_magres(
-                    self, self.calc_doc, self.seed, **self.workflow_kwargs
+                    self, self.calc_doc, self.seed, **workflow_kwargs
                 )
 
             elif self.calc_doc["task"].upper() in ["BULK_MODULUS"]:
                 from matador.workflows.castep import castep_elastic
 
                 success = castep_elastic(
-                    self, self.calc_doc, self.seed, **self.workflow_kwargs
+                    self, self.calc_doc, self.seed, **workflow_kwargs
                 )
 
             # run in singleshot mode, i.e. just call CASTEP on the seeds
@@ -639,6 +677,19 @@ class ComputeTask:
         self._setup_relaxation()
         seed = self.seed
         rerun = False
+        # only read the newly appended part of the CASTEP file after each block,
+        # and use its timings to predict whether the next block will finish
+        walltime_predictor = WalltimePredictor()
+        castep_reader = CastepOutputReader(
+            "{}.{}".format(seed, "castep"),
+            db=False,
+            verbosity=self.verbosity,
+            listeners=[walltime_predictor],
+        )
+        # learn the timings of any previous runs on this structure
+        if os.path.isfile(castep_reader.fname):
+            castep_reader.update()
+        opti_dict = None
         # iterate over geom iter blocks
         for ind, num_iter in enumerate(self._geom_max_iter_list):
 
@@ -652,6 +703,18 @@ class ComputeTask:
             # update the geom_max_iter to use with either the number in iter_list, or the overriden value
             self.calc_doc["geom_max_iter"] = num_iter
 
+            # stop cleanly now, rather than being killed part way through the next block
+            time_remaining = self._time_remaining()
+            if time_remaining is not None and not walltime_predictor.will_finish(
+                num_iter, time_remaining
+            ):
+                self._release_before_walltime(
+                    seed,
+                    opti_dict,
+                    walltime_predictor.predict_block_time(num_iter),
+                    time_remaining,
+                )
+
             # delete any existing files and write new ones
             if self.squeeze:
                 squeeze = int(self._squeeze_list[ind]) * float(self.squeeze)
@@ -665,6 +728,7 @@ class ComputeTask:
                 raise CriticalError(msg)
 
             # run CASTEP
+            block_start = time.time()
             _process = self.run_command(seed)
 
             # will throw errors if the process fails
@@ -673,15 +737,15 @@ class ComputeTask:
             self._handle_process(
                 _process, expected_fname=output_filename, check_walltime=True
             )
+            block_time = time.time() - block_start
 
             # check for errors and try to correct for them
             errors_present, errors, remedy = self._catch_castep_errors(_process)
             skip_postprocess = remedy is not None
 
             # try to read the CASTEP file
-            opti_dict, success = castep2dict(
-                output_filename, db=False, verbosity=self.verbosity
-            )
+            opti_dict, success = castep_reader.update()
+            walltime_predictor.end_block(block_time)
 
             if errors_present:
                 msg = "Failed to optimise {} as CASTEP crashed with error:".format(seed)
@@ -918,7 +982,10 @@ class ComputeTask:
             )
             doc2res(results_dict, seed, hash_dupe=False, overwrite=True)
             self.mv_to_completed(
-                seed, keep=keep, completed_dir=self.paths["completed_dir"]
+                seed,
+                keep=keep,
+                completed_dir=self.paths["completed_dir"],
+                doc=results_dict,
             )
             self.tidy_up(seed)
 
@@ -996,33 +1063,157 @@ class ComputeTask:
         LOG.info("Performing convergence tests...")
         from matador.utils.cell_utils import get_best_mp_offset_for_cell
 
-        successes = []
+        jobs = []
         cached_cutoff = calc_doc["cut_off_energy"]
         if self.conv_cutoff_bool:
             # run series of singlepoints for various cutoffs
             LOG.info("Running cutoff convergence...")
             for cutoff in self.conv_cutoff:
-                LOG.info("{} eV... ".format(cutoff))
                 calc_doc.update({"cut_off_energy": cutoff})
-                self.paths["completed_dir"] = "completed_cutoff"
                 seed = self.seed + "_" + str(cutoff) + "eV"
-                success = self.run_castep_singleshot(calc_doc, seed, keep=False)
-                successes.append(success)
+                jobs.append(
+                    (
+                        "{} eV... ".format(cutoff),
+                        deepcopy(calc_doc),
+                        seed,
+                        "completed_cutoff",
+                    )
+                )
         if self.conv_kpt_bool:
             # run series of singlepoints for various cutoffs
             LOG.info("Running kpt convergence tests...")
             calc_doc["cut_off_energy"] = cached_cutoff
             for kpt in self.conv_kpt:
-                LOG.info("{} 1/A... ".format(kpt))
                 calc_doc.update({"kpoints_mp_spacing": kpt})
                 calc_doc["kpoints_mp_offset"] = get_best_mp_offset_for_cell(calc_doc)
-                LOG.debug("Using offset {}".format(calc_doc["kpoints_mp_offset"]))
-                self.paths["completed_dir"] = "completed_kpts"
                 seed = self.seed + "_" + str(kpt) + "A"
-                success = self.run_castep_singleshot(calc_doc, seed, keep=False)
-                successes.append(success)
+                jobs.append(
+                    (
+                        "{} 1/A... ".format(kpt),
+                        deepcopy(calc_doc),
+                        seed,
+                        "completed_kpts",
+                    )
+                )
+
+        if self.conv_workers > 1 and len(jobs) > 1:
+            return any(self._run_concurrent_singleshots(jobs))
+
+        successes = []
+        for message, job_doc, seed, completed_dir in jobs:
+            LOG.info(message)
+            LOG.debug("Using offset {}".format(job_doc.get("kpoints_mp_offset")))
+            self.paths["completed_dir"] = completed_dir
+            success = self.run_castep_singleshot(job_doc, seed, keep=False)
+            successes.append(success)
         return any(successes)
 
+    def _run_concurrent_singleshots(self, jobs):
+        """Run independent singleshot calculations concurrently, splitting
+        the available cores between `self.conv_workers` processes. Each
+        calculation runs in its own subdirectory of the compute directory
+        (or root folder), and its results are moved to its completed folder
+        as usual.
+
+        Parameters:
+            jobs (:obj:`list` of :obj:`tuple`): the calculations to run, as
+                (log message, calc_doc, seed, completed folder) tuples.
+
+        Raises:
+            Exception: the first error raised by any of the calculations,
+                in the order they were provided, once all have finished.
+
+        Returns:
+            :obj:`list` of :obj:`bool`: the success of each calculation.
+
+        """
+        import multiprocessing as mp
+        from matador.compute.scheduler import schedule_jobs
+
+        num_workers = min(self.conv_workers, len(jobs))
+        ncores = max((self.ncores or num_workers) // num_workers, 1)
+        LOG.info(
+            "Running {} calculations on {} concurrent workers with {} cores each.".format(
+                len(jobs), num_workers, ncores
+            )
+        )
+        results = len(jobs) * [None]
+
+        def launch(job):
+            message, calc_doc, seed, completed_dir = jobs[job["index"]]
+            LOG.info(message)
+            compute_dir = os.path.join(self.compute_dir or ".", "conv_" + seed)
+            receiver, sender = mp.Pipe(duplex=False)
+            process = mp.Process(
+                target=self._run_singleshot_in_subdir,
+                args=(calc_doc, seed, completed_dir, ncores, compute_dir, sender),
+            )
+            process.start()
+            sender.close()
+            job["receiver"] = receiver
+            return process
+
+        def on_finish(job, process):
+            receiver = job.pop("receiver")
+            if receiver.poll():
+                results[job["index"]] = receiver.recv()
+            else:
+                results[job["index"]] = (
+                    False,
+                    CalculationError(
+                        "Calculation on {} exited with code {}".format(
+                            jobs[job["index"]][2], process.exitcode
+                        )
+                    ),
+                )
+            receiver.close()
+
+        schedule_jobs(
+            [{"index": ind, "ncores": ncores, "mem": 0} for ind in range(len(jobs))],
+            launch,
+            ncores * num_workers,
+            0,
+            on_finish=on_finish,
+        )
+
+        for _, error in results:
+            if error is not None:
+                raise error
+
+        return [success for success, _ in results]
+
+    def _run_singleshot_in_subdir(
+        self, calc_doc, seed, completed_dir, ncores, compute_dir, connection
+    ):
+        """Run a singleshot calculation in its own compute directory,
+        sending its success and any error raised through the connection.
+        This is the target of the processes spawned by
+        `_run_concurrent_singleshots`.
+
+        """
+        self.ncores = ncores
+        self.compute_dir = compute_dir
+        self.paths["completed_dir"] = completed_dir
+        error = None
+        try:
+            success = self.run_castep_singleshot(calc_doc, seed, keep=False)
+        except Exception as exc:
+            success = False
+            error = exc
+        finally:
+            # remove the copy of the input structure, then the directory itself
+            res_fname = os.path.join(compute_dir, self.seed + ".res")
+            if os.path.isfile(res_fname):
+                os.remove(res_fname)
+            self.remove_compute_dir_if_finished(compute_dir)
+
+        try:
+            connection.send((success, error))
+        except Exception:
+            # the error may not be picklable
+            connection.send((success, CalculationError(str(error))))
+        connection.close()
+
     def parse_executable(self, seed):
         """Turn executable string into list with arguments to be executed.
 
@@ -1234,19 +1425,84 @@ class ComputeTask:
         LOG.info("Using {version} MPI library.".format(version=mpi_version))
         return mpi_version
 
+    def estimate_memory(self):
+        """Estimate the memory required to run this calculation with
+        a CASTEP dryrun, without running the calculation itself.
+
+        Returns:
+            float: the memory estimate in MB.
+
+        """
+        calc_doc = deepcopy(self.res_dict)
+        structure_keys = [
+            "atom_types",
+            "positions_frac",
+            "positions_abs",
+            "lattice_cart",
+            "lattice_abc",
+        ]
+        calc_doc.update(
+            {
+                key: val
+                for key, val in self.cell_dict.items()
+                if key not in structure_keys
+            }
+        )
+        calc_doc.update(self.param_dict)
+        return self.do_memcheck(calc_doc, self.seed)
+
     def do_memcheck(self, calc_doc, seed):
-        """Perform a CASTEP dryrun to estimate memory usage.
+        """Perform a CASTEP dryrun to estimate memory usage. If
+        `self.memcheck_cache` is set, cached estimates for identical
+        calculations are reused, and the dryrun is skipped if a model
+        fitted to the cache predicts that the memory usage is comfortably
+        below `self.maxmem`.
 
         Parameters:
             calc_doc (dict): dictionary of structure and CASTEP parameters
             seed (str): filename for structure
 
         Returns:
-            bool: True if the memory estimate is <90% of node RAM or
-                `self.maxmem`, if set
+            float: the memory estimate in MB (or the upper bound of the
+                predicted memory usage, if the dryrun was skipped).
 
         """
         LOG.info("Performing memory check for {seed}".format(seed=seed))
+
+        cache = None
+        if self.memcheck_cache:
+            cache = self._get_memcheck_cache()
+            features = get_memcheck_features(
+                calc_doc, self.param_dict, ncores=self.ncores, nnodes=self.nnodes
+            )
+            self._memcheck_features = features
+            cached = cache.lookup(features)
+            if cached is not None and cached["mem_MB"] is not None:
+                LOG.info("Using cached memory estimate for {}.".format(seed))
+                return cached["mem_MB"]
+
+            entries = cache.entries
+            time_prediction = MemcheckModel(entries, target="time_secs").predict(
+                features
+            )
+            if time_prediction is not None:
+                LOG.info(
+                    "Predicted run time: {:.0f} s (upper bound {:.0f} s)".format(
+                        *time_prediction
+                    )
+                )
+            prediction = MemcheckModel(entries).predict(features)
+            if (
+                prediction is not None
+                and self.maxmem is not None
+                and prediction[1] < 0.9 * self.maxmem
+            ):
+                LOG.info(
+                    "Skipping dryrun, predicted memory usage {:.0f} MB "
+                    "(upper bound {:.0f} MB) is within limits.".format(*prediction)
+                )
+                return prediction[1]
+
         memcheck_seed = seed + "_memcheck"
 
         memcheck_doc = deepcopy(calc_doc)
@@ -1283,8 +1539,15 @@ class ComputeTask:
         if self.nnodes is not None:
             estimate *= self.nnodes
 
+        if cache is not None:
+            cache.add(features, mem_MB=estimate)
+
         return estimate
 
+    def _get_memcheck_cache(self):
+        """Return the memcheck cache in the root folder."""
+        return MemcheckCache(os.path.join(self.root_folder, MEMCHECK_CACHE_FNAME))
+
     def run_command(self, seed):
         """Calls executable on seed with desired number of cores.
 
@@ -1381,8 +1644,9 @@ class ComputeTask:
         return process
 
     def _handle_process(self, process, check_walltime=False, expected_fname=None):
-        """Poll, wait, communicate with running process, with optional
-        checks on walltime and file creation.
+        """Wait for and communicate with running process, with optional
+        checks on walltime and file creation, waking up only when the process
+        exits, reaches its deadline or the file check is due.
 
         Parameters:
             process (subprocess.Popen): process object to handle.
@@ -1433,55 +1697,67 @@ class ComputeTask:
                 LOG.critical(msg)
                 raise CalculationError(msg)
 
-        if expected_fname is not None:
-            LOG.info(
-                "Watching for file write to {} after {} s".format(
-                    expected_fname, self.polltime
-                )
-            )
-            while process.poll() is None:
-                proc_elapsed = time.time() - proc_clock
-                if proc_elapsed > self.polltime:
-                    _check_file_has_been_written(expected_fname, proc_clock)
-                    break
-                time.sleep(1)
-
-        timeout = None
+        deadline = None
         if check_walltime and self.max_walltime is not None:
             LOG.info(
                 "Will not let process walltime exceed {} seconds".format(
                     self.max_walltime
                 )
             )
-            proc_elapsed = time.time() - proc_clock
-            timeout = max(self.max_walltime - 2 * self.polltime - proc_elapsed, 1)
+            deadline = proc_clock + max(self.max_walltime - 2 * self.polltime, 1)
 
-        try:
-            out, errs = process.communicate(timeout=timeout)
-
-            out = out.decode("utf-8")
-            errs = errs.decode("utf-8")
-            if process.returncode != 0 or errs:
-                # as there are several reasons why the process can return != 0, handle
-                # them in turn for each case, rather than raising an error here
-                LOG.warning("Process returned error code {}".format(process.returncode))
-                LOG.warning("\nstdout: {}".format(out))
-                LOG.warning("\nstderr: {}".format(errs))
-
-        except sp.TimeoutExpired:
-            LOG.error("Process reached maximum walltime, cleaning up...")
-            self._times_up(process)
-            process.terminate()
-            raise WalltimeError("Cleaned up process after reaching maximum walltime")
+        with ProcessSupervisor() as supervisor:
+            supervisor.register(process, deadline=deadline)
+            events = []
+            if expected_fname is not None:
+                LOG.info(
+                    "Watching for file write to {} after {} s".format(
+                        expected_fname, self.polltime
+                    )
+                )
+                # wake up as soon as the process exits, or after polltime to check the file
+                events = supervisor.wait(timeout=self.polltime)
+                if not events:
+                    try:
+                        _check_file_has_been_written(expected_fname, proc_clock)
+                    except CalculationError as exc:
+                        process.terminate()
+                        raise exc
 
-        except Exception as err:
-            LOG.error(
-                "Unexpected Exception {} caught: terminating job for {}.".format(
-                    type(err).__name__, self.seed
+            try:
+                while not events:
+                    events = supervisor.wait()
+                if any(event == "deadline" for _, event in events):
+                    raise sp.TimeoutExpired(process.args, deadline - proc_clock)
+
+                out, errs = supervisor.output(process)
+                out = out.decode("utf-8")
+                errs = errs.decode("utf-8")
+                if process.returncode != 0 or errs:
+                    # as there are several reasons why the process can return != 0, handle
+                    # them in turn for each case, rather than raising an error here
+                    LOG.warning(
+                        "Process returned error code {}".format(process.returncode)
+                    )
+                    LOG.warning("\nstdout: {}".format(out))
+                    LOG.warning("\nstderr: {}".format(errs))
+
+            except sp.TimeoutExpired:
+                LOG.error("Process reached maximum walltime, cleaning up...")
+                self._times_up(process)
+                process.terminate()
+                raise WalltimeError(
+                    "Cleaned up process after reaching maximum walltime"
                 )
-            )
-            process.terminate()
-            raise err
+
+            except Exception as err:
+                LOG.error(
+                    "Unexpected Exception {} caught: terminating job for {}.".format(
+                        type(err).__name__, self.seed
+                    )
+                )
+                process.terminate()
+                raise err
 
         return out, errs
 
@@ -1597,7 +1873,7 @@ class ComputeTask:
             LOG.warning("Error moving files to bad: {error}".format(error=exc))
 
     def mv_to_completed(
-        self, seed, completed_dir="completed", keep=False, skip_existing=False
+        self, seed, completed_dir="completed", keep=False, skip_existing=False, doc=None
     ):
         """Move all associated files to completed, removing any
         remaining files in the root_folder and compute_dir.
@@ -1610,6 +1886,9 @@ class ComputeTask:
             keep (bool): whether to also move intermediate files.
             skip_existing (bool): if True, skip files that already exist,
                 otherwise throw an error.
+            doc (dict): the scraped results of the calculation, which will be
+                pushed to the result sink, if present, with the moved files
+                as its source.
 
         """
         completed_dir = self.root_folder + "/" + completed_dir
@@ -1623,6 +1902,7 @@ class ComputeTask:
         if not os.path.exists(completed_dir):
             os.makedirs(completed_dir, exist_ok=True)
 
+        moved_files = []
         for _file in glob.glob(seed + "*_bak") + glob.glob(seed + "*.lock"):
             os.remove(_file)
         if keep:
@@ -1634,6 +1914,7 @@ class ComputeTask:
                         LOG.warning("File already found {}...".format(_file))
                     else:
                         shutil.move(_file, completed_dir)
+                        moved_files.append(_file)
         else:
             # move castep/param/res/out_cell files to completed
             file_exts = [".castep"]
@@ -1648,6 +1929,7 @@ class ComputeTask:
             for ext in file_exts:
                 try:
                     shutil.move("{}{}".format(seed, ext), completed_dir)
+                    moved_files.append("{}{}".format(seed, ext))
                 except Exception as exc:
                     LOG.warning(
                         "Error moving files to completed: {error}".format(error=exc)
@@ -1659,6 +1941,28 @@ class ComputeTask:
         for fname in wildcard_fnames:
             os.remove(fname)
 
+        if doc is not None and self.result_sink is not None:
+            self._push_to_result_sink(doc, completed_dir, moved_files)
+
+    def _push_to_result_sink(self, doc, completed_dir, moved_files):
+        """Push the results of a completed calculation, combined with
+        its input parameters, to the result sink.
+
+        Parameters:
+            doc (dict): the scraped results of the calculation.
+            completed_dir (str): the folder the files were moved to.
+            moved_files (list): the names of the files that were moved.
+
+        """
+        result = deepcopy(self.calc_doc) if self.calc_doc is not None else {}
+        result.update(doc)
+        result["source"] = [
+            "{}/{}".format(completed_dir, os.path.basename(fname))
+            for fname in moved_files
+        ]
+        LOG.info("Pushing results of {} to result sink".format(self.seed))
+        self.result_sink.push(result)
+
     def cp_to_input(self, seed, ext="res", glob_files=False):
         """Copy initial cell and res to input folder.
 
@@ -1911,7 +2215,9 @@ class ComputeTask:
         if success:
             if not intermediate:
                 self.mv_to_completed(
-                    self.seed, completed_dir=self.paths["completed_dir"]
+                    self.seed,
+                    completed_dir=self.paths["completed_dir"],
+                    doc=self.res_dict,
                 )
         else:
             self.mv_to_bad(self.seed)
@@ -1925,6 +2231,42 @@ class ComputeTask:
 
         return success
 
+    def _time_remaining(self):
+        """Return the walltime remaining in seconds, less the time
+        allowed for cleaning up, or None if there is no walltime limit.
+
+        """
+        if self.max_walltime is None or self.start_time is None:
+            return None
+        return self.max_walltime - (time.time() - self.start_time) - 2 * self.polltime
+
+    def _release_before_walltime(self, seed, opti_dict, predicted_time, time_remaining):
+        """Save the results of the last completed block of a relaxation
+        and release the structure, so that it can be continued by another job,
+        when the next block is not predicted to finish within the walltime.
+
+        Parameters:
+            seed (str): the seed of the relaxation.
+            opti_dict (dict): the results of the last block, if any.
+            predicted_time (float): the predicted time of the next block in seconds.
+            time_remaining (float): the walltime remaining in seconds.
+
+        Raises:
+            WalltimeError: always, to stop any further calculations in this job.
+
+        """
+        msg = (
+            "Next block of {} predicted to take {:.0f} s, but only {:.0f} s "
+            "of walltime remain: stopping early.".format(
+                seed, predicted_time, time_remaining
+            )
+        )
+        LOG.warning(msg)
+        if isinstance(opti_dict, dict) and "positions_frac" in opti_dict:
+            self._update_castep_output_files(seed, opti_dict)
+        self._times_up(None)
+        raise WalltimeError(msg)
+
     def _times_up(self, process):
         """If walltime has nearly expired, run this function
         to kill the process and unlock it for restarted calculations.
@@ -1935,8 +2277,10 @@ class ComputeTask:
         """
         if self.compute_dir is not None:
             LOG.info("Cleaning up compute_dir: {dir}".format(dir=self.compute_dir))
-            for f in glob.glob("{}.*".format(self.seed)):
-                shutil.copy2(f, self.root_folder)
+            # the originals are removed, so the files can safely be hardlinked
+            fnames = glob.glob("{}.*".format(self.seed))
+            stage_files(fnames, self.root_folder, link=True)
+            for f in fnames:
                 os.remove(f)
         LOG.info("Removing lock file so calculation can be continued.")
         if os.path.isfile("{}/{}{}".format(self.root_folder, self.seed, ".res.lock")):
@@ -2028,28 +2372,31 @@ class ComputeTask:
             if not os.path.exists(link_name):
                 os.symlink(compute_dir, link_name)
 
+        # only copy files that have changed since they were last staged
+        to_copy = []
         if generic:
             # if generic, copy all seed files to compute dir
-            for f in glob.glob(seed + "*"):
-                shutil.copy2(f, compute_dir)
-
-        # copy pspots and any intermediate calcs to compute_dir
-        LOG.info("Copying pspots into compute_dir")
-        if self.cell_dict is not None:
-            for pspot in self.cell_dict.get("species_pot", {}).values():
-                if os.path.isfile(pspot):
-                    try:
-                        shutil.copy2(pspot, compute_dir)
-                    except shutil.SameFileError:
-                        pass
+            to_copy.extend(glob.glob(seed + "*"))
 
         if custom_params:
-            shutil.copy2(seed + ".param", compute_dir)
+            to_copy.append(seed + ".param")
 
         # if a checkfile exists, copy it to the new dir
         # so that it can be restarted from
         if os.path.isfile(seed + ".check"):
-            shutil.copy2(seed + ".check", compute_dir)
+            to_copy.append(seed + ".check")
+
+        stage_files(to_copy, compute_dir)
+
+        # pspots are never modified, so can be hardlinked into compute_dir
+        LOG.info("Staging pspots into compute_dir")
+        if self.cell_dict is not None:
+            pspots = [
+                pspot
+                for pspot in set(self.cell_dict.get("species_pot", {}).values())
+                if os.path.isfile(pspot)
+            ]
+            stage_files(pspots, compute_dir, link=True)
 
     def scf(self, *args, **kwargs):
         """Alias for backwards-compatibility."""
@@ -0,0 +1,269 @@
+# coding: utf-8
+# Distributed under the terms of the MIT License.
+
+""" This file implements a persistent cache of CASTEP memory check
+(dryrun) results, and a simple regression model fitted to the cached
+results that can predict the memory (and run time) of unseen structures,
+allowing dryruns to be skipped for structures similar to those already seen.
+
+"""
+
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from matador.utils.cell_utils import abc2cart, calc_mp_grid, cart2volume
+
+MEMCHECK_CACHE_FNAME = "memcheck_cache.jsonl"
+
+# features that must match exactly for a cached result to be reused
+_KEY_FEATURES = (
+    "species",
+    "num_atoms",
+    "cut_off_energy",
+    "num_kpoints",
+    "param_hash",
+    "ncores",
+    "nnodes",
+)
+# features that must match exactly for cached results to be used in the same fit
+_GROUP_FEATURES = ("param_hash", "ncores", "nnodes")
+# features used (logarithmically) in the regression
+_FIT_FEATURES = ("num_atoms", "volume", "num_kpoints", "cut_off_energy")
+
+
+def get_memcheck_features(calc_doc, param_dict, ncores=None, nnodes=None):
+    """Return the features of a calculation that determine its
+    memory usage and run time.
+
+    Parameters:
+        calc_doc (dict): the structure and calculation parameters.
+        param_dict (dict): the CASTEP parameters, used to compute
+            the parameter hash.
+
+    Keyword arguments:
+        ncores (int): number of cores per node the calculation is run on.
+        nnodes (int): number of nodes the calculation is run on.
+
+    Returns:
+        dict: the features, under the keys `species`, `num_atoms`, `cut_off_energy`,
+            `num_kpoints`, `param_hash`, `ncores`, `nnodes` and `volume`.
+
+    """
+    if "lattice_cart" in calc_doc:
+        lattice_cart = calc_doc["lattice_cart"]
+    else:
+        lattice_cart = abc2cart(calc_doc["lattice_abc"])
+
+    if calc_doc.get("kpoints_mp_grid") is not None:
+        num_kpoints = int(np.prod(calc_doc["kpoints_mp_grid"]))
+    elif calc_doc.get("kpoints_mp_spacing") is not None:
+        num_kpoints = int(
+            np.prod(calc_mp_grid(lattice_cart, calc_doc["kpoints_mp_spacing"]))
+        )
+    else:
+        num_kpoints = 1
+
+    params = {key: param_dict[key] for key in param_dict if key != "source"}
+    param_hash = hashlib.sha1(
+        json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+    return {
+        "species": sorted(set(calc_doc["atom_types"])),
+        "num_atoms": len(calc_doc["atom_types"]),
+        "cut_off_energy": float(calc_doc.get("cut_off_energy", 0)),
+        "num_kpoints": num_kpoints,
+        "param_hash": param_hash,
+        "ncores": ncores,
+        "nnodes": nnodes,
+        "volume": float(cart2volume(lattice_cart)),
+    }
+
+
+class MemcheckCache:
+    """Persistent cache of memory estimates (and run times) stored as
+    JSON lines, such that several processes, possibly on different nodes,
+    can safely append to the same cache file.
+
+    """
+
+    def __init__(self, fname=MEMCHECK_CACHE_FNAME):
+        """Read the cache file, if it exists.
+
+        Keyword arguments:
+            fname (str): the cache filename.
+
+        """
+        self.fname = fname
+        self._entries = {}
+        self._stat = None
+        self._load()
+
+    @property
+    def entries(self):
+        """List of all cached entries, each containing the features
+        under `features` and the measured values `mem_MB` and `time_secs`.
+
+        """
+        self._load()
+        return list(self._entries.values())
+
+    def lookup(self, features):
+        """Return the cached entry for a calculation with these features.
+
+        Parameters:
+            features (dict): the features from :func:`get_memcheck_features`.
+
+        Returns:
+            dict: the cached entry, or None if not found.
+
+        """
+        self._load()
+        return self._entries.get(self._key(features))
+
+    def add(self, features, mem_MB=None, time_secs=None):
+        """Append a result to the cache, combining it with any
+        existing entry for the same features.
+
+        Parameters:
+            features (dict): the features from :func:`get_memcheck_features`.
+
+        Keyword arguments:
+            mem_MB (float): the estimated memory usage in MB.
+            time_secs (float): the measured run time in seconds.
+
+        """
+        record = {"features": features, "mem_MB": mem_MB, "time_secs": time_secs}
+        # appending a single line is atomic w.r.t. other appending processes
+        with open(self.fname, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        self._merge(record)
+
+    def _load(self):
+        """(Re-)read the cache file if it has changed since it was last read."""
+        if not os.path.isfile(self.fname):
+            return
+        stat = os.stat(self.fname)
+        if self._stat == (stat.st_size, stat.st_mtime_ns):
+            return
+        self._stat = (stat.st_size, stat.st_mtime_ns)
+        self._entries = {}
+        with open(self.fname, "r") as f:
+            for line in f:
+                try:
+                    self._merge(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    # skip any lines that were corrupted or only partially written
+                    continue
+
+    def _merge(self, record):
+        key = self._key(record["features"])
+        entry = self._entries.setdefault(
+            key, {"features": record["features"], "mem_MB": None, "time_secs": None}
+        )
+        for value in ("mem_MB", "time_secs"):
+            if record.get(value) is not None:
+                entry[value] = record[value]
+
+    @staticmethod
+    def _key(features):
+        return json.dumps([features[key] for key in _KEY_FEATURES])
+
+
+class MemcheckModel:
+    """Log-linear least-squares model of memory usage (or run time)
+    against the number of atoms, cell volume, number of k-points and
+    cutoff, fitted separately for each set of parameters (same parameter
+    hash and number of cores and nodes).
+
+    Predictions are only made for structures that lie within the range of
+    the fitted data, and come with an upper bound given by `num_sigma`
+    standard deviations of the fit residuals.
+
+    """
+
+    def __init__(self, entries, target="mem_MB", min_samples=10, num_sigma=3):
+        """Initialise the model with the cached entries; groups are
+        fitted as required.
+
+        Parameters:
+            entries (list of dict): the entries from :attr:`MemcheckCache.entries`.
+
+        Keyword arguments:
+            target (str): the quantity to predict, either `mem_MB` or `time_secs`.
+            min_samples (int): the minimum number of entries needed to make a
+                prediction for a given set of parameters.
+            num_sigma (float): the number of standard deviations of the residuals
+                to add to the upper bound of predictions.
+
+        """
+        self.target = target
+        self.min_samples = min_samples
+        self.num_sigma = num_sigma
+        self._groups = {}
+        for entry in entries:
+            if entry.get(target) is None or entry[target] <= 0:
+                continue
+            self._groups.setdefault(self._group_key(entry["features"]), []).append(
+                entry
+            )
+        self._fits = {}
+
+    def predict(self, features):
+        """Predict the target quantity for the given features.
+
+        Parameters:
+            features (dict): the features from :func:`get_memcheck_features`.
+
+        Returns:
+            (float, float): the predicted value and its upper bound, or None
+                if there is insufficient data to make a confident prediction.
+
+        """
+        key = self._group_key(features)
+        if key not in self._fits:
+            self._fits[key] = self._fit(self._groups.get(key, []))
+        fit = self._fits[key]
+        if fit is None:
+            return None
+
+        coeffs, sigma, lower, upper = fit
+        x = self._design_row(features)
+        if np.any(x < lower - 1e-8) or np.any(x > upper + 1e-8):
+            return None
+
+        log_prediction = x @ coeffs
+        return float(np.exp(log_prediction)), float(
+            np.exp(log_prediction + self.num_sigma * sigma)
+        )
+
+    def _fit(self, entries):
+        """Fit the model to the entries, returning the coefficients, the
+        residual standard deviation and the range of the design matrix.
+
+        """
+        if len(entries) < self.min_samples:
+            return None
+        design = np.array([self._design_row(entry["features"]) for entry in entries])
+        target = np.log([entry[self.target] for entry in entries])
+        coeffs, _, rank, _ = np.linalg.lstsq(design, target, rcond=None)
+        dof = len(entries) - rank
+        if dof <= 0:
+            return None
+        residuals = target - design @ coeffs
+        sigma = np.sqrt(np.sum(residuals**2) / dof)
+        return coeffs, sigma, np.min(design, axis=0), np.max(design, axis=0)
+
+    @staticmethod
+    def _design_row(features):
+        return np.array(
+            [1.0] + [np.log(max(float(features[key]), 1e-8)) for key in _FIT_FEATURES]
+        )
+
+    @staticmethod
+    def _group_key(features):
+        return json.dumps([features[key] for key in _GROUP_FEATURES])
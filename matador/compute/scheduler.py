@@ -0,0 +1,155 @@
+# coding: utf-8
+# Distributed under the terms of the MIT License.
+
+""" This file implements a simple memory-aware scheduler that packs
+jobs of different sizes onto the cores and memory of a single node,
+starting new jobs as soon as running ones finish.
+
+"""
+
+
+import math
+from multiprocessing.connection import wait
+
+
+def job_ncores(mem, max_mem, total_cores, max_ncores=None):
+    """Choose the number of cores to run a job on from its memory estimate,
+    giving it the same share of the node's cores as of its memory, such that
+    jobs of different sizes fill the cores and memory of the node together.
+
+    Parameters:
+        mem (float): the memory estimate of the job in MB.
+        max_mem (float): the memory available on the node in MB.
+        total_cores (int): the number of cores available on the node.
+
+    Keyword arguments:
+        max_ncores (int): the most cores to run any one job on.
+
+    Returns:
+        int: the number of cores, between 1 and the smaller of `max_ncores`
+            and `total_cores`.
+
+    """
+    if max_ncores is None:
+        max_ncores = total_cores
+    max_ncores = max(min(max_ncores, total_cores), 1)
+    if max_mem <= 0:
+        return max_ncores
+    return max(min(int(math.ceil(total_cores * mem / max_mem)), max_ncores), 1)
+
+
+def pack_jobs(jobs, free_cores, free_mem):
+    """Choose which of the pending jobs to start on the currently free
+    resources, such that neither the number of cores nor the memory limit
+    is exceeded. Jobs are considered largest first (first-fit decreasing
+    by memory, then cores), with ties broken by their order in `jobs`.
+
+    Parameters:
+        jobs (:obj:`list` of :obj:`dict`): pending jobs, each containing at least
+            the keys `ncores` and `mem` (the memory estimate in MB).
+        free_cores (int): the number of idle cores.
+        free_mem (float): the unallocated memory in MB.
+
+    Returns:
+        :obj:`list` of :obj:`int`: indices into `jobs` of the jobs to start,
+            in ascending order.
+
+    """
+    chosen = []
+    order = sorted(
+        range(len(jobs)),
+        key=lambda ind: (-jobs[ind]["mem"], -jobs[ind]["ncores"], ind),
+    )
+    for ind in order:
+        if free_cores <= 0:
+            break
+        if jobs[ind]["ncores"] <= free_cores and jobs[ind]["mem"] <= free_mem:
+            chosen.append(ind)
+            free_cores -= jobs[ind]["ncores"]
+            free_mem -= jobs[ind]["mem"]
+
+    return sorted(chosen)
+
+
+def schedule_jobs(jobs, launch, total_cores, max_mem, on_finish=None):
+    """Run all the jobs that fit on the node, keeping as many running
+    at once as the cores and memory allow, and packing new jobs into the
+    resources freed whenever a running job finishes.
+
+    New jobs are only taken from `jobs` while those already waiting cannot
+    fill the free cores and memory, so that a generator can claim jobs
+    (and estimate their size) lazily, only as the node has room for them.
+
+    Parameters:
+        jobs (iterable of :obj:`dict`): jobs to run, each containing at least
+            the keys `ncores` and `mem` (the memory estimate in MB).
+        launch (callable): function that starts a job, called as `launch(job)`,
+            that returns an object with a `sentinel` attribute that becomes ready
+            when the job finishes, e.g. a started `multiprocessing.Process`.
+        total_cores (int): the number of cores available on the node.
+        max_mem (float): the memory available on the node in MB.
+
+    Keyword arguments:
+        on_finish (callable): optional function called as `on_finish(job, handle)`
+            after each job finishes, where `handle` is the output of `launch`.
+            If it returns False, no further jobs will be taken or started, but
+            those already running will be waited for.
+
+    Returns:
+        (:obj:`list` of :obj:`dict`, :obj:`list` of :obj:`dict`): the jobs that
+            were run, in order of completion, and the jobs that could never fit
+            on the node.
+
+    """
+    jobs = iter(jobs)
+    exhausted = False
+    pending = []
+    oversized = []
+    free_cores = total_cores
+    free_mem = max_mem
+    running = {}
+    finished = []
+
+    while True:
+        if not running:
+            # avoid accumulating rounding errors in the free memory
+            free_cores, free_mem = total_cores, max_mem
+
+        # only take new jobs while the waiting jobs cannot fill the free resources
+        while not exhausted and (
+            sum(job["ncores"] for job in pending) < free_cores
+            and sum(job["mem"] for job in pending) <= free_mem
+        ):
+            job = next(jobs, None)
+            if job is None:
+                exhausted = True
+            elif job["ncores"] <= total_cores and job["mem"] <= max_mem:
+                pending.append(job)
+            else:
+                oversized.append(job)
+
+        if not pending and not running:
+            break
+
+        chosen = set(pack_jobs(pending, free_cores, free_mem))
+        for ind in sorted(chosen):
+            job = pending[ind]
+            handle = launch(job)
+            running[handle.sentinel] = (job, handle)
+            free_cores -= job["ncores"]
+            free_mem -= job["mem"]
+        pending = [job for ind, job in enumerate(pending) if ind not in chosen]
+
+        # block until at least one of the running jobs has finished
+        for sentinel in wait(list(running)):
+            job, handle = running.pop(sentinel)
+            if hasattr(handle, "join"):
+                handle.join()
+            free_cores += job["ncores"]
+            free_mem += job["mem"]
+            finished.append(job)
+            if on_finish is not None and on_finish(job, handle) is False:
+                pending = []
+                exhausted = True
+
+    return finished, oversized
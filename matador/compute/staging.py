@@ -0,0 +1,162 @@
+# coding: utf-8
+# Distributed under the terms of the MIT License.
+
+""" This file implements the staging of files in and out of compute
+directories, linking files where possible and otherwise only copying
+those that have changed.
+
+"""
+
+
+import os
+import shutil
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+LOG = logging.getLogger("run3")
+
+# ioctl request to clone a file's extents on copy-on-write filesystems (FICLONE)
+_FICLONE = 0x40049409
+_CHUNK_SIZE = 1024**2
+
+
+def stage_file(src, dst, link=False):
+    """Make `dst` a copy of `src` as cheaply as possible.
+
+    If `link` is True and the files are on the same filesystem, `dst`
+    is hardlinked to `src`, so this should only be used for files that will
+    not be modified in place, e.g. pseudopotentials, or that are about to
+    be deleted. Otherwise, the file is skipped if `dst` already has the
+    same size and either the same modification time or the same checksum,
+    then a copy-on-write clone (reflink) is attempted, and finally it is
+    copied with its metadata.
+
+    Parameters:
+        src (str): the file to stage.
+        dst (str): the target filename or directory.
+
+    Keyword arguments:
+        link (bool): whether to allow hardlinks.
+
+    Returns:
+        str: the action taken, one of "linked", "reflinked", "skipped" or "copied".
+
+    """
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+
+    src_stat = os.stat(src)
+    try:
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        dst_stat = None
+
+    if dst_stat is not None and os.path.samestat(src_stat, dst_stat):
+        return "skipped"
+
+    same_device = src_stat.st_dev == os.stat(os.path.dirname(dst) or ".").st_dev
+
+    if link and same_device and _hardlink(src, dst):
+        return "linked"
+
+    if dst_stat is not None and dst_stat.st_size == src_stat.st_size:
+        unchanged = dst_stat.st_mtime_ns == src_stat.st_mtime_ns
+        if unchanged or _checksum(src) == _checksum(dst):
+            shutil.copystat(src, dst)
+            return "skipped"
+
+    if same_device and _reflink(src, dst):
+        shutil.copystat(src, dst)
+        return "reflinked"
+
+    shutil.copy2(src, dst)
+    return "copied"
+
+
+def stage_files(srcs, dst_dir, link=False, max_workers=4):
+    """Stage several files into the same directory concurrently, with
+    :func:`stage_file`.
+
+    Parameters:
+        srcs (:obj:`list` of :obj:`str`): the files to stage.
+        dst_dir (str): the target directory.
+
+    Keyword arguments:
+        link (bool): whether to allow hardlinks.
+        max_workers (int): the maximum number of files to copy at once.
+
+    Returns:
+        :obj:`list` of :obj:`str`: the action taken for each file.
+
+    """
+    srcs = list(srcs)
+    if len(srcs) <= 1 or max_workers <= 1:
+        actions = [stage_file(src, dst_dir, link=link) for src in srcs]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(srcs))) as pool:
+            actions = list(
+                pool.map(lambda src: stage_file(src, dst_dir, link=link), srcs)
+            )
+
+    for src, action in zip(srcs, actions):
+        LOG.debug("Staged {} into {}: {}".format(src, dst_dir, action))
+
+    return actions
+
+
+def _checksum(fname):
+    """Return the BLAKE2 digest of the file's contents."""
+    digest = hashlib.blake2b()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _hardlink(src, dst):
+    """Try to hardlink `src` to `dst`, replacing any existing `dst`
+    atomically, which can fail e.g. across filesystems or for files owned
+    by other users when `fs.protected_hardlinks` is set.
+
+    Returns:
+        bool: True if the link succeeded, otherwise `dst` is left unchanged.
+
+    """
+    tmp = "{}.link_tmp".format(dst)
+    try:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        os.link(src, tmp)
+        os.replace(tmp, dst)
+        return True
+    except OSError as exc:
+        LOG.debug("Unable to hardlink {} to {}: {}".format(src, dst, exc))
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        return False
+
+
+def _reflink(src, dst):
+    """Try to clone `src` to `dst` without copying its data, which is only
+    supported by copy-on-write filesystems such as btrfs and XFS.
+
+    Returns:
+        bool: True if the clone succeeded, otherwise `dst` is left unchanged.
+
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    tmp = "{}.reflink_tmp".format(dst)
+    try:
+        with open(src, "rb") as src_file, open(tmp, "wb") as tmp_file:
+            fcntl.ioctl(tmp_file.fileno(), _FICLONE, src_file.fileno())
+        os.replace(tmp, dst)
+        return True
+    except OSError:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+        return False
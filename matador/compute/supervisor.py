@@ -0,0 +1,220 @@
+# coding: utf-8
+# Distributed under the terms of the MIT License.
+
+""" This file implements an event-driven supervisor for running
+subprocesses, that wakes up only when a process writes output, exits
+or reaches its deadline, rather than polling at a fixed interval.
+
+"""
+
+
+import os
+import selectors
+import threading
+import time
+
+
+class ProcessSupervisor:
+    """Supervise any number of running `subprocess.Popen` objects from a
+    single thread, collecting their piped output and waiting for them to
+    exit or reach their deadlines.
+
+    Process exits are detected with a pidfd where available (Linux >= 5.3),
+    otherwise by a helper thread per process that signals a pipe on exit.
+
+    Example:
+
+        >>> with ProcessSupervisor() as supervisor:
+        ...     for seed in seeds:
+        ...         process = sp.Popen(["castep", seed], stdout=sp.PIPE, stderr=sp.PIPE)
+        ...         supervisor.register(process, deadline=time.time() + 3600)
+        ...     while supervisor.processes:
+        ...         for process, event in supervisor.wait():
+        ...             out, err = supervisor.output(process)
+        ...             supervisor.unregister(process)
+
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._states = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def processes(self):
+        """List of the currently registered processes."""
+        return list(self._states)
+
+    def register(self, process, deadline=None):
+        """Start supervising a running process.
+
+        Parameters:
+            process (subprocess.Popen): the process to supervise.
+
+        Keyword arguments:
+            deadline (float): optional Unix time after which :meth:`wait`
+                will report that the process has timed out.
+
+        """
+        state = {
+            "deadline": deadline,
+            "deadline_reported": False,
+            "exited": False,
+            "streams": [],
+            "stdout": [],
+            "stderr": [],
+            "exit_fd": None,
+        }
+        self._states[process] = state
+
+        for name in ("stdout", "stderr"):
+            stream = getattr(process, name)
+            if stream is not None:
+                os.set_blocking(stream.fileno(), False)
+                self._selector.register(stream, selectors.EVENT_READ, (process, name))
+                state["streams"].append(stream)
+
+        state["exit_fd"] = self._open_exit_fd(process)
+        self._selector.register(
+            state["exit_fd"], selectors.EVENT_READ, (process, "exit")
+        )
+
+    def unregister(self, process):
+        """Stop supervising the process, without killing it.
+
+        Parameters:
+            process (subprocess.Popen): the process to stop supervising.
+
+        """
+        state = self._states.pop(process)
+        for stream in state["streams"]:
+            self._selector.unregister(stream)
+        state["streams"] = []
+        if state["exit_fd"] is not None:
+            self._selector.unregister(state["exit_fd"])
+            os.close(state["exit_fd"])
+            state["exit_fd"] = None
+
+    def close(self):
+        """Stop supervising all processes."""
+        for process in self.processes:
+            self.unregister(process)
+        self._selector.close()
+
+    def wait(self, timeout=None):
+        """Block until at least one process exits or reaches its deadline.
+
+        Keyword arguments:
+            timeout (float): maximum time to wait in seconds, or None to
+                wait indefinitely.
+
+        Returns:
+            :obj:`list` of :obj:`tuple`: the processes that exited or timed out,
+                as (process, event) pairs where event is either "exit" or
+                "deadline". Empty if `timeout` was reached first.
+
+        """
+        end = None if timeout is None else time.time() + timeout
+        while True:
+            now = time.time()
+            events = []
+            wait_until = end
+            for process, state in self._states.items():
+                if state["exited"] or state["deadline_reported"]:
+                    continue
+                if state["deadline"] is not None:
+                    if state["deadline"] <= now:
+                        state["deadline_reported"] = True
+                        events.append((process, "deadline"))
+                    elif wait_until is None or state["deadline"] < wait_until:
+                        wait_until = state["deadline"]
+            if events:
+                return events
+
+            if not any(not state["exited"] for state in self._states.values()):
+                return events
+
+            select_timeout = None if wait_until is None else max(wait_until - now, 0)
+            for key, _ in self._selector.select(select_timeout):
+                process, name = key.data
+                if name == "exit":
+                    self._handle_exit(process)
+                    events.append((process, "exit"))
+                else:
+                    self._read_stream(process, key.fileobj, name)
+
+            if events:
+                return events
+            if end is not None and time.time() >= end:
+                return events
+
+    def output(self, process):
+        """Return everything the process has written to its pipes so far.
+
+        Parameters:
+            process (subprocess.Popen): the supervised process.
+
+        Returns:
+            (bytes, bytes): the stdout and stderr of the process, empty if
+                the corresponding stream was not piped.
+
+        """
+        state = self._states[process]
+        return b"".join(state["stdout"]), b"".join(state["stderr"])
+
+    def _handle_exit(self, process):
+        """Reap the exited process and collect the rest of its output."""
+        state = self._states[process]
+        state["exited"] = True
+        self._selector.unregister(state["exit_fd"])
+        os.close(state["exit_fd"])
+        state["exit_fd"] = None
+        process.wait()
+        for stream in list(state["streams"]):
+            name = "stdout" if stream is process.stdout else "stderr"
+            while self._read_stream(process, stream, name):
+                pass
+
+    def _read_stream(self, process, stream, name):
+        """Read the available output from the stream, returning False
+        if no more output is available.
+
+        """
+        state = self._states[process]
+        try:
+            chunk = os.read(stream.fileno(), 65536)
+        except BlockingIOError:
+            return False
+        if chunk:
+            state[name].append(chunk)
+            return True
+        self._selector.unregister(stream)
+        state["streams"].remove(stream)
+        return False
+
+    @staticmethod
+    def _open_exit_fd(process):
+        """Return a file descriptor that becomes readable when the process exits."""
+        try:
+            return os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            pass
+
+        read_fd, write_fd = os.pipe()
+
+        def _wait_and_signal():
+            process.wait()
+            try:
+                os.write(write_fd, b"x")
+            except OSError:
+                pass
+            finally:
+                os.close(write_fd)
+
+        threading.Thread(target=_wait_and_signal, daemon=True).start()
+        return read_fd
@@ -0,0 +1,171 @@
+# coding: utf-8
+# Distributed under the terms of the MIT License.
+
+""" This file implements a predictor for the wall time of the blocks
+of a CASTEP relaxation, based on the SCF and geometry step timings
+reported in the CASTEP output file so far.
+
+"""
+
+
+import numpy as np
+
+from matador.scrapers.castep_scrapers import CASTEP_RUN_HEADER_STRING
+
+
+class WalltimePredictor:
+    """Track the wall time of each SCF cycle and geometry optimisation step
+    from the lines of a CASTEP output file, and predict how long the next
+    block of a relaxation will take.
+
+    Each CASTEP run reports the time since it started at the end of every
+    SCF cycle. The time up to the end of the initial SCF ("iteration 0") is
+    recorded as the startup time of the run, and the time between the ends of
+    subsequent iterations as the time of each geometry step. Until a geometry
+    step has been timed, the step time is estimated from the SCF cycle times
+    and the number of SCF cycles taken by each iteration so far. The wall time
+    of each run not covered by CASTEP's own timer (e.g. MPI startup and
+    writing output) can also be provided with :meth:`end_block`.
+
+    Example:
+
+        >>> predictor = WalltimePredictor()
+        >>> reader = CastepOutputReader("seed.castep", listeners=[predictor])
+        >>> # after each block of the relaxation
+        >>> reader.update()
+        >>> predictor.end_block(block_wall_time)
+        >>> if not predictor.will_finish(geom_max_iter, time_remaining):
+        ...     # checkpoint and stop
+
+    """
+
+    def __init__(self, safety_factor=1.2, window=10):
+        """Initialise the predictor with no timings.
+
+        Keyword arguments:
+            safety_factor (float): factor to multiply all predictions by.
+            window (int): number of most recent timings of each kind to use
+                in predictions, such that they follow any drift in step cost.
+
+        """
+        self.safety_factor = safety_factor
+        self.window = window
+        self.scf_cycle_times = []
+        self.scf_cycles_per_step = []
+        self.step_times = []
+        self.startup_times = []
+        self.overhead_times = []
+        self._last_timer = None
+        self._last_step_end = 0.0
+        self._num_steps_in_run = 0
+        self._num_cycles_in_step = 0
+
+    def add_lines(self, lines):
+        """Consume new lines of the CASTEP output file.
+
+        Parameters:
+            lines (list of str): the new lines, in order.
+
+        """
+        for line in lines:
+            if CASTEP_RUN_HEADER_STRING in line:
+                self._last_timer = None
+                self._last_step_end = 0.0
+                self._num_steps_in_run = 0
+                self._num_cycles_in_step = 0
+            elif line.rstrip().endswith("<-- SCF"):
+                # SCF cycle lines start with "Initial" or the cycle number
+                # and end with the timer, e.g. "  1  -8.3E+3  5.1E+0  4.3E+1  2.79  <-- SCF"
+                tokens = line.split()
+                if len(tokens) < 4 or not (
+                    tokens[0] == "Initial" or tokens[0].isdigit()
+                ):
+                    continue
+                try:
+                    timer = float(tokens[-3])
+                except ValueError:
+                    continue
+                if tokens[0] != "Initial":
+                    self._num_cycles_in_step += 1
+                    if self._last_timer is not None:
+                        self.scf_cycle_times.append(timer - self._last_timer)
+                self._last_timer = timer
+            elif (
+                ": finished iteration" in line
+                and "with enthalpy" in line
+                and self._last_timer is not None
+            ):
+                duration = self._last_timer - self._last_step_end
+                if self._num_steps_in_run == 0:
+                    self.startup_times.append(duration)
+                else:
+                    self.step_times.append(duration)
+                self.scf_cycles_per_step.append(self._num_cycles_in_step)
+                self._num_cycles_in_step = 0
+                self._num_steps_in_run += 1
+                self._last_step_end = self._last_timer
+
+    def end_block(self, wall_time):
+        """Record the total wall time of the CASTEP run that just finished,
+        to estimate the overhead not covered by CASTEP's own timer.
+
+        Parameters:
+            wall_time (float): the measured wall time of the run in seconds.
+
+        """
+        if self._last_timer is not None:
+            self.overhead_times.append(max(wall_time - self._last_timer, 0.0))
+
+    def predict_block_time(self, num_steps):
+        """Predict the wall time of a new CASTEP run of `num_steps` geometry
+        steps, allowing for the spread in the recent step times. If only the
+        initial SCF of a run has finished, the step time is estimated as the
+        mean number of SCF cycles per iteration multiplied by the recent SCF
+        cycle time, which overestimates later steps that start from a
+        converged density.
+
+        Parameters:
+            num_steps (int): the maximum number of geometry steps in the block.
+
+        Returns:
+            float: the predicted wall time in seconds, or None if no geometry
+                steps or SCF cycles have been timed yet.
+
+        """
+        if self.step_times:
+            recent_steps = np.asarray(self.step_times[-self.window :])
+            step_time = np.mean(recent_steps) + np.std(recent_steps)
+        elif self.scf_cycle_times and self.scf_cycles_per_step:
+            recent_cycles = np.asarray(self.scf_cycle_times[-self.window :])
+            step_time = np.mean(self.scf_cycles_per_step[-self.window :]) * (
+                np.mean(recent_cycles) + np.std(recent_cycles)
+            )
+        else:
+            return None
+
+        startup_time = step_time
+        if self.startup_times:
+            startup_time = np.mean(self.startup_times[-self.window :])
+        overhead_time = 0.0
+        if self.overhead_times:
+            overhead_time = np.mean(self.overhead_times[-self.window :])
+
+        return float(
+            self.safety_factor * (overhead_time + startup_time + num_steps * step_time)
+        )
+
+    def will_finish(self, num_steps, time_remaining):
+        """Predict whether a block of `num_steps` geometry steps will finish
+        in the time remaining. If there is no timing data yet, the block is
+        assumed to finish.
+
+        Parameters:
+            num_steps (int): the maximum number of geometry steps in the block.
+            time_remaining (float): the wall time remaining in seconds.
+
+        Returns:
+            bool: False if the block is predicted to overrun, else True.
+
+        """
+        prediction = self.predict_block_time(num_steps)
+        return prediction is None or prediction <= time_remaining
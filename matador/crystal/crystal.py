@@ -214,6 +214,7 @@ class Crystal(DataContainer):
         self._coordination_lists = None
         self._coordination_stats = None
         self._network = None
+        self._sparse_network = None
         self._bond_lengths = None
         self._bonding_stats = None
 
@@ -652,13 +653,35 @@ class Crystal(DataContainer):
         get_unique_sites(self._data)
         return self._data["similar_sites"]
 
+    @property
+    def sparse_network(self):
+        """Returns/constructs a SparseCrystalGraph of the bonds in the structure."""
+        from matador.crystal.network import SparseCrystalGraph, SPARSE_GRAPH_KWARGS
+
+        if self._sparse_network is None:
+            self._sparse_network = SparseCrystalGraph(
+                self,
+                **{
+                    key: val
+                    for key, val in self._network_kwargs.items()
+                    if key in SPARSE_GRAPH_KWARGS
+                },
+            )
+        return self._sparse_network
+
     @property
     def network(self):
         """Returns/constructs a CrystalGraph object of the structure."""
-        from matador.crystal.network import CrystalGraph
+        from matador.crystal.network import SPARSE_GRAPH_KWARGS
 
         if self._network is None:
-            self._network = CrystalGraph(self, **self._network_kwargs)
+            self._network = self.sparse_network.to_networkx(
+                **{
+                    key: val
+                    for key, val in self._network_kwargs.items()
+                    if key not in SPARSE_GRAPH_KWARGS
+                }
+            )
         return self._network
 
     @property
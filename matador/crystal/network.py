@@ -1,12 +1,191 @@
 """ This file implements turning matador Crystal objects
-into CrystalGraph objects.
+into CrystalGraph objects, via the sparse bond arrays of a
+SparseCrystalGraph.
 """
+
 import networkx as nx
 import numpy as np
 import itertools
 
 EPS = 1e-12
 
+# keyword arguments of CrystalGraph that are used to find the bonds
+SPARSE_GRAPH_KWARGS = (
+    "coordination_cutoff",
+    "bond_tolerance",
+    "num_images",
+    "max_bond_length",
+    "debug",
+)
+
+
+class SparseCrystalGraph:
+    """The bonds of a periodic structure, stored as arrays of directed
+    edges and a sparse adjacency matrix, without constructing a networkx
+    graph. Use :meth:`to_networkx` to create a :class:`CrystalGraph` when
+    the networkx functionality is needed.
+
+    Attributes:
+        species (:obj:`list` of :obj:`str`): the species of each atom.
+        images (numpy.ndarray): the lattice vector multiples of each image cell.
+        sources (numpy.ndarray): the index of the first atom of each bond.
+        targets (numpy.ndarray): the index of the second atom of each bond.
+        image_indices (numpy.ndarray): the index into `images` of the
+            image cell containing the second atom of each bond.
+        distances (numpy.ndarray): the length of each bond.
+
+    """
+
+    def __init__(
+        self,
+        structure,
+        coordination_cutoff=1.1,
+        bond_tolerance=1e20,
+        num_images=1,
+        max_bond_length=5,
+        debug=False,
+    ):
+        """Find the bonds of a structure from all pairs of atoms within
+        `max_bond_length` of each other, including periodic images.
+
+        A bond is drawn from atom i to atom j if their distance is within
+        `coordination_cutoff` times the distance from i to its nearest
+        neighbour, and within `bond_tolerance` times the shortest
+        distance between the two species.
+
+        Parameters:
+            structure (matador.Crystal): crystal structure to network-ify
+
+        Keyword Arguments:
+            coordination_cutoff (float) : max multiplier of first
+                coordination sphere for edge drawing
+            bond_tolerance (float): max multiplier of the shortest
+                distance between each pair of species for edge drawing
+            num_images (int): number of periodic images to include in
+                each direction
+            max_bond_length (float): the largest distance to consider.
+            debug (bool): print the nearest neighbour distances.
+
+        """
+        from scipy.spatial import cKDTree
+
+        self.species = [site.species for site in structure.sites]
+        num_atoms = len(self.species)
+        self.images = np.asarray(
+            list(itertools.product(range(-num_images, num_images + 1), repeat=3))
+        )
+        positions = np.asarray(structure.positions_abs, dtype=np.float64).reshape(-1, 3)
+        translations = self.images @ np.asarray(structure.lattice_cart)
+        image_positions = (positions + translations[:, np.newaxis, :]).reshape(-1, 3)
+
+        pairs = cKDTree(positions).sparse_distance_matrix(
+            cKDTree(image_positions), max_bond_length, output_type="ndarray"
+        )
+        sources = pairs["i"]
+        image_indices, targets = np.divmod(pairs["j"], num_atoms)
+        distances = pairs["v"]
+
+        # remove each atom's distance to itself
+        is_image = np.linalg.norm(self.images, axis=1)[image_indices] > EPS
+        keep = is_image | (sources != targets)
+        sources, targets = sources[keep], targets[keep]
+        image_indices, distances = image_indices[keep], distances[keep]
+
+        # find the minimum distance between all species pairs
+        # and the minimum distance for each atom
+        elems, species_codes = np.unique(self.species, return_inverse=True)
+        codes_i = species_codes[sources]
+        codes_j = species_codes[targets]
+        pair_codes = np.minimum(codes_i, codes_j) * len(elems) + np.maximum(
+            codes_i, codes_j
+        )
+        element_bonds = np.full(len(elems) ** 2, np.inf)
+        np.minimum.at(element_bonds, pair_codes, distances)
+        min_dists = np.full(num_atoms, 1e20)
+        np.minimum.at(min_dists, sources, distances)
+
+        if debug:
+            print(min_dists.tolist())
+            print(
+                {
+                    (elems[code // len(elems)], elems[code % len(elems)]): dist
+                    for code, dist in enumerate(element_bonds)
+                    if np.isfinite(dist)
+                }
+            )
+
+        bonded = (distances <= min_dists[sources] * coordination_cutoff) & (
+            distances <= element_bonds[pair_codes] * bond_tolerance
+        )
+        # order the bonds by image cell, then by atom
+        order = np.lexsort((targets[bonded], sources[bonded], image_indices[bonded]))
+        self.sources = sources[bonded][order]
+        self.targets = targets[bonded][order]
+        self.image_indices = image_indices[bonded][order]
+        self.distances = distances[bonded][order]
+        self._adjacency = None
+
+    @property
+    def num_atoms(self):
+        return len(self.species)
+
+    @property
+    def num_bonds(self):
+        return len(self.sources)
+
+    @property
+    def is_image(self):
+        """Whether the second atom of each bond is in an image cell."""
+        return np.linalg.norm(self.images, axis=1)[self.image_indices] > EPS
+
+    @property
+    def adjacency(self):
+        """Return the number of bonds from each atom to each other atom,
+        across all images, as a `scipy.sparse.csr_matrix`.
+        """
+        if self._adjacency is None:
+            from scipy.sparse import coo_matrix
+
+            self._adjacency = coo_matrix(
+                (
+                    np.ones(self.num_bonds, dtype=np.int64),
+                    (self.sources, self.targets),
+                ),
+                shape=(self.num_atoms, self.num_atoms),
+            ).tocsr()
+        return self._adjacency
+
+    @property
+    def coordination(self):
+        """Return the number of bonds from each atom, i.e. the out-degree
+        of each node in the :class:`CrystalGraph`.
+        """
+        return np.bincount(self.sources, minlength=self.num_atoms)
+
+    def get_connected_components(self, connection="strong"):
+        """Label the connected components of the bond network.
+
+        Keyword arguments:
+            connection (str): either "strong", to only connect atoms
+                that are bonded in both directions, or "weak".
+
+        Returns:
+            (int, numpy.ndarray): the number of components and the
+                component label of each atom.
+
+        """
+        from scipy.sparse.csgraph import connected_components
+
+        return connected_components(
+            self.adjacency, directed=True, connection=connection
+        )
+
+    def to_networkx(self, **kwargs):
+        """Return the bond network as a :class:`CrystalGraph`, with any
+        further keyword arguments passed to its initialiser.
+        """
+        return CrystalGraph(sparse_graph=self, **kwargs)
+
 
 class CrystalGraph(nx.MultiDiGraph):
     def __init__(
@@ -20,6 +199,7 @@ class CrystalGraph(nx.MultiDiGraph):
         separate_images=False,
         delete_one_way_bonds=False,
         max_bond_length=5,
+        sparse_graph=None,
     ):
         """Create networkx.MultiDiGraph object with extra functionality for atomic networks.
 
@@ -32,86 +212,58 @@ class CrystalGraph(nx.MultiDiGraph):
                 each direction
             separate_images (bool): whether or not to include image
                 atoms as new nodes
+            sparse_graph (SparseCrystalGraph): initialise from the bonds
+                already found for a structure
 
         """
 
         super().__init__()
+        self.sparse_graph = None
 
-        if graph is None and structure is None:
+        if graph is None and structure is None and sparse_graph is None:
             raise RuntimeError("No structure or graph to initialise network from.")
 
-        if structure is not None:
-            atoms = structure.sites
-            num_atoms = len(atoms)
-            element_bonds = {}
-            images = list(
-                itertools.product(range(-num_images, num_images + 1), repeat=3)
-            )
-            image_number = 0
-
-            # now loop over pairs of atoms and decide whether to draw an edge
-            from matador.utils.cell_utils import calc_pairwise_distances_pbc
-
-            distances = calc_pairwise_distances_pbc(
-                structure.positions_abs,
-                images,
-                structure.lattice_cart,
-                max_bond_length,
-                compress=False,
-                debug=True,
-            )
-
-            # first over loop all pairs to find the minimum distance between all species pairs
-            # and the minimum distance for each atom
-            for i, atom in enumerate(atoms):
-                self.add_node(i, species=atom.species)
-
-            min_dists = [1e20 for atom in atoms]
-            for index in np.where(~distances.mask)[0]:
-                image_index = int(index / num_atoms**2)
-                i = int((index - image_index * num_atoms**2) / num_atoms)
-                j = int((index - image_index * num_atoms**2) % num_atoms)
-                atom = atoms[i]
-                other_atom = atoms[j]
-                if i == j and np.linalg.norm(images[image_index]) <= EPS:
-                    continue
-                dist = distances[index]
-                pair_key = tuple(sorted([atom.species, other_atom.species]))
-                if pair_key not in element_bonds or element_bonds[pair_key] > dist:
-                    element_bonds[pair_key] = dist
-                # find the closest image of an atom to i
-                if dist < min_dists[i]:
-                    min_dists[i] = dist
-
-            if debug:
-                print(min_dists)
-                print(element_bonds)
-
-            for index in np.where(~distances.mask)[0]:
-                image_index = int(index / num_atoms**2)
-                i = int((index - image_index * num_atoms**2) / num_atoms)
-                j = int((index - image_index * num_atoms**2) % num_atoms)
-                atom = atoms[i]
-                other_atom = atoms[j]
-                min_dist = min_dists[i]
-                if i == j and np.linalg.norm(images[image_index]) <= EPS:
-                    continue
-                dist = distances[index]
-                pair_key = tuple(sorted([atom.species, other_atom.species]))
-                if (
-                    dist <= min_dist * coordination_cutoff
-                    and dist <= element_bonds[pair_key] * bond_tolerance
+        if structure is not None or sparse_graph is not None:
+            if sparse_graph is None:
+                sparse_graph = SparseCrystalGraph(
+                    structure,
+                    coordination_cutoff=coordination_cutoff,
+                    bond_tolerance=bond_tolerance,
+                    num_images=num_images,
+                    max_bond_length=max_bond_length,
+                    debug=debug,
+                )
+            self.sparse_graph = sparse_graph
+
+            for i, species in enumerate(sparse_graph.species):
+                self.add_node(i, species=species)
+
+            sources = sparse_graph.sources.tolist()
+            targets = sparse_graph.targets.tolist()
+            distances = sparse_graph.distances.tolist()
+            if separate_images:
+                image_number = 0
+                negative_image = np.all(sparse_graph.images <= 0 + 1e-8, axis=1)[
+                    sparse_graph.image_indices
+                ].tolist()
+                is_image = sparse_graph.is_image.tolist()
+                for i, j, dist, negative, image in zip(
+                    sources, targets, distances, negative_image, is_image
                 ):
-                    if separate_images and all(
-                        [val <= 0 + 1e-8 for val in images[image_index]]
-                    ):
+                    if negative:
                         image_number += 1
-                        self.add_node(j + image_number, species=atoms[j].species)
+                        self.add_node(j + image_number, species=sparse_graph.species[j])
                         self.add_edge(i, j + image_number, dist=dist)
                         self.add_edge(j + image_number, i, dist=dist)
                     else:
-                        is_image = np.linalg.norm(images[image_index]) > EPS
-                        self.add_edge(i, j, dist=dist, image=is_image)
+                        self.add_edge(i, j, dist=dist, image=image)
+            else:
+                self.add_edges_from(
+                    (i, j, {"dist": dist, "image": image})
+                    for i, j, dist, image in zip(
+                        sources, targets, distances, sparse_graph.is_image.tolist()
+                    )
+                )
 
         elif graph is not None:
             for node, data in graph.nodes.data():
@@ -2,17 +2,27 @@
 # Distributed under the terms of the MIT License.
 
 """ The db module provides all the submodules that touch the database,
-with functionality to connect, add or refine database objects, and observe
-changes.
+with functionality to connect, add or refine database objects, observe
+changes, and stream in the results of finished calculations.
 
 """
 
 
-__all__ = ["Spatula", "DatabaseChanges", "Refiner", "make_connection_to_collection"]
+__all__ = [
+    "Spatula",
+    "DatabaseChanges",
+    "DatabaseSink",
+    "Refiner",
+    "make_connection_to_collection",
+    "get_raw_files",
+    "migrate_raw_data",
+]
 __author__ = "Matthew Evans"
 __maintainer__ = "Matthew Evans"
 
 from .connect import make_connection_to_collection
 from .importer import Spatula
 from .changes import DatabaseChanges
+from .sink import DatabaseSink
 from .refine import Refiner
+from .raw import get_raw_files, migrate_raw_data
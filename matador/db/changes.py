@@ -25,6 +25,8 @@ class DatabaseChanges:
         action="view",
         override=False,
         mongo_settings=None,
+        batch_size=1000,
+        dry_run=False,
     ):
         """Parse arguments and run changes interface.
 
@@ -36,6 +38,9 @@ class DatabaseChanges:
             action (str): either 'view' or 'undo'
             override (bool): override all options to positive answers for testing
             mongo_settings (dict): dictionary of already-sources mongo settings
+            batch_size (int): the number of structures to remove at once when undoing
+            dry_run (bool): when undoing, only report how many structures each
+                batch would remove
 
         """
         self.changelog_name = "__changelog_{}".format(collection_name)
@@ -68,40 +73,69 @@ class DatabaseChanges:
             self.view_changeset(self.change, changeset_ind - 1)
             if action == "undo":
                 count = curs[changeset_ind - 1]["count"]
-                print_warning(
-                    "An attempt will now be made to remove {} structures from {}.".format(
-                        count, collection_name
+                num_reverted = self.change.get("num_reverted", 0)
+                if dry_run:
+                    print_notify(
+                        "Dry run: no structures will be removed from {}.".format(
+                            collection_name
+                        )
                     )
-                )
-                print_notify("Are you sure you want to do that? (y/n)")
-                if override:
-                    response = "y"
                 else:
-                    response = input()
-                if response.lower() == "y":
-                    print_notify("You don't have any doubts at all? (y/n)")
+                    if num_reverted:
+                        print_notify(
+                            "Resuming partially undone changeset: {}/{} structures already processed.".format(
+                                num_reverted, count
+                            )
+                        )
+                    print_warning(
+                        "An attempt will now be made to remove {} structures from {}.".format(
+                            count - num_reverted, collection_name
+                        )
+                    )
+                    print_notify("Are you sure you want to do that? (y/n)")
                     if override:
-                        next_response = "n"
+                        response = "y"
                     else:
-                        next_response = input()
-                    if next_response.lower() == "n":
-                        print("You're the boss, deleting structures now...")
+                        response = input()
+                    if response.lower() == "y":
+                        print_notify("You don't have any doubts at all? (y/n)")
+                        if override:
+                            next_response = "n"
+                        else:
+                            next_response = input()
+                        if next_response.lower() == "n":
+                            print("You're the boss, deleting structures now...")
+                        else:
+                            exit("As I thought...")
                     else:
-                        exit("As I thought...")
-                else:
-                    exit()
+                        exit()
 
                 # proceed with deletion
                 _, _, collections = make_connection_to_collection(
-                    collection_name, allow_changelog=False, override=override
+                    collection_name,
+                    allow_changelog=False,
+                    override=override,
+                    mongo_settings=mongo_settings,
                 )
                 collection_to_delete_from = [collections[key] for key in collections][0]
-                result = collection_to_delete_from.delete_many(
-                    {"_id": {"$in": self.change["id_list"]}}
+                batch_counts = self.undo_changeset(
+                    self.repo,
+                    collection_to_delete_from,
+                    self.change,
+                    batch_size=batch_size,
+                    dry_run=dry_run,
                 )
+                if dry_run:
+                    print(
+                        "Would delete {}/{} in {} batches.".format(
+                            sum(batch_counts), self.change["count"], len(batch_counts)
+                        )
+                    )
+                    return
+
                 print(
                     "Deleted {}/{} successfully.".format(
-                        result.deleted_count, self.change["count"]
+                        sum(batch_counts), self.change["count"] - num_reverted
                     )
                 )
                 print("Tidying up changelog database...")
@@ -112,6 +146,58 @@ class DatabaseChanges:
                     self.repo.drop()
                 print("Success!")
 
+    @staticmethod
+    def undo_changeset(
+        changelog, collection, changeset, batch_size=1000, dry_run=False
+    ):
+        """Remove the structures added by a changeset in batches, recording
+        the progress in the changeset's `num_reverted` field after each batch,
+        such that an interrupted undo can be resumed from the last completed
+        batch.
+
+        Parameters:
+            changelog (Collection): the changelog collection containing the changeset.
+            collection (Collection): the collection to remove the structures from.
+            changeset (dict): the changeset to undo.
+
+        Keyword arguments:
+            batch_size (int): the maximum number of structures to remove at once.
+            dry_run (bool): if True, only count the structures that each batch
+                would remove, without removing them or recording any progress.
+
+        Returns:
+            :obj:`list` of :obj:`int`: the number of structures (that would be)
+                removed by each batch.
+
+        """
+        id_list = changeset["id_list"]
+        start = changeset.get("num_reverted", 0)
+        batch_counts = []
+        for batch_start in range(start, len(id_list), batch_size):
+            batch_end = min(batch_start + batch_size, len(id_list))
+            batch_filter = {"_id": {"$in": id_list[batch_start:batch_end]}}
+            if dry_run:
+                batch_counts.append(collection.count_documents(batch_filter))
+            else:
+                batch_counts.append(collection.delete_many(batch_filter).deleted_count)
+                # deletion is idempotent, so it is safe to repeat a batch if
+                # this update is interrupted
+                changelog.update_one(
+                    {"_id": changeset["_id"]}, {"$set": {"num_reverted": batch_end}}
+                )
+                changeset["num_reverted"] = batch_end
+            print(
+                "Batch {}: {} {} structures ({}/{}).".format(
+                    len(batch_counts),
+                    "would remove" if dry_run else "removed",
+                    batch_counts[-1],
+                    batch_end,
+                    len(id_list),
+                )
+            )
+
+        return batch_counts
+
     @staticmethod
     def view_changeset(changeset, index):
         """Prints all details about a particular changeset.
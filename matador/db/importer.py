@@ -310,37 +310,7 @@ class Spatula:
 
             # check basic DFT params if we're not in a prototype DB
             if not self.args.get("prototype"):
-                failed_checks = []
-                if "species_pot" not in struct:
-                    struct["quality"] = 0
-                    failed_checks.append("missing all pspots")
-                else:
-                    specified = []
-                    for elem in struct["stoichiometry"]:
-                        # remove all points for a missing pseudo
-                        if elem[0] not in struct["species_pot"]:
-                            struct["quality"] = 0
-                            failed_checks.append("missing pspot for {}".format(elem[0]))
-                        else:
-                            specified.append(elem[0])
-                            # remove a point for a generic OTF pspot
-                            if "OTF" in struct["species_pot"][elem[0]].upper():
-                                struct["quality"] -= 1
-                                failed_checks.append(
-                                    "pspot not fully specified for {}".format(elem[0])
-                                )
-                    struct["species_pot"] = {
-                        species: struct["species_pot"][species] for species in specified
-                    }
-
-                if "xc_functional" not in struct:
-                    struct["quality"] = 0
-                    failed_checks.append("missing xc functional")
-
-                if "cut_off_energy" not in struct:
-                    struct["quality"] -= 1
-                if "kpoints_mp_spacing" not in struct:
-                    struct["quality"] -= 1
+                struct["quality"], failed_checks = check_dft_quality(struct)
 
             else:
                 struct["prototype"] = True
@@ -877,6 +847,54 @@ class Spatula:
             print("\t\t{:8d}\t\t.{} files".format(counts[ext], ext))
 
 
+def check_dft_quality(struct):
+    """Score the completeness of the DFT parameters of a structure
+    out of 5, removing any pseudopotentials for species not present.
+    Structures missing pseudopotentials or an xc-functional score 0.
+
+    Parameters:
+        struct (dict): the structure to check, which may be modified.
+
+    Returns:
+        (int, list): the quality score, and a list of the failed checks.
+
+    """
+    quality = 5
+    failed_checks = []
+    if "species_pot" not in struct:
+        quality = 0
+        failed_checks.append("missing all pspots")
+    else:
+        specified = []
+        for elem in struct["stoichiometry"]:
+            # remove all points for a missing pseudo
+            if elem[0] not in struct["species_pot"]:
+                quality = 0
+                failed_checks.append("missing pspot for {}".format(elem[0]))
+            else:
+                specified.append(elem[0])
+                # remove a point for a generic OTF pspot
+                if "OTF" in struct["species_pot"][elem[0]].upper():
+                    quality -= 1
+                    failed_checks.append(
+                        "pspot not fully specified for {}".format(elem[0])
+                    )
+        struct["species_pot"] = {
+            species: struct["species_pot"][species] for species in specified
+        }
+
+    if "xc_functional" not in struct:
+        quality = 0
+        failed_checks.append("missing xc functional")
+
+    if "cut_off_energy" not in struct:
+        quality -= 1
+    if "kpoints_mp_spacing" not in struct:
+        quality -= 1
+
+    return quality, failed_checks
+
+
 def _add_to_delete_lists(_file, root, new_file_lists, delete_list):
     """Add files to the delete list, with the correct file types."""
     structure_exts = {
@@ -0,0 +1,179 @@
+# coding: utf-8
+# Distributed under the terms of the MIT License.
+
+""" This file implements the storage of the raw source files of
+structures in the database, as zlib-compressed binary blobs under the
+`_raw` key, and their transparent decompression.
+
+Each entry in `_raw` is a dictionary with the keys `source` (the file
+path), `encoding` ("zlib"), `charset` (the text encoding of the file,
+"utf-8" or "latin1"), `size` (the uncompressed size in bytes) and `data`
+(the compressed contents). Older documents store each entry as a list of
+the source and the lines of the file, which are still read by
+:func:`get_raw_files` and can be rewritten with :func:`migrate_raw_data`.
+
+"""
+
+
+import io
+import zlib
+
+import pymongo as pm
+
+from matador.utils.print_utils import print_notify, print_warning
+
+__all__ = [
+    "compress_raw_file",
+    "decompress_raw_file",
+    "get_raw_files",
+    "migrate_raw_data",
+]
+
+# the largest total size of the compressed files to store in one document,
+# leaving room within the 16 MB BSON limit
+RAW_MAX_SIZE = 4 * 1024**2
+
+
+def compress_raw_file(source, contents=None, max_size=RAW_MAX_SIZE):
+    """Compress a raw file for storage under the `_raw` key.
+
+    Parameters:
+        source (str): the path to the file.
+
+    Keyword arguments:
+        contents (bytes): the contents of the file, otherwise read from `source`.
+        max_size (int): the maximum compressed size in bytes, e.g. the
+            space left for the document.
+
+    Returns:
+        dict: the `_raw` entry for the file, or None if the compressed
+            file would exceed `max_size`.
+
+    """
+    if contents is None:
+        with open(source, "rb") as f:
+            contents = f.read()
+
+    # fall back to latin1 for files that are not valid UTF-8, as the scrapers do
+    try:
+        contents.decode("utf-8")
+        charset = "utf-8"
+    except UnicodeDecodeError:
+        charset = "latin1"
+
+    data = zlib.compress(contents)
+    if max_size is not None and len(data) > max_size:
+        print_warning(
+            "Not storing {} as its compressed size of {} bytes exceeds {} bytes.".format(
+                source, len(data), max_size
+            )
+        )
+        return None
+
+    return {
+        "source": source,
+        "encoding": "zlib",
+        "charset": charset,
+        "size": len(contents),
+        "data": data,
+    }
+
+
+def decompress_raw_file(entry):
+    """Decompress a single entry of the `_raw` field, in either the
+    compressed or the older list-of-lines format.
+
+    Parameters:
+        entry (dict/list): the `_raw` entry.
+
+    Returns:
+        (str, :obj:`list` of :obj:`str`): the path to the source file
+            and its lines, including line endings.
+
+    """
+    if isinstance(entry, dict):
+        if entry.get("encoding") != "zlib":
+            raise RuntimeError(
+                "Unknown encoding {} for raw file {}".format(
+                    entry.get("encoding"), entry.get("source")
+                )
+            )
+        contents = zlib.decompress(entry["data"])
+        try:
+            contents = contents.decode(entry.get("charset", "utf-8"))
+        except UnicodeDecodeError:
+            contents = contents.decode("latin1")
+        # split the lines as reading the file in text mode would have done
+        return entry["source"], io.StringIO(contents, newline=None).readlines()
+
+    source, lines = entry
+    return source, list(lines)
+
+
+def get_raw_files(doc):
+    """Return the raw source files stored in a document.
+
+    Parameters:
+        doc (dict): the matador document.
+
+    Returns:
+        :obj:`list` of (str, :obj:`list` of :obj:`str`): the path and lines
+            of each stored source file, empty if none are stored.
+
+    """
+    return [decompress_raw_file(entry) for entry in doc.get("_raw", [])]
+
+
+def migrate_raw_data(collection, batch_size=100, max_size=RAW_MAX_SIZE):
+    """Rewrite any `_raw` fields stored as lists of lines in the
+    compressed format, in batches.
+
+    Parameters:
+        collection (pymongo.collection.Collection): the collection to migrate.
+
+    Keyword arguments:
+        batch_size (int): the number of documents to fetch and update at once.
+        max_size (int): the maximum total compressed size in bytes of the
+            files of each document, any files that do not fit are removed
+            from `_raw`.
+
+    Returns:
+        int: the number of documents rewritten.
+
+    """
+    cursor = collection.find(
+        {"_raw": {"$exists": True}}, {"_raw": 1}, batch_size=batch_size
+    )
+    num_migrated = 0
+    requests = []
+    for doc in cursor:
+        if all(isinstance(entry, dict) for entry in doc["_raw"]):
+            continue
+        raw_files = []
+        budget = max_size
+        for entry in doc["_raw"]:
+            if not isinstance(entry, dict):
+                source, lines = decompress_raw_file(entry)
+                entry = compress_raw_file(
+                    source, contents="".join(lines).encode("utf-8"), max_size=budget
+                )
+            elif budget is not None and len(entry["data"]) > budget:
+                entry = None
+            if entry is not None:
+                raw_files.append(entry)
+                if budget is not None:
+                    budget -= len(entry["data"])
+        requests.append(
+            pm.UpdateOne({"_id": doc["_id"]}, {"$set": {"_raw": raw_files}})
+        )
+        if len(requests) >= batch_size:
+            num_migrated += collection.bulk_write(
+                requests, ordered=False
+            ).modified_count
+            requests = []
+
+    if requests:
+        num_migrated += collection.bulk_write(requests, ordered=False).modified_count
+
+    print_notify("Compressed the raw files of {} documents.".format(num_migrated))
+    return num_migrated
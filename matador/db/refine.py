@@ -8,9 +8,9 @@ created with older matador versions.
 
 """
 
-
-from traceback import print_exc
 import os
+import json
+from functools import partial
 
 import pymongo as pm
 
@@ -36,6 +36,15 @@ class Refiner:
             task (str/callable): one of 'sym', 'spg', 'elem_set', 'tag', 'doi' or 'source',
                 or a custom function that takes in and returns a cursor and field to modify.
             mode (str): one of 'display', 'overwrite', 'set'.
+            workers (int): number of processes to use for the 'sym', 'spg', 'elem_set',
+                'source' and 'pspot' tasks (default: 1).
+            chunk_size (int): number of documents to refine and then write to the
+                database at once (default: 1000).
+            checkpoint (str): path to a file recording which chunks have already been
+                refined and written, such that an interrupted refine resumes where it
+                stopped. The file is removed once the refine has finished.
+            raw_max_size (int): the maximum total compressed size in bytes of the
+                files stored by the 'raw' task in each document (default: 4 MB).
 
         """
         possible_tasks = [
@@ -76,56 +85,133 @@ class Refiner:
         self.changed_count = 0
         self.failed_count = 0
         self.args = kwargs
-
+        self.workers = kwargs.get("workers") or 1
+        self.chunk_size = kwargs.get("chunk_size") or 1000
+        self.checkpoint = kwargs.get("checkpoint")
+        self._query_hash = None
+        self._pool = None
+        self.task = task if not callable(task) else getattr(task, "__name__", None)
+
+        # only refine the documents that were not written by an interrupted run
+        self._docs = self.cursor
+        if self.checkpoint is not None and self.mode in ["set", "overwrite"]:
+            self._docs = self._skip_checkpointed_docs()
+
+        refine = None
         if task in ["spg", "sym"]:
-            if kwargs.get("symprec"):
-                self.symmetry(symprec=kwargs.get("symprec"))
-            else:
-                self.symmetry()
             self.field = "space_group"
+            symprec = kwargs.get("symprec") or 1e-3
+            print("Refining symmetries...")
+            if self.mode == "display":
+                print_warning("{}".format("At symprec: " + str(symprec)))
+                print_warning(
+                    "{:^36}{:^16}{:^16}".format("text_id", "new sg", "old sg")
+                )
+            refine = partial(self.symmetry, symprec=symprec)
         elif task == "elem_set":
-            self.elem_set()
             self.field = "elems"
+            refine = self.elem_set
         elif task == "tag":
             self.field = "tags"
             self.tag = self.args.get("new_tag")
             if self.tag is None:
                 print_warning("No new tag defined, nothing will be done.")
             else:
-                self.add_tag()
+                refine = self.add_tag
         elif task == "doi":
             self.field = "doi"
             self.doi = self.args.get("new_doi")
             if self.doi is None:
                 print_warning("No new DOI defined, nothing will be done.")
             else:
-                self.add_doi()
+                refine = self.add_doi
         elif task == "source":
             self.field = "root_source"
-            self.add_root_source()
+            refine = self.add_root_source
         elif task == "pspot":
             self.field = "species_pot"
-            self.tidy_pspots()
+            refine = self.tidy_pspots
         elif task == "raw":
             self.field = "_raw"
-            self.add_raw_data()
+            refine = self.add_raw_data
         elif callable(task):
             print("Using custom task function: {}".format(task))
-            self.diff_cursor, self.field = task(self.cursor)
+            self.field = None
+            refine = partial(self._apply_custom_task, task)
+
+        if refine is not None:
+            self._refine_in_chunks(refine)
 
         self.changed_count = len(self.diff_cursor)
-        print(self.changed_count, "/", len(self.cursor), "to be changed.")
-        print(self.failed_count, "/", len(self.cursor), "failed.")
+        print(self.changed_count, "/", len(self._docs), "to be changed.")
+        print(self.failed_count, "/", len(self._docs), "failed.")
+
+        if self.mode in ["set", "overwrite"]:
+            if self.checkpoint is not None and os.path.isfile(self.checkpoint):
+                os.remove(self.checkpoint)
+
+    def _refine_in_chunks(self, refine):
+        """Refine the documents in chunks of `chunk_size` documents. In
+        "set" or "overwrite" mode, each chunk of changed documents is written
+        to the database, and the progress recorded in the checkpoint file
+        (if requested), before the next chunk is refined, such that an
+        interrupt only loses the work done on the current chunk. Any process
+        pool started by the task is kept for every chunk and closed here once
+        all chunks have been refined.
+
+        Parameters:
+            refine (callable): the task method to call on each chunk,
+                which refines `self._docs` and appends any changed
+                documents to `self.diff_cursor`.
+
+        """
+        docs = self._docs
+        writing = self.mode in ["set", "overwrite"]
+        chunk_size = self.chunk_size if writing else max(len(docs), 1)
+        modified_count = 0
+        try:
+            for start in range(0, len(docs), chunk_size):
+                self._docs = docs[start : start + chunk_size]
+                num_changed = len(self.diff_cursor)
+                refine()
+                if writing:
+                    modified_count += self.update_docs(self.diff_cursor[num_changed:])
+                    self._write_checkpoint(self._docs[-1], start + len(self._docs))
+        finally:
+            self._docs = docs
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+
+        if writing:
+            print_notify(str(modified_count) + " docs modified.")
+
+    def _apply_custom_task(self, task):
+        """Apply a custom task function to the current chunk of documents."""
+        diff_cursor, self.field = task(self._docs)
+        self.diff_cursor.extend(diff_cursor)
+
+    def update_docs(self, docs=None):
+        """Updates documents in database with correct priority,
+        with a single bulk write.
+
+        Keyword arguments:
+            docs (list): the changed documents to write (default: all of
+                `self.diff_cursor`).
+
+        Returns:
+            int: the number of documents modified.
 
-        if self.mode in ["set", "overwrite"] and self.changed_count > 0:
-            self.update_docs()
+        """
+        if docs is None:
+            docs = self.diff_cursor
+        if not docs:
+            return 0
 
-    def update_docs(self):
-        """Updates documents in database with correct priority."""
         requests = []
         # if in "set" mode, do not overwrite, just apply
         if self.mode == "set":
-            for _, doc in enumerate(self.diff_cursor):
+            for _, doc in enumerate(docs):
                 requests.append(
                     pm.UpdateOne(
                         {"_id": doc["_id"], self.field: {"$exists": False}},
@@ -134,7 +220,7 @@ class Refiner:
                 )
         # else if in overwrite mode, overwrite previous field
         elif self.mode == "overwrite":
-            for _, doc in enumerate(self.diff_cursor):
+            for _, doc in enumerate(docs):
                 requests.append(
                     pm.UpdateOne(
                         {"_id": doc["_id"]}, {"$set": {self.field: doc[self.field]}}
@@ -144,67 +230,161 @@ class Refiner:
             for request in requests:
                 print(request)
 
-        result = self.collection.bulk_write(requests)
-        print_notify(str(result.modified_count) + " docs modified.")
+        return self.collection.bulk_write(requests, ordered=False).modified_count
+
+    def _skip_checkpointed_docs(self):
+        """Sort the documents by ID, such that the chunks are always
+        refined in the same order, and skip any documents that have
+        already been refined and written according to the checkpoint file.
+
+        Returns:
+            list: the documents still to be refined.
+
+        """
+        docs = sorted(self.cursor, key=lambda doc: str(doc["_id"]))
+        if not os.path.isfile(self.checkpoint):
+            return docs
+
+        with open(self.checkpoint, "r") as f:
+            checkpoint = json.load(f)
+
+        if (
+            checkpoint.get("task") != self.task
+            or checkpoint.get("mode") != self.mode
+            or checkpoint.get("query") != self._get_query_hash()
+            or checkpoint.get("args") != self._get_task_args()
+        ):
+            raise SystemExit(
+                "Checkpoint {} was written by a different task, mode, query or "
+                "arguments, please remove it or choose another file.".format(
+                    self.checkpoint
+                )
+            )
+
+        last_id = checkpoint["last_id"]
+        remaining = [doc for doc in docs if str(doc["_id"]) > last_id]
+        print_notify(
+            "Resuming from checkpoint {}: skipping {} documents that were already written.".format(
+                self.checkpoint, len(docs) - len(remaining)
+            )
+        )
+        return remaining
+
+    def _get_query_hash(self):
+        """Return a digest of the IDs of all documents in the query."""
+        if self._query_hash is None:
+            import hashlib
+
+            digest = hashlib.sha1()
+            for _id in sorted(str(doc["_id"]) for doc in self.cursor):
+                digest.update(_id.encode("utf-8"))
+            self._query_hash = digest.hexdigest()
+        return self._query_hash
+
+    def _get_task_args(self):
+        """Return the arguments that change the result of the task."""
+        keys = ["new_tag", "new_doi", "symprec", "raw_max_size"]
+        return {key: self.args.get(key) for key in keys}
+
+    def _write_checkpoint(self, last_doc, num_written):
+        """Atomically record the last document refined and written to
+        the database.
+
+        """
+        if self.checkpoint is None:
+            return
+        checkpoint = {
+            "task": self.task,
+            "mode": self.mode,
+            "query": self._get_query_hash(),
+            "args": self._get_task_args(),
+            "field": self.field,
+            "last_id": str(last_doc["_id"]),
+            "num_written": num_written,
+        }
+        tmp_fname = self.checkpoint + ".tmp"
+        with open(tmp_fname, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_fname, self.checkpoint)
+
+    def _refine_in_pool(self, worker, **kwargs):
+        """Apply a refine function to every document, in a process pool if
+        `workers` > 1, yielding the documents and the results in order.
+        The pool is started on the first call and reused for every
+        subsequent chunk, until `_refine_in_chunks` closes it.
+
+        Parameters:
+            worker (callable): one of the module-level `_refine_*` functions.
+
+        Yields:
+            (dict, object, Exception): the document, the new value of the
+                field (None if unchanged) and any exception raised.
+
+        """
+        import multiprocessing as mp
+
+        worker = partial(_refine_doc_worker, function=worker, kwargs=kwargs)
+        docs = self._docs
+        workers = min(self.workers, len(self.cursor))
+        if workers <= 1 or len(docs) <= 1:
+            for doc in docs:
+                yield (doc,) + worker(doc)
+            return
+
+        if self._pool is None:
+            self._pool = mp.Pool(processes=workers)
+
+        # only send the documents to the pool in chunks, without their other fields
+        chunksize = min(max(1, int(0.25 * self.chunk_size / workers)), 64)
+        keys = _REFINE_KEYS[worker.keywords["function"]]
+        for start in range(0, len(docs), self.chunk_size):
+            chunk = docs[start : start + self.chunk_size]
+            projected = ({key: doc[key] for key in keys if key in doc} for doc in chunk)
+            results = self._pool.imap(worker, projected, chunksize=chunksize)
+            for doc, result in zip(chunk, results):
+                yield (doc,) + result
 
     def symmetry(self, symprec=1e-3):
         """Compute space group with spglib."""
-        from matador.utils.cell_utils import doc2spg
-        import spglib as spg
-
-        print("Refining symmetries...")
-        if self.mode == "display":
-            print_warning("{}".format("At symprec: " + str(symprec)))
-            print_warning("{:^36}{:^16}{:^16}".format("text_id", "new sg", "old sg"))
-        for _, doc in enumerate(self.cursor):
-            try:
-                spg_cell = doc2spg(doc)
-                sg = spg.get_spacegroup(spg_cell, symprec=symprec).split(" ")[0]
-                if sg != doc["space_group"]:
-                    self.changed_count += 1
-                    self.diff_cursor.append(doc)
-                    if self.mode == "display":
-                        print_notify(
-                            "{:^36}{:^16}{:^16}".format(
-                                doc["text_id"][0] + " " + doc["text_id"][1],
-                                sg,
-                                doc["space_group"],
-                            )
-                        )
-                    doc["space_group"] = sg
-                else:
-                    if self.mode == "display":
-                        print(
-                            "{:^36}{:^16}{:^16}".format(
-                                doc["text_id"][0] + " " + doc["text_id"][1],
-                                sg,
-                                doc["space_group"],
-                            )
-                        )
-            except Exception:
+        for doc, sg, error in self._refine_in_pool(_refine_symmetry, symprec=symprec):
+            if error is not None:
                 self.failed_count += 1
                 if self.args.get("debug"):
-                    print_exc()
+                    print(repr(error))
                     print_failure("Failed for" + " ".join(doc["text_id"]))
+                continue
+            if sg is not None:
+                self.changed_count += 1
+                self.diff_cursor.append(doc)
+                if self.mode == "display":
+                    print_notify(
+                        "{:^36}{:^16}{:^16}".format(
+                            doc["text_id"][0] + " " + doc["text_id"][1],
+                            sg,
+                            doc["space_group"],
+                        )
+                    )
+                doc["space_group"] = sg
+            else:
+                if self.mode == "display":
+                    print(
+                        "{:^36}{:^16}{:^16}".format(
+                            doc["text_id"][0] + " " + doc["text_id"][1],
+                            doc["space_group"],
+                            doc["space_group"],
+                        )
+                    )
 
     def elem_set(self):
         """Imbue documents with the set of elements,
         i.e. set(doc['atom_types']), for quicker look-up.
 
         """
-        for doc in self.cursor:
-            try:
-                doc["elems"] = list(set(doc["atom_types"]))
-                self.diff_cursor.append(doc)
-                self.changed_count += 1
-            except Exception as oops:
-                if self.args.get("debug"):
-                    print(repr(oops))
-                self.failed_count += 1
+        self._apply_refined_field(_refine_elem_set, "elems")
 
     def add_tag(self):
         """Add a tag to each document."""
-        for _, doc in enumerate(self.cursor):
+        for _, doc in enumerate(self._docs):
             try:
                 if "tags" in doc:
                     if doc["tags"] is None:
@@ -224,7 +404,7 @@ class Refiner:
         """Add a doi to each document."""
         if self.doi.count("/") != 1:
             raise SystemExit("Malformed DOI... please use xxxxx/xxxxx format.")
-        for _, doc in enumerate(self.cursor):
+        for _, doc in enumerate(self._docs):
             try:
                 if "doi" in doc:
                     doc["doi"].append(self.doi)
@@ -241,54 +421,50 @@ class Refiner:
         i.e. the name of the structure, minus file extension.
 
         """
-        from matador.utils.chem_utils import get_root_source
-
-        for _, doc in enumerate(self.cursor):
-            try:
-                if "root_source" in doc:
-                    continue
-                else:
-                    doc["root_source"] = get_root_source(doc["source"])
-                    self.diff_cursor.append(doc)
-                    self.changed_count += 1
-            except Exception as error:
-                print(repr(error))
-                self.failed_count += 1
+        self._apply_refined_field(_refine_root_source, "root_source")
 
     def tidy_pspots(self):
         """Loop over all documents and make sure they only have pspots
         for the elements that exist in the structure.
 
         """
-        for _, doc in enumerate(self.cursor):
-            try:
-                marked_for_del = []
-                atoms = set(doc["atom_types"])
-                for elem in doc["species_pot"]:
-                    if elem not in atoms:
-                        marked_for_del.append(elem)
-                for elem in marked_for_del:
-                    del doc["species_pot"][elem]
-                    self.diff_cursor.append(doc)
-                    self.changed_count += 1
-            except Exception as error:
+        self._apply_refined_field(_refine_pspots, "species_pot")
+
+    def _apply_refined_field(self, worker, field):
+        """Run a refine function over all documents and update
+        the field of those that changed.
+
+        """
+        for doc, value, error in self._refine_in_pool(worker):
+            if error is not None:
                 print(repr(error))
                 self.failed_count += 1
+            elif value is not None:
+                doc[field] = value
+                self.diff_cursor.append(doc)
+                self.changed_count += 1
 
     def add_raw_data(self):
         """Loop over all documents in the query and try to open the files
-        listed under their `source` fields, storing them under the `_raw` key.
+        listed under their `source` fields, storing them compressed under
+        the `_raw` key (see :mod:`matador.db.raw`), until the total compressed
+        size of the document's files reaches `raw_max_size`.
 
         """
+        from matador.db.raw import compress_raw_file, RAW_MAX_SIZE
 
-        for _, doc in enumerate(self.cursor):
+        max_size = self.args.get("raw_max_size") or RAW_MAX_SIZE
+        for _, doc in enumerate(self._docs):
             try:
                 sources = doc["source"]
                 raw_files = []
+                budget = max_size
                 for source in sources:
                     if os.path.isfile(source):
-                        with open(source, "r") as f:
-                            raw_files.append((source, f.readlines()))
+                        entry = compress_raw_file(source, max_size=budget)
+                        if entry is not None:
+                            raw_files.append(entry)
+                            budget -= len(entry["data"])
 
                 doc["_raw"] = raw_files
                 self.diff_cursor.append(doc)
@@ -296,3 +472,72 @@ class Refiner:
             except Exception as error:
                 print(repr(error))
                 self.failed_count += 1
+
+
+def _refine_doc_worker(doc, function=None, kwargs=None):
+    """Process pool wrapper for the `_refine_*` functions that returns
+    any exception for the parent process to handle, rather than raising
+    it inside the pool.
+
+    Returns:
+        (object, Exception): the new value of the field (None if unchanged),
+            and any exception raised.
+
+    """
+    try:
+        return function(doc, **(kwargs or {})), None
+    except Exception as exc:
+        return None, exc
+
+
+def _refine_symmetry(doc, symprec=1e-3):
+    """Return the spglib space group of the structure, if it has changed."""
+    from matador.utils.cell_utils import get_spacegroup_spg
+
+    sg = get_spacegroup_spg(doc, symprec=symprec)
+    if sg != doc["space_group"]:
+        return sg
+    return None
+
+
+def _refine_elem_set(doc):
+    """Return the set of elements in the structure."""
+    return list(set(doc["atom_types"]))
+
+
+def _refine_root_source(doc):
+    """Return the root source of the structure, if it is missing."""
+    from matador.utils.chem_utils import get_root_source
+
+    if "root_source" in doc:
+        return None
+    return get_root_source(doc["source"])
+
+
+def _refine_pspots(doc):
+    """Return the pseudopotentials of only the elements in the structure,
+    if any others are present.
+
+    """
+    atoms = set(doc["atom_types"])
+    if all(elem in atoms for elem in doc["species_pot"]):
+        return None
+    return {
+        elem: doc["species_pot"][elem] for elem in doc["species_pot"] if elem in atoms
+    }
+
+
+# the fields of each document needed by each of the refine functions
+_REFINE_KEYS = {
+    _refine_symmetry: (
+        "lattice_cart",
+        "lattice_abc",
+        "positions_frac",
+        "atom_types",
+        "site_occupancy",
+        "space_group",
+    ),
+    _refine_elem_set: ("atom_types",),
+    _refine_root_source: ("root_source", "source"),
+    _refine_pspots: ("atom_types", "species_pot"),
+}
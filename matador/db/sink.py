@@ -0,0 +1,233 @@
+# coding: utf-8
+# Distributed under the terms of the MIT License.
+
+""" This file implements a buffered sink that streams finished
+calculations straight into a database collection, without the files
+needing to be re-scraped by a separate import.
+
+"""
+
+
+import os
+import copy
+import random
+import datetime
+import logging
+
+from pymongo.errors import BulkWriteError
+
+from matador.db.importer import check_dft_quality
+from matador.utils.chem_utils import get_root_source
+from matador.utils.db_utils import WORDS, NOUNS
+
+LOG = logging.getLogger("run3")
+
+
+class DatabaseSink:
+    """Buffer the documents of finished calculations and insert them into
+    a collection in batches, skipping any document whose `root_source`
+    is already present in the collection or has already been pushed.
+
+    Documents are checked and labelled as they would be by
+    :class:`matador.db.importer.Spatula`, and only those that pass all
+    quality checks are inserted. Each batch is recorded as a changeset in
+    the `__changelog_<collection>` collection, so that it can be viewed
+    and undone with `matador changes`.
+
+    Example:
+
+        >>> with DatabaseSink(collection, batch_size=50) as sink:
+        ...     ComputeTask(..., result_sink=sink)
+
+    """
+
+    def __init__(self, collection, batch_size=100, tags=None, changelog=None):
+        """Initialise an empty buffer for the given collection.
+
+        Parameters:
+            collection (pymongo.collection.Collection): the collection to
+                insert into, or any object with the same `find` and
+                `insert_many` methods.
+
+        Keyword arguments:
+            batch_size (int): the number of documents to buffer before
+                inserting them.
+            tags (list): tags to add to each inserted document.
+            changelog (pymongo.collection.Collection): the collection to
+                record changesets in, defaulting to the changelog of
+                `collection` in the same database.
+
+        """
+        self.collection = collection
+        if changelog is None:
+            changelog = collection.database["__changelog_{}".format(collection.name)]
+        self.changelog = changelog
+        self.batch_size = batch_size
+        self.tags = tags
+        self.buffer = []
+        self.num_inserted = 0
+        self.num_skipped = 0
+        self._seen = set()
+
+    def push(self, doc):
+        """Add a copy of a finished calculation to the buffer, flushing the
+        buffer if it is full.
+
+        Parameters:
+            doc (dict): the scraped calculation, including its `source`.
+
+        Returns:
+            bool: True if the document was buffered, False if it was a
+                duplicate or failed the quality checks.
+
+        """
+        doc = copy.deepcopy(doc)
+        root_source = get_root_source(doc)
+        if root_source in self._seen:
+            LOG.debug("Skipping duplicate result {}".format(root_source))
+            self.num_skipped += 1
+            return False
+
+        doc["root_source"] = root_source
+        if "elems" not in doc:
+            doc["elems"] = sorted(list(set(doc["atom_types"])))
+        doc["quality"], failed_checks = check_dft_quality(doc)
+        if doc["quality"] != 5:
+            LOG.warning(
+                "Not inserting {} as it failed quality checks: {}".format(
+                    root_source, failed_checks
+                )
+            )
+            self.num_skipped += 1
+            return False
+
+        doc["text_id"] = [
+            WORDS[random.randint(0, len(WORDS) - 1)].strip(),
+            NOUNS[random.randint(0, len(NOUNS) - 1)].strip(),
+        ]
+        if self.tags is not None:
+            doc["tags"] = self.tags
+
+        self._seen.add(root_source)
+        self.buffer.append(doc)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+        return True
+
+    def flush(self):
+        """Insert all buffered documents that are not already in the
+        collection, with one query and one bulk insert, and record the
+        inserted documents as a changeset. The buffer is only emptied once
+        the changeset has been recorded. Any documents that the collection
+        refuses to insert are skipped with an error in the log; their files
+        are still in the completed folder, so they can be imported later.
+
+        Returns:
+            int: the number of documents inserted.
+
+        """
+        if not self.buffer:
+            return 0
+
+        root_sources = [doc["root_source"] for doc in self.buffer]
+        existing = {
+            doc["root_source"]
+            for doc in self.collection.find(
+                {"root_source": {"$in": root_sources}}, {"root_source": 1}
+            )
+        }
+        new_docs = [doc for doc in self.buffer if doc["root_source"] not in existing]
+
+        inserted = new_docs
+        if new_docs:
+            try:
+                self.collection.insert_many(new_docs, ordered=False)
+            except BulkWriteError as exc:
+                failed = {error["index"] for error in exc.details["writeErrors"]}
+                inserted = [
+                    doc for ind, doc in enumerate(new_docs) if ind not in failed
+                ]
+                LOG.error(
+                    "Failed to insert {} results into {}: {}".format(
+                        len(failed),
+                        self.collection.name,
+                        ", ".join(new_docs[ind]["root_source"] for ind in failed),
+                    )
+                )
+            # the ObjectIds are added to each document as it is inserted
+            if inserted:
+                self._update_changelog(inserted, [doc["_id"] for doc in inserted])
+
+        self.buffer = []
+        self.num_inserted += len(inserted)
+        self.num_skipped += len(root_sources) - len(inserted)
+        LOG.info(
+            "Inserted {} results into {}, skipping {} already present.".format(
+                len(inserted), self.collection.name, len(existing)
+            )
+        )
+
+        return len(inserted)
+
+    def _update_changelog(self, docs, id_list):
+        """Record the inserted documents as a changeset in the same
+        format as :class:`matador.db.importer.Spatula`.
+
+        Parameters:
+            docs (list): the inserted documents.
+            id_list (list): the ObjectIds of the inserted documents.
+
+        """
+        changes = {
+            "date": datetime.datetime.today(),
+            "count": len(id_list),
+            "id_list": list(id_list),
+            "src_list": [doc["root_source"] for doc in docs],
+            "path_list": sorted(
+                {os.path.dirname(src) for doc in docs for src in doc["source"]}
+            ),
+        }
+        self.changelog.insert_one(changes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+
+class QueueSink:
+    """Forward the documents of finished calculations through a queue to
+    a :class:`DatabaseSink` in another process, e.g. from the processes of
+    packed jobs to their parent :class:`matador.compute.BatchRun`, such that
+    one sink batches the results of all of them.
+
+    """
+
+    def __init__(self, queue):
+        """Initialise the sink around the given queue.
+
+        Parameters:
+            queue (multiprocessing.Queue): the queue to put documents on,
+                e.g. a managed queue shared with the parent process.
+
+        """
+        self.queue = queue
+
+    def push(self, doc):
+        """Put a finished calculation on the queue.
+
+        Parameters:
+            doc (dict): the scraped calculation, including its `source`.
+
+        Returns:
+            bool: True, as all checks are left to the receiving sink.
+
+        """
+        self.queue.put(doc)
+        return True
+
+    def flush(self):
+        """Nothing is buffered, so there is nothing to flush."""
+        return 0
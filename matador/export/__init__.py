@@ -12,6 +12,7 @@ Currently supported formats:
     - XCrysden's .xsf
     - the custom .res file format based on SHELX used first by AIRSS
         (https://www.mtg.msm.cam.ac.uk/Codes/AIRSS)
+    - columnar Parquet and HDF5 tables of many structures at once
 
 """
 
@@ -25,6 +26,8 @@ __all__ = [
     "doc2xsf",
     "query2files",
     "doc2arbitrary",
+    "query2table",
+    "table2query",
 ]
 __author__ = "Matthew Evans"
 __maintainer__ = "Matthew Evans"
@@ -33,3 +36,4 @@ __maintainer__ = "Matthew Evans"
 from .export import doc2param, doc2cell, doc2pdb
 from .export import doc2pwscf, doc2res, doc2xsf, doc2arbitrary
 from .export import query2files
+from .columnar import query2table, table2query
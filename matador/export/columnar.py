@@ -0,0 +1,534 @@
+# coding: utf-8
+# Distributed under the terms of the MIT License.
+
+""" This file implements the export of many structures at once to a
+single columnar table, in either the Parquet or HDF5 format, as
+training data for e.g. machine learning pipelines.
+
+Each field of the documents becomes one typed column:
+
+    - scalar fields (bools, ints, floats and strings) are stored as
+      1-D arrays with one entry per structure,
+    - arrays with the same shape in every structure, e.g. `lattice_cart`,
+      are stored as a single array with an extra leading axis,
+    - ragged arrays, e.g. the per-atom `positions_frac`, `atom_types` and
+      `forces`, are stored as one flat array of all their rows, plus an
+      array of offsets into it, such that the values for structure `i` are
+      `values[offsets[i]:offsets[i+1]]`,
+    - any other fields, e.g. `stoichiometry` or nested dictionaries, are
+      stored as a column of JSON strings, with any values that are not
+      JSON serializable (e.g. ObjectIds) stored as strings.
+
+Fields that are missing from some structures are stored alongside a
+boolean column of which structures contain them.
+
+"""
+
+import os
+import json
+
+import numpy as np
+
+__all__ = ["query2table", "table2query", "ColumnarTable", "RaggedArray"]
+
+_FORMATS = {".parquet": "parquet", ".pq": "parquet", ".h5": "hdf5", ".hdf5": "hdf5"}
+_METADATA_KEY = b"matador"
+_PRESENT_SUFFIX = "@present"
+
+
+class RaggedArray:
+    """A column of arrays with different lengths, stored as one flat
+    array of values and the offsets of each row into it.
+
+    Parameters:
+        values (np.ndarray): the concatenated values of every row.
+        offsets (np.ndarray): integer array of length one more than
+            the number of rows.
+
+    """
+
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, ind):
+        if ind < 0:
+            ind += len(self)
+        return self.values[self.offsets[ind] : self.offsets[ind + 1]]
+
+    @property
+    def lengths(self):
+        """The number of values in each row."""
+        return np.diff(self.offsets)
+
+
+class ColumnarTable:
+    """The columns of a table written by :func:`query2table`, as numpy
+    arrays or :class:`RaggedArray` objects, indexed by field name.
+
+    Example:
+
+        >>> table = table2query("structures.parquet")
+        >>> table["enthalpy_per_atom"]
+        array([-1234.5, ...])
+        >>> table["positions_frac"][0]
+        array([[0. , 0. , 0. ], [0.5, 0.5, 0.5]])
+        >>> docs = table.to_dicts()
+
+    """
+
+    def __init__(self, columns, present=None, kinds=None, num_rows=None):
+        """Initialise the table from its columns.
+
+        Parameters:
+            columns (dict): the arrays for each field.
+
+        Keyword arguments:
+            present (dict): boolean arrays of which rows contain each field,
+                for fields that are missing from some rows.
+            kinds (dict): how each field was tabulated, one of "scalar",
+                "array", "ragged" or "json".
+            num_rows (int): the number of rows in the table.
+
+        """
+        self.columns = columns
+        self.present = present or {}
+        self.kinds = kinds or {}
+        if num_rows is None:
+            num_rows = len(next(iter(columns.values()))) if columns else 0
+        self.num_rows = num_rows
+
+    @property
+    def fields(self):
+        """The names of all columns in the table."""
+        return list(self.columns.keys())
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, field):
+        return self.columns[field]
+
+    def __contains__(self, field):
+        return field in self.columns
+
+    def to_dicts(self):
+        """Reconstruct the original documents from the table.
+
+        Returns:
+            :obj:`list` of :obj:`dict`: one document per row, containing
+                Python lists and scalars rather than numpy arrays.
+
+        """
+        docs = [dict() for _ in range(self.num_rows)]
+        for field, column in self.columns.items():
+            if isinstance(column, RaggedArray):
+                flat = column.values.tolist()
+                offsets = column.offsets.tolist()
+                values = [
+                    flat[offsets[ind] : offsets[ind + 1]]
+                    for ind in range(self.num_rows)
+                ]
+            else:
+                values = column.tolist()
+
+            convert = json.loads if self.kinds.get(field) == "json" else None
+            present = self.present.get(field)
+            present = [True] * self.num_rows if present is None else present.tolist()
+            for doc, value, exists in zip(docs, values, present):
+                if exists:
+                    doc[field] = value if convert is None else convert(value)
+
+        return docs
+
+
+def query2table(cursor, fname, fields=None, fmt=None):
+    """Write a list of structures to a single columnar Parquet or
+    HDF5 file, with one row per structure.
+
+    Parameters:
+        cursor (:obj:`list` of :obj:`dict`): the structures to write;
+            any other iterable, e.g. a pymongo cursor, is read into a list.
+        fname (str): the filename to write to.
+
+    Keyword arguments:
+        fields (:obj:`list` of :obj:`str`): the fields to write, defaulting
+            to every field found in any of the structures.
+        fmt (str): either "parquet" or "hdf5", otherwise inferred from the
+            extension of `fname` (.parquet/.pq or .h5/.hdf5).
+
+    Returns:
+        ColumnarTable: the table that was written.
+
+    """
+    fmt = _get_format(fname, fmt)
+    docs = list(cursor)
+
+    if fields is None:
+        fields = {}
+        for doc in docs:
+            fields.update(dict.fromkeys(doc))
+        fields = list(fields)
+
+    columns = {}
+    present = {}
+    kinds = {}
+    for field in fields:
+        mask = np.fromiter((field in doc for doc in docs), dtype=bool, count=len(docs))
+        if not mask.any():
+            continue
+        values = [doc[field] for doc in docs if field in doc]
+        kinds[field], column = _tabulate(values)
+        if not mask.all():
+            present[field] = mask
+            column = _fill_missing(column, mask)
+        columns[field] = column
+
+    table = ColumnarTable(columns, present=present, kinds=kinds, num_rows=len(docs))
+    if fmt == "parquet":
+        _write_parquet(table, fname)
+    else:
+        _write_hdf5(table, fname)
+
+    return table
+
+
+def table2query(fname, fields=None, fmt=None):
+    """Read a table written by :func:`query2table`.
+
+    Parameters:
+        fname (str): the filename to read.
+
+    Keyword arguments:
+        fields (:obj:`list` of :obj:`str`): the fields to read, defaulting
+            to all of them.
+        fmt (str): either "parquet" or "hdf5", otherwise inferred from the
+            extension of `fname`.
+
+    Returns:
+        ColumnarTable: the columns of the table, which can be converted
+            back into documents with :meth:`ColumnarTable.to_dicts`.
+
+    """
+    fmt = _get_format(fname, fmt)
+    if fmt == "parquet":
+        return _read_parquet(fname, fields)
+    return _read_hdf5(fname, fields)
+
+
+def _get_format(fname, fmt):
+    """Check the requested format, or infer it from the file extension."""
+    if fmt is None:
+        fmt = _FORMATS.get(os.path.splitext(fname)[-1].lower())
+    if fmt not in _FORMATS.values():
+        raise RuntimeError(
+            "Unable to determine table format for {}, please choose one of "
+            "{}".format(fname, sorted(set(_FORMATS.values())))
+        )
+    return fmt
+
+
+def _tabulate(values):
+    """Choose the most specific column type that can hold every value
+    of a field exactly.
+
+    Parameters:
+        values (list): the value of the field in each structure that has it.
+
+    Returns:
+        (str, np.ndarray/RaggedArray): the kind of column and its data.
+
+    """
+    if all(isinstance(value, (bool, np.bool_)) for value in values):
+        return "scalar", np.asarray(values, dtype=bool)
+
+    if all(isinstance(value, str) for value in values):
+        return "scalar", np.asarray(values, dtype=str)
+
+    if all(
+        isinstance(value, (int, float, np.integer, np.floating))
+        and not isinstance(value, (bool, np.bool_))
+        for value in values
+    ):
+        column = np.asarray(values)
+        if column.dtype.kind in "iuf":
+            return "scalar", column
+
+    if all(isinstance(value, (list, tuple, np.ndarray)) for value in values):
+        column = _tabulate_arrays(values)
+        if column is not None:
+            return column
+
+    # values that are not JSON serializable, e.g. ObjectIds, are stored as strings
+    return "json", np.asarray(
+        [json.dumps(value, default=str) for value in values], dtype=str
+    )
+
+
+def _tabulate_arrays(values):
+    """Stack or concatenate a list of numeric arrays, or 1-D arrays of
+    strings, returning None if they cannot be tabulated exactly.
+    """
+    arrays = []
+    for value in values:
+        try:
+            array = np.asarray(value)
+        except ValueError:
+            return None
+        if array.dtype.kind == "U":
+            # mixed lists such as stoichiometries are cast to strings by numpy
+            if array.ndim != 1 or not all(isinstance(item, str) for item in value):
+                return None
+        elif array.dtype.kind not in "biuf" or array.ndim == 0:
+            return None
+        arrays.append(array)
+
+    if len({array.dtype.kind == "U" for array in arrays}) != 1:
+        return None
+
+    shapes = {array.shape for array in arrays}
+    if len(shapes) == 1:
+        # rows of empty arrays are left to be stored as JSON
+        if 0 in arrays[0].shape:
+            return None
+        return "array", np.stack(arrays)
+
+    # empty rows have no trailing shape to check
+    trailing = {array.shape[1:] for array in arrays if len(array)}
+    if len(trailing) > 1 or 0 in next(iter(trailing), ()):
+        return None
+    trailing = next(iter(trailing), ())
+    arrays = [
+        array if len(array) else array.reshape((0,) + trailing) for array in arrays
+    ]
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum([len(array) for array in arrays], out=offsets[1:])
+    return "ragged", RaggedArray(np.concatenate(arrays), offsets)
+
+
+def _fill_missing(column, mask):
+    """Expand a column to include empty rows for the structures
+    that are missing the field.
+    """
+    if isinstance(column, RaggedArray):
+        lengths = np.zeros(len(mask), dtype=np.int64)
+        lengths[mask] = column.lengths
+        offsets = np.zeros(len(mask) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return RaggedArray(column.values, offsets)
+
+    full = np.zeros((len(mask),) + column.shape[1:], dtype=column.dtype)
+    full[mask] = column
+    return full
+
+
+def _column_metadata(table):
+    """Return the metadata needed to reconstruct each column."""
+    metadata = {"num_rows": table.num_rows, "columns": {}}
+    for field, column in table.columns.items():
+        values = column.values if isinstance(column, RaggedArray) else column
+        metadata["columns"][field] = {
+            "kind": table.kinds[field],
+            "shape": list(values.shape[1:]),
+            "present": field in table.present,
+        }
+    return metadata
+
+
+def _encode_strings(values):
+    """Dictionary encode an array of strings, which are typically
+    repeated many times (e.g. element symbols), as integer codes into
+    an array of the UTF-8 encoded unique values.
+    """
+    categories, codes = np.unique(values.reshape(-1), return_inverse=True)
+    codes = codes.astype(np.int32).reshape(values.shape)
+    return codes, np.char.encode(categories, "utf-8")
+
+
+def _decode_strings(codes, categories):
+    """Invert :func:`_encode_strings`."""
+    if categories.dtype.kind == "S":
+        if categories.size and (categories.view(np.uint8) >= 128).any():
+            categories = np.char.decode(categories, "utf-8")
+        else:
+            # much faster than decoding each string, but only valid for ASCII
+            categories = categories.astype(str)
+    return categories[codes]
+
+
+def _write_parquet(table, fname):
+    """Write the table to a Parquet file, with ragged columns as large
+    list arrays, which are themselves stored as offsets and flat values.
+    Any trailing axes are flattened into the rows, and strings are
+    dictionary encoded.
+    """
+    pa, pq = _import_pyarrow()
+
+    arrays = {}
+    encoded = []
+    for field, column in table.columns.items():
+        ragged = isinstance(column, RaggedArray)
+        values = column.values if ragged else column
+        stride = int(np.prod(values.shape[1:], dtype=np.int64))
+        if values.dtype.kind == "U":
+            codes, categories = _encode_strings(values)
+            flat = pa.DictionaryArray.from_arrays(
+                pa.array(codes.reshape(-1)), pa.array(categories, type=pa.binary())
+            )
+            encoded.append(field)
+        else:
+            flat = pa.array(values.reshape(-1))
+        if ragged:
+            offsets = pa.array(column.offsets * stride, type=pa.int64())
+            arrays[field] = pa.LargeListArray.from_arrays(offsets, flat)
+        elif values.ndim > 1:
+            arrays[field] = pa.FixedSizeListArray.from_arrays(flat, stride)
+        else:
+            arrays[field] = flat
+        if field in table.present:
+            arrays[field + _PRESENT_SUFFIX] = pa.array(table.present[field])
+
+    metadata = {_METADATA_KEY: json.dumps(_column_metadata(table)).encode("utf-8")}
+    pa_table = pa.table(arrays, metadata=metadata)
+    pq.write_table(pa_table, fname, use_dictionary=encoded)
+
+
+def _read_parquet(fname, fields):
+    """Read the columns of a Parquet file written by :func:`query2table`."""
+    pa, pq = _import_pyarrow()
+
+    schema = pq.read_schema(fname)
+    metadata = json.loads(schema.metadata[_METADATA_KEY])
+    fields = _check_fields(fname, metadata, fields)
+
+    columns_to_read = []
+    for field in fields:
+        columns_to_read.append(field)
+        if metadata["columns"][field]["present"]:
+            columns_to_read.append(field + _PRESENT_SUFFIX)
+
+    pa_table = pq.read_table(fname, columns=columns_to_read).unify_dictionaries()
+
+    columns = {}
+    present = {}
+    kinds = {}
+    for field in fields:
+        info = metadata["columns"][field]
+        kinds[field] = info["kind"]
+        array = pa_table.column(field).combine_chunks()
+        if info["kind"] == "ragged" or info["shape"]:
+            offsets = array.offsets.to_numpy() if info["kind"] == "ragged" else None
+            array = array.flatten()
+        if isinstance(array, pa.DictionaryArray):
+            values = _decode_strings(
+                array.indices.to_numpy(),
+                array.dictionary.to_numpy(zero_copy_only=False).astype(bytes),
+            )
+        else:
+            values = array.to_numpy(zero_copy_only=False)
+        values = values.reshape([-1] + info["shape"])
+        if info["kind"] == "ragged":
+            stride = max(1, int(np.prod(info["shape"], dtype=np.int64)))
+            columns[field] = RaggedArray(values, (offsets - offsets[0]) // stride)
+        else:
+            columns[field] = values
+        if info["present"]:
+            present[field] = (
+                pa_table.column(field + _PRESENT_SUFFIX)
+                .combine_chunks()
+                .to_numpy(zero_copy_only=False)
+            )
+
+    return ColumnarTable(
+        columns, present=present, kinds=kinds, num_rows=metadata["num_rows"]
+    )
+
+
+def _write_hdf5(table, fname):
+    """Write the table to an HDF5 file, with one group per column containing
+    its values and, if needed, its offsets and which rows contain it.
+    Strings are dictionary encoded, with their unique values stored as
+    fixed-length UTF-8 encoded bytes.
+    """
+    h5py = _import_h5py()
+
+    with h5py.File(fname, "w") as f:
+        f.attrs["matador"] = json.dumps(_column_metadata(table))
+        for field, column in table.columns.items():
+            group = f.create_group(field)
+            if isinstance(column, RaggedArray):
+                group.create_dataset("offsets", data=column.offsets)
+                values = column.values
+            else:
+                values = column
+            if values.dtype.kind == "U":
+                values, categories = _encode_strings(values)
+                group.create_dataset("categories", data=categories)
+            group.create_dataset("values", data=values)
+            if field in table.present:
+                group.create_dataset("present", data=table.present[field])
+
+
+def _read_hdf5(fname, fields):
+    """Read the columns of an HDF5 file written by :func:`query2table`."""
+    h5py = _import_h5py()
+
+    columns = {}
+    present = {}
+    kinds = {}
+    with h5py.File(fname, "r") as f:
+        metadata = json.loads(f.attrs["matador"])
+        fields = _check_fields(fname, metadata, fields)
+        for field in fields:
+            info = metadata["columns"][field]
+            kinds[field] = info["kind"]
+            group = f[field]
+            values = group["values"][()]
+            if "categories" in group:
+                values = _decode_strings(values, group["categories"][()])
+            if info["kind"] == "ragged":
+                columns[field] = RaggedArray(values, group["offsets"][()])
+            else:
+                columns[field] = values
+            if info["present"]:
+                present[field] = group["present"][()]
+
+    return ColumnarTable(
+        columns, present=present, kinds=kinds, num_rows=metadata["num_rows"]
+    )
+
+
+def _check_fields(fname, metadata, fields):
+    """Check that the requested fields exist in the table."""
+    if fields is None:
+        return list(metadata["columns"])
+    missing = [field for field in fields if field not in metadata["columns"]]
+    if missing:
+        raise RuntimeError("Fields {} not found in {}".format(missing, fname))
+    return list(fields)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise ImportError(
+            "Optional dependency 'pyarrow' is missing, please install it from PyPI "
+            "with `pip install pyarrow` to write Parquet files."
+        ) from exc
+    return pyarrow, pyarrow.parquet
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError as exc:
+        raise ImportError(
+            "Optional dependency 'h5py' is missing, please install it from PyPI "
+            "with `pip install h5py` to write HDF5 files."
+        ) from exc
+    return h5py
@@ -7,6 +7,7 @@ documents or Crystal objects.
 
 import os
 import warnings
+from itertools import islice
 
 import numpy as np
 import pymongo as pm
@@ -21,6 +22,7 @@ from matador.utils.chem_utils import (
 )
 from matador.swaps import AtomicSwapper
 from .utils import file_writer_function, generate_relevant_path, generate_hash
+from .utils import ArchiveWriter, write_text_file, get_writer_path, lines_to_text
 
 EPS = 1e-8
 
@@ -41,6 +43,8 @@ def query2files(
     latex=False,
     subcmd=None,
     argstr=None,
+    archive=None,
+    workers=None,
     **kwargs
 ):
     """Many-to-many convenience function for many structures being written to
@@ -48,17 +52,31 @@ def query2files(
 
     Parameters:
         cursor (:obj:`list` of :obj:`dict`/:class:`AtomicSwapper`): list of matador dictionaries to write out.
+            Any other iterable, e.g. a lazy :class:`AtomicSwapper` or the generator from
+            :meth:`AtomicSwapper.iter_swaps`, is streamed to files one structure at a time,
+            without writing the markdown or LaTeX summaries.
 
     Keyword arguments:
         dirname (str): the folder to save the results into. Will be created if non-existent.
             Will have integer appended to it if already existing.
         max_files (int): if the number of files to be written exceeds this number, then raise RuntimeError.
+            For streamed cursors, this is only raised once the limit is reached.
+        archive (str): one of "tar", "tar.gz" or "zip", to write all files into the single
+            archive `<dirname>.<archive>` instead of a folder. Each member is identical to the
+            file that would otherwise have been written, and `max_files` does not apply.
+        workers (int): if greater than 1, format the files in a pool of this many processes.
+            Only cell, param, res and json files can be written with `archive` or `workers`.
         **kwargs (dict): dictionary of {filetype: bool(whether to write)}. Accepted file types
             are cell, param, res, pdb, json, xsf, markdown and latex.
 
     """
     multiple_files = any((cell, param, res, pdb, xsf))
     prefix = prefix + "-" if prefix is not None else ""
+    formatted = archive is not None or (workers is not None and workers > 1)
+    if formatted and (pdb or xsf):
+        raise RuntimeError(
+            "Writing .pdb or .xsf files is not supported with `archive` or `workers`."
+        )
 
     if isinstance(cursor, AtomicSwapper):
         cursor = cursor.cursor
@@ -71,18 +89,24 @@ def query2files(
         info = True
         hash_dupe = False
 
+    streamed = False
     if isinstance(cursor, list):
         num = len(cursor)
-    else:
+    elif isinstance(cursor, pm.cursor.Cursor):
         num = cursor.count()
+    else:
+        streamed = True
+        num = None
 
     if top is not None:
-        if top < num:
+        if num is None or top < num:
             num = top
 
-    num_files = num * sum(1 for ext in [cell, param, res, pdb, xsf] if ext)
+    files_per_doc = sum(1 for ext in [cell, param, res, pdb, xsf] if ext)
+    check_max_files = multiple_files and archive is None
 
-    if multiple_files:
+    if check_max_files and not streamed:
+        num_files = num * files_per_doc
         if num_files > max_files:
             raise RuntimeError(
                 "Not writing {} files as it exceeds argument `max_files` limit of {}".format(
@@ -95,99 +119,256 @@ def query2files(
 
     _dir = False
     dir_counter = 0
-    # postfix integer on end of directory name if it exists
+    # postfix integer on end of directory (or archive) name if it exists
     while not _dir:
         if dir_counter != 0:
             directory = dirname + str(dir_counter)
         else:
             directory = dirname
-        if not os.path.isdir(directory):
+        if archive is not None:
+            if not os.path.exists("{}.{}".format(directory, archive)):
+                _dir = True
+            else:
+                dir_counter += 1
+        elif not os.path.isdir(directory):
             os.makedirs(directory)
             _dir = True
         else:
             dir_counter += 1
 
-    for _, doc in enumerate(cursor[:num]):
-        # generate an appropriate filename for the structure
-        root_source = get_root_source(doc)
+    if streamed:
+        docs = islice(cursor, num)
+    else:
+        docs = cursor[:num]
+
+    def _docs_with_paths():
+        for ind, doc in enumerate(docs):
+            if streamed and check_max_files and (ind + 1) * files_per_doc > max_files:
+                raise RuntimeError(
+                    "Stopped writing files after reaching argument `max_files` limit of {}".format(
+                        max_files
+                    )
+                )
+            name = _get_query_file_name(doc, subcmd)
+            path = "{directory}/{prefix}{name}".format(
+                directory=directory, prefix=prefix, name=name
+            )
+            yield doc, path
+
+    archive_writer = None
+    if archive is not None:
+        archive_writer = ArchiveWriter("{}.{}".format(directory, archive), archive)
+        write_file = archive_writer.write_text_file
+    else:
+        write_file = write_text_file
+
+    try:
+        if formatted:
+            formats = [
+                fmt
+                for fmt, flag in zip(
+                    ["param", "cell", "res", "json"], [param, cell, res, json]
+                )
+                if flag
+            ]
+            for files in _format_query_files(
+                _docs_with_paths(), formats, info, hash_dupe, workers
+            ):
+                for path, text, ext in files:
+                    # json files are always overwritten unless hashed, as in doc2json
+                    overwrite = ext == "json" and not hash_dupe
+                    write_file(
+                        path, text, ext, overwrite=overwrite, hash_dupe=hash_dupe
+                    )
 
-        if "_swapped_stoichiometry" in doc:
-            formula = get_formula_from_stoich(doc["_swapped_stoichiometry"])
         else:
-            formula = get_formula_from_stoich(doc["stoichiometry"])
+            for doc, path in _docs_with_paths():
+                if param:
+                    doc2param(doc, path, hash_dupe=hash_dupe)
+                if cell:
+                    doc2cell(doc, path, hash_dupe=hash_dupe)
+                if res:
+                    doc2res(doc, path, info=info, hash_dupe=hash_dupe)
+                if json:
+                    doc2json(doc, path, hash_dupe=hash_dupe)
+                if pdb:
+                    doc2pdb(doc, path, hash_dupe=hash_dupe)
+                if xsf:
+                    doc2xsf(doc, path)
+
+        # a streamed cursor cannot be rewound to summarise it
+        if streamed:
+            return
+
+        hull = subcmd in ["hull", "voltage"]
+        if isinstance(cursor, pm.cursor.Cursor):
+            cursor.rewind()
+        md_path = "{directory}/{directory}.md".format(directory=directory)
+        md_kwargs = {}
+        md_kwargs.update(kwargs)
+        md_kwargs.update(
+            {"markdown": True, "latex": False, "argstr": argstr, "hull": hull}
+        )
+        md_string = display_results(cursor, **md_kwargs)
+        write_file(md_path, md_string, "md", overwrite=True)
+
+        if latex:
+            if isinstance(cursor, pm.cursor.Cursor):
+                cursor.rewind()
+            tex_path = "{directory}/{directory}.tex".format(directory=directory)
+            tex_kwargs = {}
+            tex_kwargs.update(kwargs)
+            tex_kwargs.update(
+                {"latex": True, "markdown": False, "argstr": argstr, "hull": hull}
+            )
+            tex_string = display_results(cursor, **tex_kwargs)
+            write_file(tex_path, tex_string, "tex", overwrite=True)
 
-        if subcmd == "swaps":
-            root_source = root_source.replace("-swap-", "-")
+    finally:
+        if archive_writer is not None:
+            archive_writer.close()
 
-        name = root_source
 
-        if "OQMD " in root_source:
-            name = "{formula}-OQMD_{src}".format(
-                formula=formula, src=root_source.split(" ")[-1]
-            )
-        elif "mp-" in root_source:
-            name = "{formula}-MP_{src}".format(
-                formula=formula, src=root_source.split("-")[-1]
-            )
-        if "icsd" in doc and "CollCode" not in name:
-            name += "-CollCode{}".format(doc["icsd"])
+def _get_query_file_name(doc, subcmd):
+    """Generate an appropriate filename for the structure when
+    exported by :func:`query2files`.
+
+    Parameters:
+        doc (dict): the structure to name.
+        subcmd (str): the matador subcommand that produced the structure.
+
+    Returns:
+        str: the filename, without folder or extension.
+
+    """
+    root_source = get_root_source(doc)
+
+    if "_swapped_stoichiometry" in doc:
+        formula = get_formula_from_stoich(doc["_swapped_stoichiometry"])
+    else:
+        formula = get_formula_from_stoich(doc["stoichiometry"])
+
+    if subcmd == "swaps":
+        root_source = root_source.replace("-swap-", "-")
+
+    name = root_source
+
+    if "OQMD " in root_source:
+        name = "{formula}-OQMD_{src}".format(
+            formula=formula, src=root_source.split(" ")[-1]
+        )
+    elif "mp-" in root_source:
+        name = "{formula}-MP_{src}".format(
+            formula=formula, src=root_source.split("-")[-1]
+        )
+    if "icsd" in doc and "CollCode" not in name:
+        name += "-CollCode{}".format(doc["icsd"])
+    else:
+        pf_id = None
+        for source in doc["source"]:
+            if "pf-" in source:
+                pf_id = source.split("-")[-1]
+                break
         else:
-            pf_id = None
-            for source in doc["source"]:
-                if "pf-" in source:
-                    pf_id = source.split("-")[-1]
-                    break
+            if "pf_ids" in doc:
+                pf_id = doc["pf_ids"][0]
+        if pf_id is not None:
+            name += "-PF-{}".format(pf_id)
+
+    # if swaps, prepend new composition
+    if subcmd == "swaps":
+        new_formula = get_formula_from_stoich(get_stoich(doc["atom_types"]))
+        name = "{}-swap-{}".format(new_formula, name)
+
+    return name
+
+
+def _format_query_files(docs_with_paths, formats, info, hash_dupe, workers):
+    """Format the files for each structure, optionally in a process pool,
+    yielding them in the order of the input structures. The structures are
+    sent to the pool in bounded batches, such that a lazy cursor is never
+    consumed far ahead of the files being written.
+
+    Parameters:
+        docs_with_paths (iterable): pairs of structures and their paths without extensions.
+        formats (:obj:`list` of :obj:`str`): the file types to format.
+        info (bool): whether to write the info line in res files.
+        hash_dupe (bool): passed to the writer functions.
+        workers (int): the number of processes to use, if greater than 1.
+
+    Yields:
+        :obj:`list` of :obj:`tuple`: the (path, contents, extension) of each file
+            for each structure.
+
+    """
+    from functools import partial
+
+    worker = partial(_format_doc_files, formats=formats, info=info, hash_dupe=hash_dupe)
+
+    if workers is None or workers <= 1:
+        for item in docs_with_paths:
+            files, exc = worker(item)
+            if exc is not None:
+                raise exc
+            yield files
+        return
+
+    import multiprocessing as mp
+
+    chunksize = 16
+    batch_size = 8 * chunksize * workers
+    with mp.Pool(processes=workers) as pool:
+        while True:
+            batch = list(islice(docs_with_paths, batch_size))
+            if not batch:
+                break
+            for files, exc in pool.imap(worker, batch, chunksize=chunksize):
+                if exc is not None:
+                    pool.terminate()
+                    raise exc
+                yield files
+
+
+def _format_doc_files(doc_with_path, formats=None, info=True, hash_dupe=False):
+    """Format the requested files for a single structure, returning any
+    exception for the parent process to raise, rather than raising it
+    inside the pool.
+
+    Parameters:
+        doc_with_path (tuple): the structure and its path without extension.
+
+    Keyword arguments:
+        formats (:obj:`list` of :obj:`str`): the file types to format.
+        info (bool): whether to write the info line in res files.
+        hash_dupe (bool): passed to the writer functions.
+
+    Returns:
+        (list, Exception): the (path, contents, extension) of each file,
+            and any exception raised.
+
+    """
+    doc, path = doc_with_path
+    writers = {"param": doc2param, "cell": doc2cell, "res": doc2res}
+    files = []
+    for fmt in formats:
+        fname = path
+        try:
+            if fmt == "json":
+                if fname.endswith(".json"):
+                    fname = fname.replace(".json", "")
+                fname += ".json"
+                files.append((fname, _doc_to_json_text(doc), "json"))
             else:
-                if "pf_ids" in doc:
-                    pf_id = doc["pf_ids"][0]
-            if pf_id is not None:
-                name += "-PF-{}".format(pf_id)
-
-        # if swaps, prepend new composition
-        if subcmd == "swaps":
-            new_formula = get_formula_from_stoich(get_stoich(doc["atom_types"]))
-            name = "{}-swap-{}".format(new_formula, name)
-
-        path = "{directory}/{prefix}{name}".format(
-            directory=directory, prefix=prefix, name=name
-        )
+                kwargs = {"info": info} if fmt == "res" else {}
+                flines, ext = writers[fmt].__wrapped__(
+                    doc, path, hash_dupe=hash_dupe, **kwargs
+                )
+                fname = get_writer_path(path, ext)
+                files.append((fname, lines_to_text(flines), ext))
+        except Exception as exc:
+            return None, type(exc)("Failed to write {}: {}".format(fname, exc))
 
-        if param:
-            doc2param(doc, path, hash_dupe=hash_dupe)
-        if cell:
-            doc2cell(doc, path, hash_dupe=hash_dupe)
-        if res:
-            doc2res(doc, path, info=info, hash_dupe=hash_dupe)
-        if json:
-            doc2json(doc, path, hash_dupe=hash_dupe)
-        if pdb:
-            doc2pdb(doc, path, hash_dupe=hash_dupe)
-        if xsf:
-            doc2xsf(doc, path)
-
-    hull = subcmd in ["hull", "voltage"]
-    if isinstance(cursor, pm.cursor.Cursor):
-        cursor.rewind()
-    md_path = "{directory}/{directory}.md".format(directory=directory)
-    md_kwargs = {}
-    md_kwargs.update(kwargs)
-    md_kwargs.update({"markdown": True, "latex": False, "argstr": argstr, "hull": hull})
-    md_string = display_results(cursor, **md_kwargs)
-    with open(md_path, "w") as f:
-        f.write(md_string)
-
-    if latex:
-        if isinstance(cursor, pm.cursor.Cursor):
-            cursor.rewind()
-        tex_path = "{directory}/{directory}.tex".format(directory=directory)
-        tex_kwargs = {}
-        tex_kwargs.update(kwargs)
-        tex_kwargs.update(
-            {"latex": True, "markdown": False, "argstr": argstr, "hull": hull}
-        )
-        tex_string = display_results(cursor, **tex_kwargs)
-        with open(tex_path, "w") as f:
-            f.write(tex_string)
+    return files, None
 
 
 @file_writer_function
@@ -673,8 +854,6 @@ def doc2json(doc, path, overwrite=False, hash_dupe=True):
         overwrite (bool): overwrite if filename exists.
 
     """
-    import json
-
     if path.endswith(".json"):
         path = path.replace(".json", "")
 
@@ -684,11 +863,27 @@ def doc2json(doc, path, overwrite=False, hash_dupe=True):
         elif hash_dupe:
             path += "-" + generate_hash()
 
+    with open(path + ".json", "w") as f:
+        f.write(_doc_to_json_text(doc))
+
+
+def _doc_to_json_text(doc):
+    """Return the JSON text of a document as stored in the database,
+    stringifying its ObjectId (in place) so that it can be serialised.
+
+    Parameters:
+        doc (dict): matador document containing structure
+
+    Returns:
+        str: the JSON text to write to file.
+
+    """
+    import json
+
     if "_id" in doc:
         doc["_id"] = str(doc["_id"])
 
-    with open(path + ".json", "w") as f:
-        f.write(json.dumps(doc, skipkeys=True, indent=2))
+    return json.dumps(doc, skipkeys=True, indent=2)
 
 
 def doc2pwscf(doc, path, template=None, spacing=None):
@@ -28,22 +28,16 @@ def file_writer_function(function):
             flines, ext = function(
                 doc, path, overwrite=overwrite, hash_dupe=hash_dupe, **kwargs
             )
-            if ext is not None and not path.endswith("." + ext):
-                path += ".{}".format(ext)
-
-            if os.path.isfile(path):
-                if overwrite:
-                    os.remove(path)
-                elif hash_dupe:
-                    path = "{}-{}.{}".format(
-                        path.replace(ext, ""), generate_hash(), ext
-                    )
-                else:
-                    return False
-
-            with open(path, "w") as f:
-                for line in flines:
-                    f.write(line + "\n")
+            path = get_writer_path(path, ext)
+            written = write_text_file(
+                path,
+                lines_to_text(flines),
+                ext,
+                overwrite=overwrite,
+                hash_dupe=hash_dupe,
+            )
+            if written is None:
+                return False
 
         except Exception as exc:
             raise type(exc)("Failed to write {}: {}".format(path, exc))
@@ -51,6 +45,161 @@ def file_writer_function(function):
     return wrapped_writer
 
 
+def get_writer_path(path, ext):
+    """Return the path with the extension returned by a writer function appended."""
+    if ext is not None and not path.endswith("." + ext):
+        path += ".{}".format(ext)
+    return path
+
+
+def lines_to_text(flines):
+    """Join the lines returned by a writer function into the file contents."""
+    return "".join(line + "\n" for line in flines)
+
+
+def get_dupe_path(path, ext, exists, overwrite=False, hash_dupe=False):
+    """Decide what to do when writing to a path that may already be taken.
+
+    Parameters:
+        path (str): the desired path, including its extension.
+        ext (str): the file extension.
+        exists (callable): returns whether a path is already taken.
+
+    Keyword arguments:
+        overwrite (bool): whether or not to overwrite colliding files.
+        hash_dupe (bool): whether or not to create a unique filename for
+            any colliding files, or just skip writing them.
+
+    Returns:
+        str: the path to write to, or None if the file should be skipped.
+
+    """
+    if exists(path) and not overwrite:
+        if hash_dupe:
+            return "{}-{}.{}".format(path.replace(ext, ""), generate_hash(), ext)
+        return None
+    return path
+
+
+def write_text_file(path, text, ext, overwrite=False, hash_dupe=False):
+    """Write the contents of a file, handling any collisions as
+    described in :func:`file_writer_function`.
+
+    Parameters:
+        path (str): the desired path, including its extension.
+        text (str): the file contents.
+        ext (str): the file extension.
+
+    Keyword arguments:
+        overwrite (bool): whether or not to overwrite colliding files.
+        hash_dupe (bool): whether or not to create a unique filename for
+            any colliding files, or just skip writing them.
+
+    Returns:
+        str: the path written to, or None if the file was skipped.
+
+    """
+    path = get_dupe_path(
+        path, ext, os.path.isfile, overwrite=overwrite, hash_dupe=hash_dupe
+    )
+    if path is None:
+        return None
+    if overwrite and os.path.isfile(path):
+        os.remove(path)
+
+    with open(path, "w") as f:
+        f.write(text)
+
+    return path
+
+
+class ArchiveWriter:
+    """Stream files into a single .tar, .tar.gz or .zip archive, as an
+    alternative to writing many small files. Each member contains exactly
+    the bytes that would have been written to the corresponding file.
+
+    """
+
+    formats = {"tar": "w", "tar.gz": "w:gz", "zip": None}
+
+    def __init__(self, fname, archive_format):
+        """Open the archive for writing.
+
+        Parameters:
+            fname (str): the filename of the archive.
+            archive_format (str): one of "tar", "tar.gz" or "zip".
+
+        """
+        import locale
+
+        if archive_format not in self.formats:
+            raise RuntimeError(
+                "Unknown archive format {}, please choose from {}".format(
+                    archive_format, list(self.formats)
+                )
+            )
+        self.fname = fname
+        self.archive_format = archive_format
+        # match the encoding used by `open` for the individual files
+        self.encoding = locale.getpreferredencoding(False)
+        self.members = set()
+        if archive_format == "zip":
+            import zipfile
+
+            self._archive = zipfile.ZipFile(
+                fname, mode="w", compression=zipfile.ZIP_DEFLATED
+            )
+        else:
+            import tarfile
+
+            self._archive = tarfile.open(fname, mode=self.formats[archive_format])
+
+    def write_text_file(self, path, text, ext, overwrite=False, hash_dupe=False):
+        """Add a file to the archive, handling any collisions with existing
+        members as :func:`write_text_file` does for files.
+
+        Returns:
+            str: the member name written, or None if the file was skipped.
+
+        """
+        path = get_dupe_path(
+            path,
+            ext,
+            lambda name: name in self.members,
+            overwrite=overwrite,
+            hash_dupe=hash_dupe,
+        )
+        if path is None:
+            return None
+
+        data = text.encode(self.encoding)
+        if self.archive_format == "zip":
+            self._archive.writestr(path, data)
+        else:
+            import io
+            import time
+            import tarfile
+
+            info = tarfile.TarInfo(name=path)
+            info.size = len(data)
+            info.mtime = time.time()
+            info.mode = 0o644
+            self._archive.addfile(info, io.BytesIO(data))
+        self.members.add(path)
+
+        return path
+
+    def close(self):
+        """Finish writing the archive."""
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 def generate_hash(hash_len=6):
     """Quick hash generator, based on implementation in PyAIRSS by J. Wynn.
 
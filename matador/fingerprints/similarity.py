@@ -6,13 +6,15 @@ although only PDF has been implemented so far.
 
 """
 
-import copy
+import bisect
+import hashlib
 from collections import defaultdict
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 import numpy as np
 from matador.fingerprints.pdf import PDF, PDFFactory
 from matador.fingerprints.fingerprint import Fingerprint
 from matador.utils.cursor_utils import get_guess_doc_provenance
+from matador.utils.cell_utils import doc2spg, cart2volume, standardize_doc_cell
 
 
 def get_uniq_cursor(
@@ -23,6 +25,9 @@ def get_uniq_cursor(
     fingerprint=PDF,
     hierarchy_order=None,
     hierarchy_values=None,
+    prefilter=False,
+    prefilter_tol=0.05,
+    transitive=False,
     debug=False,
     **fingerprint_calc_args
 ) -> Tuple[List[int], Dict[int, int], List[Fingerprint], np.ndarray]:
@@ -37,6 +42,14 @@ def get_uniq_cursor(
     can be provided through `hierarchy_order`, which must be accompanied by a list
     of values per structure to check against that hierarchy.
 
+    For large cursors, the optional pre-filter avoids the quadratic number of
+    PDF overlaps. Structures with identical canonical hashes (see
+    :func:`get_structure_hash`) are treated as exact duplicates, and full
+    PDF overlaps are only computed between pairs of structures whose cheap,
+    coarse-grained radial distribution descriptors (see
+    :func:`get_structure_descriptor`) are found within `prefilter_tol`
+    of one another by a KD-tree search.
+
     Parameters:
         cursor (list) : matador cursor to be filtered
 
@@ -49,6 +62,14 @@ def get_uniq_cursor(
             energy tolerance (1e20 if enforce_same_stoich is False)
         enforce_same_stoich (bool): compare only structures of the same
             stoichiometry
+        prefilter (bool): whether to use structure hashes and descriptors
+            to skip PDF overlaps between obviously (dis)similar structures.
+        prefilter_tol (float): the RMS distance between structure descriptors
+            below which the full PDF overlap will be computed. The default
+            value is conservative for the default `sim_tol`.
+        transitive (bool): if True, chains of similar structures will be
+            merged into a single set of duplicates, rather than each
+            retained structure only absorbing its direct duplicates.
         debug (bool): print timings and list similarities
         fingerprint_calc_args (dict): kwargs to pass to fingerprint
 
@@ -72,30 +93,36 @@ def get_uniq_cursor(
     print("Calculating fingerprints...")
 
     fingerprint_list = [None for doc in cursor]
-    required_inds = set()
 
     # scipy sparse matrices dont seem to allow non-zero default values, so we'll use a defaultdict
     sim_mat = defaultdict(lambda: 1e10)
+    exact_dupes = dict()
     print("Assessing similarities...")
-    for i in range(len(fingerprint_list)):
-        for j in range(i + 1, len(fingerprint_list)):
-            # are we checking stoichiometries, if so, ensure they're the same
-            if enforce_same_stoich is False or (
-                sorted(cursor[j]["stoichiometry"]) == sorted(cursor[i]["stoichiometry"])
-                and np.abs(
-                    cursor[j].get("enthalpy_per_atom", 0)
-                    - cursor[i].get("enthalpy_per_atom", 0)
-                )
-                < energy_tol
-            ):
-                # need to set both to zero so we can iterate over the dict later
-                sim_mat[i, j] = None
-                sim_mat[j, i] = None
-                required_inds.add(i)
-                required_inds.add(j)
+    if prefilter:
+        pairs, exact_dupes = _get_prefiltered_pairs(
+            cursor,
+            energy_tol,
+            enforce_same_stoich,
+            prefilter_tol=prefilter_tol,
+        )
+        print(
+            "Pre-filter found {} exact duplicates and {} candidate pairs".format(
+                len(exact_dupes), len(pairs)
+            )
+        )
+    else:
+        pairs = _get_candidate_pairs(cursor, energy_tol, enforce_same_stoich)
+
+    required_inds = set()
+    for i, j in pairs:
+        # need to set both to None so we can iterate over the dict later
+        sim_mat[i, j] = None
+        sim_mat[j, i] = None
+        required_inds.add(i)
+        required_inds.add(j)
 
     factory = PDFFactory(
-        cursor, required_inds=list(required_inds), **fingerprint_calc_args
+        cursor, required_inds=sorted(required_inds), **fingerprint_calc_args
     )
 
     for i, j in sim_mat:
@@ -106,36 +133,18 @@ def get_uniq_cursor(
             sim_mat[i, j] = sim
             sim_mat[j, i] = sim
 
-    distinct_set = set()
-    dupe_set = set()
-    dupe_dict = dict()
-    for i in range(len(cursor)):
-        distinct_set.add(i)
-        dupe_dict[i] = set()
-
-    # loop over the similarity matrix and construct the set of "unique" structures
-    # and a dictionary containing their duplicates
-    for i, j in sim_mat:
-        if sim_mat[i, j] <= sim_tol:
-            if i not in dupe_set:
-                if j in distinct_set:
-                    distinct_set.remove(j)
-                    del dupe_dict[j]
-                dupe_set.add(j)
-                dupe_dict[i].add(j)
-
-    total_dupes = len(
-        set(
-            list(dupe_dict.keys())
-            + [item for key in dupe_dict for item in dupe_dict[key]]
-        )
+    for j, rep in exact_dupes.items():
+        sim_mat[rep, j] = 0.0
+        sim_mat[j, rep] = 0.0
+
+    # cluster the structures using the sparse graph of duplicates
+    clusters = _get_duplicate_clusters(
+        sim_mat,
+        sim_tol,
+        len(cursor),
+        exact_dupes=exact_dupes,
+        transitive=transitive,
     )
-    if len(cursor) != total_dupes:
-        raise RuntimeError(
-            "Something went wrong: dupe dict had wrong size {} compared to cursor {}!\nFull output: {}".format(
-                total_dupes, len(cursor), dupe_dict
-            )
-        )
 
     if hierarchy_order is None:
         hierarchy_order = ["ICSD", "DOI", "OQMD", "MP", "PF", "SWAPS", "AIRSS", "GA"]
@@ -143,77 +152,328 @@ def get_uniq_cursor(
         hierarchy_values = [get_guess_doc_provenance(doc["source"]) for doc in cursor]
 
     print("Applying hierarchy of structures with order: {}".format(hierarchy_order))
-    dupe_dict = _enforce_hierarchy(dupe_dict, hierarchy_values, hierarchy_order)
-
-    all_structures = set(
-        list(dupe_dict.keys()) + [item for key in dupe_dict for item in dupe_dict[key]]
-    )
-    if len(cursor) != len(all_structures):
-        raise RuntimeError(
-            "Something went wrong: dupe dict had wrong size {} compared to cursor {}!\nDifference: {}".format(
-                len(all_structures),
-                len(cursor),
-                all_structures.symmetric_difference({i for i in range(len(cursor))}),
-            )
-        )
+    dupe_dict = _enforce_hierarchy(clusters, hierarchy_values, hierarchy_order)
 
     print("Done!")
     return sorted(list(dupe_dict.keys())), dupe_dict, fingerprint_list, sim_mat
 
 
-def _enforce_hierarchy(dupe_dict, values, hierarchy):
+def _get_duplicate_clusters(
+    sim_mat, sim_tol, num_structures, exact_dupes=None, transitive=False
+) -> List[List[int]]:
+    """Find clusters of duplicate structures from the sparse graph with
+    edges between all pairs of structures with similarity distance below
+    the tolerance.
+
+    By default, structures are visited in order and each structure that has
+    not yet been assigned becomes the centre of a new cluster that claims all of
+    its unassigned neighbours. If `transitive`, clusters are instead the
+    connected components of the graph, such that chains of similar structures
+    are merged into a single cluster.
+
+    Parameters:
+        sim_mat (dict): the similarity distances keyed by index pairs.
+        sim_tol (float): the tolerance below which two structures are duplicates.
+        num_structures (int): the total number of structures.
+
+    Keyword arguments:
+        exact_dupes (dict): mapping from the indices of exact duplicates to
+            the structure they duplicate, which they will always share a cluster with.
+        transitive (bool): whether to use the connected components of the graph.
+
+    Returns:
+        list: a list of clusters, each containing the sorted list of
+            indices of its members.
+
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    if num_structures == 0:
+        return []
+
+    edges = np.asarray(
+        [(i, j) for (i, j), sim in sim_mat.items() if sim <= sim_tol and i != j],
+        dtype=int,
+    ).reshape(-1, 2)
+    graph = coo_matrix(
+        (np.ones(len(edges), dtype=bool), (edges[:, 0], edges[:, 1])),
+        shape=(num_structures, num_structures),
+    ).tocsr()
+
+    if transitive:
+        num_clusters, labels = connected_components(graph, directed=False)
+    else:
+        labels = np.full(num_structures, -1, dtype=int)
+        # exact duplicates are excluded here and follow their representative below
+        if exact_dupes:
+            labels[list(exact_dupes)] = -2
+        num_clusters = 0
+        for i in range(num_structures):
+            if labels[i] != -1:
+                continue
+            neighbours = graph.indices[graph.indptr[i] : graph.indptr[i + 1]]
+            labels[neighbours[labels[neighbours] == -1]] = num_clusters
+            labels[i] = num_clusters
+            num_clusters += 1
+        if exact_dupes:
+            labels[list(exact_dupes)] = labels[list(exact_dupes.values())]
+
+    # stable sort keeps members in ascending order within each cluster
+    order = np.argsort(labels, kind="stable")
+    splits = np.cumsum(np.bincount(labels, minlength=num_clusters))[:-1]
+    return [cluster.tolist() for cluster in np.split(order, splits)]
+
+
+def _enforce_hierarchy(clusters, values, hierarchy) -> Dict[int, set]:
     """Enforce a general hierarchy of which structures to keep, based
-    on the list of values and their importance.
+    on the list of values and their importance. For each cluster,
+    the structure with the highest ranked value is kept, with ties
+    (and structures with values outside of the hierarchy) broken by
+    their index.
 
     Parameters:
-        dupe_dict (dict): the dictionary keyed by the index of unique structures
-            that holds lists of duplicates for that structure.
+        clusters (list): the list of clusters of duplicates, each
+            containing a list of indices.
         values (list): the list of values for each structure on which to enforce
             the hierarchy.
         hierarchy (list): the order in which to consider the values, e.g.
             `['ICSD', 'OQMD']` will promote ICSD structures over OQMD.
 
     Returns:
-        dict: the reshuffled dictionary of duplicates.
+        dict: the dictionary keyed by the index of unique structures
+            that holds sets of duplicates for that structure.
 
     """
-    max_val = max(
-        list(dupe_dict.keys()) + [val for t in dupe_dict.values() for val in t]
-    )
-
-    if len(values) - 1 != max_val:
+    num_structures = sum(len(cluster) for cluster in clusters)
+    if len(values) != num_structures:
         raise RuntimeError(
             "Number of hierarchy values does not much number of items: {} vs {}".format(
-                len(values) - 1, max_val
+                len(values), num_structures
             )
         )
 
-    new_dupe_dict = copy.deepcopy(dupe_dict)
+    rank = {value: ind for ind, value in reversed(list(enumerate(hierarchy)))}
+    dupe_dict = dict()
+    for cluster in clusters:
+        keep = min(cluster, key=lambda k: (rank.get(values[k], len(hierarchy)), k))
+        dupe_dict[keep] = {k for k in cluster if k != keep}
 
-    swapped = []
-    for i in new_dupe_dict:
-        if not list(new_dupe_dict[i]):
-            continue
-        for value in hierarchy:
-            found = False
-            for k in [i] + list(new_dupe_dict[i]):
-                if values[k] == value:
-                    swapped.append((i, k))
-                    found = True
+    return dupe_dict
+
+
+def _get_stoich_key(doc) -> tuple:
+    """Return a hashable version of the sorted stoichiometry of a document."""
+    return tuple(tuple(elem) for elem in sorted(doc["stoichiometry"]))
+
+
+def _get_candidate_pairs(
+    cursor, energy_tol, enforce_same_stoich, inds=None
+) -> List[Tuple[int, int]]:
+    """Return the sorted list of index pairs `(i, j)`, with `i < j`, of structures
+    that must be compared, i.e. those that share a stoichiometry and lie within
+    `energy_tol` of one another. Rather than looping over all pairs, structures are
+    bucketed by stoichiometry and a sliding window is used over their energies.
+
+    Parameters:
+        cursor (list): the structures to compare.
+        energy_tol (float): the energy window inside which to compare.
+        enforce_same_stoich (bool): if False, all pairs are returned.
+
+    Keyword arguments:
+        inds (list): optional subset of indices into the cursor to consider.
+
+    Returns:
+        list: the sorted list of index pairs.
+
+    """
+    if inds is None:
+        inds = range(len(cursor))
+
+    if not enforce_same_stoich:
+        inds = sorted(inds)
+        return [
+            (inds[i], inds[j])
+            for i in range(len(inds))
+            for j in range(i + 1, len(inds))
+        ]
+
+    buckets = defaultdict(list)
+    for ind in inds:
+        buckets[_get_stoich_key(cursor[ind])].append(
+            (cursor[ind].get("enthalpy_per_atom", 0), ind)
+        )
+
+    pairs = []
+    for bucket in buckets.values():
+        bucket = sorted(bucket)
+        energies = [energy for energy, _ in bucket]
+        for i, (energy, ind) in enumerate(bucket):
+            # only need to scan the structures up to energy + energy_tol
+            j_max = bisect.bisect_right(energies, energy + energy_tol, lo=i + 1)
+            for energy_j, jnd in bucket[i + 1 : j_max]:
+                if np.abs(energy_j - energy) < energy_tol:
+                    pairs.append((min(ind, jnd), max(ind, jnd)))
+
+    return sorted(pairs)
+
+
+def _get_prefiltered_pairs(
+    cursor, energy_tol, enforce_same_stoich, prefilter_tol=0.05
+) -> Tuple[List[Tuple[int, int]], Dict[int, int]]:
+    """Use structure hashes and descriptors to reduce the number of pairs
+    of structures that require a full fingerprint comparison.
+
+    Parameters:
+        cursor (list): the structures to compare.
+        energy_tol (float): the energy window inside which to compare.
+        enforce_same_stoich (bool): whether to compare only structures with
+            the same stoichiometry.
+
+    Keyword arguments:
+        prefilter_tol (float): the RMS descriptor distance below which pairs
+            are retained.
+
+    Returns:
+        (list, dict): the sorted list of candidate index pairs, and a dict
+            mapping the indices of exact duplicates to the index of their
+            representative structure.
+
+    """
+    from scipy.spatial import cKDTree
+
+    def _within_window(i, j):
+        return not enforce_same_stoich or (
+            _get_stoich_key(cursor[i]) == _get_stoich_key(cursor[j])
+            and np.abs(
+                cursor[i].get("enthalpy_per_atom", 0)
+                - cursor[j].get("enthalpy_per_atom", 0)
+            )
+            < energy_tol
+        )
+
+    # first tier: fold exact duplicates onto the first matching structure
+    exact_dupes = dict()
+    reps_by_hash = defaultdict(list)
+    for ind, doc in enumerate(cursor):
+        structure_hash = get_structure_hash(doc)
+        if structure_hash is not None:
+            for rep in reps_by_hash[structure_hash]:
+                if _within_window(rep, ind):
+                    exact_dupes[ind] = rep
                     break
-            if found:
-                break
-
-    for i, k in swapped:
-        if i != k:
-            if k in new_dupe_dict:
-                new_dupe_dict[k].update(
-                    [ind for ind in new_dupe_dict[i] if ind != k] + [i]
-                )
             else:
-                new_dupe_dict[k] = set(
-                    [ind for ind in new_dupe_dict[i] if ind != k] + [i]
-                )
-            del new_dupe_dict[i]
+                reps_by_hash[structure_hash].append(ind)
+
+    reps = [ind for ind in range(len(cursor)) if ind not in exact_dupes]
+
+    # second tier: find near neighbours in descriptor space
+    if enforce_same_stoich:
+        buckets = defaultdict(list)
+        for ind in reps:
+            buckets[_get_stoich_key(cursor[ind])].append(ind)
+        buckets = list(buckets.values())
+    else:
+        buckets = [reps]
+
+    pairs = []
+    for bucket in buckets:
+        if len(bucket) < 2:
+            continue
+        descriptors = np.asarray(
+            [get_structure_descriptor(cursor[ind]) for ind in bucket]
+        )
+        tree = cKDTree(descriptors)
+        # convert RMS tolerance into the Euclidean radius used by the tree
+        radius = prefilter_tol * np.sqrt(descriptors.shape[-1])
+        for i, j in tree.query_pairs(radius):
+            ind, jnd = sorted((bucket[i], bucket[j]))
+            if _within_window(ind, jnd):
+                pairs.append((ind, jnd))
+
+    return sorted(pairs), exact_dupes
+
+
+def get_structure_hash(doc, symprec=1e-2, decimals=3) -> Optional[str]:
+    """Return a canonical hash of a structure that can be used to detect
+    exact duplicates, independent of the cell setting, site ordering and
+    uniform rescaling of the cell.
 
-    return new_dupe_dict
+    The structure is standardized to its primitive cell with spglib, its
+    lattice parameters are normalised to unit number density and the sorted
+    sites are rounded to the requested number of decimals before hashing.
+
+    Parameters:
+        doc (dict/Crystal): the structure to hash.
+
+    Keyword arguments:
+        symprec (float): spglib symmetry tolerance.
+        decimals (int): number of decimal places to round to.
+
+    Returns:
+        str: the hash of the structure, or None if the structure
+            could not be standardized.
+
+    """
+    try:
+        std_doc = standardize_doc_cell(doc, primitive=True, symprec=symprec)
+    except Exception:
+        return None
+
+    num_atoms = len(std_doc["atom_types"])
+    scale = (num_atoms / cart2volume(std_doc["lattice_cart"])) ** (1 / 3)
+    lengths = np.round(np.asarray(std_doc["lattice_abc"][0]) * scale, decimals)
+    angles = np.round(np.asarray(std_doc["lattice_abc"][1]), decimals - 1)
+    positions = np.round(np.asarray(std_doc["positions_frac"]) % 1, decimals) % 1
+    sites = sorted(
+        (species, tuple(pos.tolist()))
+        for species, pos in zip(std_doc["atom_types"], positions)
+    )
+    key = repr((lengths.tolist(), angles.tolist(), sites))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def get_structure_descriptor(doc, rmax=3.0, num_bins=24, width=0.1) -> np.ndarray:
+    """Return a compact, fixed-length descriptor of a structure for use in
+    nearest-neighbour searches: a coarse, Gaussian-broadened radial distribution
+    function computed for the structure rescaled to unit number density.
+
+    Parameters:
+        doc (dict/Crystal): the structure to describe.
+
+    Keyword arguments:
+        rmax (float): the maximum radius, in units of the mean interatomic spacing.
+        num_bins (int): the number of radial points in the descriptor.
+        width (float): the broadening width, in units of the mean interatomic spacing.
+
+    Returns:
+        np.ndarray: the descriptor vector of length `num_bins`.
+
+    """
+    from scipy.spatial.distance import cdist
+
+    lattice, positions_frac, _ = doc2spg(doc, check_occ=False)
+    lattice = np.asarray(lattice)
+    poscart = (np.asarray(positions_frac) % 1) @ lattice
+    num_atoms = len(poscart)
+    scale = (num_atoms / cart2volume(lattice)) ** (1 / 3)
+
+    images = np.asarray(
+        list(
+            PDF._get_image_trans_vectors_auto(
+                lattice, (rmax + 3 * width) / scale, 0, max_num_images=10
+            )
+        )
+    )
+    shifts = images @ lattice
+    distances = (
+        cdist(poscart, (poscart[None, :, :] + shifts[:, None, :]).reshape(-1, 3))
+        * scale
+    ).flatten()
+    distances = distances[(distances > 1e-8) & (distances < rmax + 3 * width)]
+
+    r_space = np.linspace(0, rmax, num_bins + 1)[1:]
+    gr = np.sum(
+        np.exp(-(((r_space[:, None] - distances[None, :]) / width) ** 2)), axis=1
+    )
+    return gr / (4 * np.pi * r_space**2 * num_atoms)
@@ -283,13 +283,16 @@ def round(n, prec):
         return float(Decimal(str(n)).quantize(Decimal("0.05"), rounding=ROUND_UP))
 
 
-def get_convergence_files(path, only=None):
-    """Find all CASTEP files in the directory."""
+def get_convergence_files(path, only=None, cache=False):
+    """Find all CASTEP files in the directory, optionally reusing
+    cached scrapes of unchanged files.
+
+    """
     structure_files = defaultdict(list)
     files = glob.glob(path + "/*.castep")
     for file in files:
         if only is None or only in file:
-            castep_dict, success = castep2dict(file, db=False)
+            castep_dict, success = castep2dict(file, db=False, cache=cache)
             if not success:
                 print("Failure to read castep file {}".format(file))
             else:
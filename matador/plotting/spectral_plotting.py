@@ -93,6 +93,8 @@ def plot_spectral(seeds, **options):
         title (str): optional plot title
         pdos_hide_sum (bool): whether or not to plot the total DOS on a PDOS plot; this is to hide
             regions where the PDOS is negative (leading to total DOS lower than stacked PDOS) (DEFAULT: False).
+        cache (bool): whether to store and reuse scraped data in binary sidecar files
+            next to the input files (DEFAULT: False).
 
     """
     from cycler import cycler
@@ -369,7 +371,9 @@ def dispersion_plot(seeds, ax_dispersion, options, bbox_extra_artists=None):
             seed = seed.replace(".bands", "").replace(".phonon", "")
             if os.path.isfile("{}.phonon".format(seed)):
                 dispersion, s = phonon2dict(
-                    seed + ".phonon", verbosity=options.get("verbosity")
+                    seed + ".phonon",
+                    verbosity=options.get("verbosity"),
+                    cache=options.get("cache"),
                 )
                 if not s:
                     raise RuntimeError(dispersion)
@@ -378,7 +382,9 @@ def dispersion_plot(seeds, ax_dispersion, options, bbox_extra_artists=None):
 
             elif os.path.isfile("{}.bands".format(seed)):
                 dispersion, s = bands2dict(
-                    seed + ".bands", verbosity=options.get("verbosity")
+                    seed + ".bands",
+                    verbosity=options.get("verbosity"),
+                    cache=options.get("cache"),
                 )
                 if not s:
                     raise RuntimeError(dispersion)
@@ -386,7 +392,9 @@ def dispersion_plot(seeds, ax_dispersion, options, bbox_extra_artists=None):
                 if os.path.isfile("{}.pdis.dat".format(seed)) and options.get(
                     "plot_pdis"
                 ):
-                    pdis_data, s = optados2dict("{}.pdis.dat".format(seed))
+                    pdis_data, s = optados2dict(
+                        "{}.pdis.dat".format(seed), cache=options.get("cache")
+                    )
                     if not s:
                         raise RuntimeError(pdis_data)
                 else:
@@ -1448,7 +1456,7 @@ def _load_electronic_dos(seed, options):
     # full spectral calculation, it is simply the .bands
     # file output from a DOS calculation
     if dos_seed.endswith(".bands_dos"):
-        dos_data, s = bands2dict(dos_seed)
+        dos_data, s = bands2dict(dos_seed, cache=options.get("cache"))
         gaussian_width = options.get("gaussian_width", 0.1)
         dos_data["dos"], dos_data["energies"] = DensityOfStates.bands_as_dos(
             dos_data, gaussian_width=gaussian_width
@@ -1459,7 +1467,7 @@ def _load_electronic_dos(seed, options):
             del dos_data["dos"]
 
     else:
-        dos_data, s = optados2dict(dos_seed, verbosity=0)
+        dos_data, s = optados2dict(dos_seed, verbosity=0, cache=options.get("cache"))
         if dos_seed.endswith("pdos.dat"):
             _dos_data = {}
             _dos_data["pdos"] = dos_data
@@ -1467,7 +1475,9 @@ def _load_electronic_dos(seed, options):
 
     # if a pdos.dat file is found, add it to the dos_data under the pdos key
     if not dos_seed.endswith("pdos.dat") and os.path.isfile(f"{seed}.pdos.dat"):
-        pdos_data, s = optados2dict(f"{seed}.pdos.dat", verbosity=0)
+        pdos_data, s = optados2dict(
+            f"{seed}.pdos.dat", verbosity=0, cache=options.get("cache")
+        )
         if not s:
             raise RuntimeError(pdos_data)
         dos_data["pdos"] = pdos_data
@@ -1498,7 +1508,7 @@ def _load_phonon_dos(seed, options):
         return seed
 
     # otherwise, just read the phonon_dos file
-    dos_data, s = phonon_dos2dict(seed + ".phonon_dos")
+    dos_data, s = phonon_dos2dict(seed + ".phonon_dos", cache=options.get("cache"))
     if not s:
         raise RuntimeError(dos_data)
 
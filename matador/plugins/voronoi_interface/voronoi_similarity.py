@@ -10,7 +10,7 @@ and create normalised padded arrays so that they can be compared.
 * For each structure, find the *unique* sites, to some definition of unique, initially
 just a simple np.isclose() on the site arrays.
 
-* Now do an all-to-all comparison of the unique sites in each structure, yielding
+* Now compare the unique sites of all structures together, yielding
 an overall list of unique substructures. This step should have a dial that can be turned
 such that all sites fold onto each other, or all sites become distinct, i.e. sensitivity
 vs specificity.
@@ -24,6 +24,7 @@ one of the unique clusters.
 * Finally, the structures themselves can be clustered by the sites that are present, if desired.
 
 """
+import itertools
 from collections import defaultdict
 import numpy as np
 
@@ -252,6 +253,117 @@ def set_site_array(doc, normalise=False):
     )
 
 
+def get_site_features(site_arrays, elems=None):
+    """Concatenate site arrays with the same padding into fixed-length
+    feature vectors.
+
+    Input:
+
+        | site_arrays: list(dict), site arrays of one element, as created
+                       by create_site_array.
+
+    Args:
+
+        | elems: list(str), order of the elements in each feature vector,
+                 defaults to the order of the keys in the first site.
+
+    Returns:
+
+        | features: np.ndarray, 2D array with one row per site.
+        | slices: dict(slice), the columns of each element in the features.
+
+    """
+    if elems is None:
+        elems = list(site_arrays[0]) if site_arrays else []
+    slices = dict()
+    start = 0
+    for elem in elems:
+        num_contrib = len(site_arrays[0][elem]) if site_arrays else 0
+        slices[elem] = slice(start, start + num_contrib)
+        start += num_contrib
+
+    features = np.zeros((len(site_arrays), start))
+    for ind, site in enumerate(site_arrays):
+        for elem in elems:
+            features[ind, slices[elem]] = site[elem]
+
+    return features, slices
+
+
+def cluster_similar_sites(features, slices, atol=1e-2, rtol=1e-2):
+    """Group sites into equivalence classes, where two sites are joined if
+    they are the same according to are_sites_the_same, and the classes are
+    the connected groups of such pairs.
+
+    Candidate pairs are found with a KD-tree in the max-norm, using the
+    largest tolerance allowed for any value, and are then checked with
+    the same per-element np.allclose tests as are_sites_the_same, so the
+    cost scales with the number of similar pairs rather than the square
+    of the number of sites.
+
+    Input:
+
+        | features: np.ndarray, 2D array of site feature vectors, as created
+                    by get_site_features.
+        | slices: dict(slice), the columns of each element in the features.
+
+    Args:
+
+        | rtol : relative tolerance in solid angle for np.allclose,
+        | atol : absolute tolerance in solid angle for np.allclose.
+
+    Returns:
+
+        | similar_sites: list(set), sets of indices of equivalent sites,
+                         ordered by their lowest index.
+
+    """
+    from scipy.spatial import cKDTree
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    num_sites = len(features)
+    if num_sites == 0:
+        return []
+
+    if features.shape[1] == 0:
+        pairs = np.asarray(list(itertools.combinations(range(num_sites), 2)))
+        pairs = pairs.reshape(-1, 2)
+    else:
+        # no pair of similar sites can be further apart than this in any column
+        radius = atol + rtol * np.max(np.abs(features))
+        pairs = cKDTree(features).query_pairs(
+            radius * (1 + 1e-8), p=np.inf, output_type="ndarray"
+        )
+
+    site_A = features[pairs[:, 0]]
+    site_B = features[pairs[:, 1]]
+    diff = np.abs(site_A - site_B)
+    same = np.ones(len(pairs), dtype=bool)
+    for elem in slices:
+        _slice = slices[elem]
+        close_to_B = np.all(
+            diff[:, _slice] <= atol + rtol * np.abs(site_B[:, _slice]), axis=1
+        )
+        close_to_A = np.all(
+            diff[:, _slice] <= atol + rtol * np.abs(site_A[:, _slice]), axis=1
+        )
+        same &= close_to_B | close_to_A
+    pairs = pairs[same]
+
+    graph = coo_matrix(
+        (np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+        shape=(num_sites, num_sites),
+    )
+    _, labels = connected_components(graph, directed=False)
+
+    similar_sites = dict()
+    for ind, label in enumerate(labels):
+        similar_sites.setdefault(label, set()).add(ind)
+
+    return sorted(similar_sites.values(), key=min)
+
+
 def get_unique_sites(doc, atol=1e-2, rtol=1e-2):
     if "substruc_dict" not in doc:
         set_substruc_dict(doc)
@@ -264,89 +376,11 @@ def get_unique_sites(doc, atol=1e-2, rtol=1e-2):
     degeneracies = dict()
     similar_sites = dict()
     for elem in elems:
-        unique_sites[elem] = set()
-        similar_sites[elem] = []
-        for i in range(len(site_array[elem])):
-            for j in range(i + 1, len(site_array[elem])):
-                same = are_sites_the_same(
-                    site_array[elem][i], site_array[elem][j], atol=atol, rtol=rtol
-                )
-                if same:
-                    added = False
-                    for ind, site in enumerate(similar_sites[elem]):
-                        if i in site:
-                            similar_sites[elem][ind].add(j)
-                            added = True
-                            break
-                        if j in site:
-                            similar_sites[elem][ind].add(i)
-                            added = True
-                            break
-                    if not added:
-                        similar_sites[elem].append(set([i, j]))
-            if not any([i in _set for _set in similar_sites[elem]]):
-                similar_sites[elem].append(set([i]))
-
-        # for env in site_array[elem]:
-        # print(env)
-        from copy import deepcopy
-
-        temp_similar_sites = deepcopy(similar_sites[elem])
-        valid = False
-        _iter = 0
-        while not valid:
-            scrubbed = False
-            _iter += 1
-            if _iter > 100:
-                raise RuntimeError
-            for index in range(len(site_array[elem])):
-                index_sites = []
-                for ind, site in enumerate(temp_similar_sites):
-                    if index in site:
-                        index_sites.append(ind)
-                # if index is in multiple sites, combine all sites into the first
-                if len(index_sites) > 1:
-                    # construct mean of each set of sites, and if they are too far apart, get worried
-                    site_mean = []
-                    for j in range(len(index_sites)):
-                        site_mean.append(defaultdict(list))
-                        for _elem in site_array[elem][i]:
-                            site_mean[-1][_elem].append(
-                                np.mean(
-                                    np.asarray(
-                                        [
-                                            site_array[elem][i][_elem]
-                                            for i in temp_similar_sites[index_sites[j]]
-                                        ]
-                                    ),
-                                    axis=0,
-                                )
-                            )
-                            assert np.shape(site_mean[-1][_elem][-1]) == np.shape(
-                                site_array[elem][0][_elem]
-                            )
-                    for j in range(len(index_sites) - 1, 0, -1):
-                        # let means deviate by twice the amount
-                        if not are_sites_the_same(
-                            site_mean[j], site_mean[0], atol=5 * atol, rtol=5 * rtol
-                        ):
-                            raise RuntimeError(
-                                "Numerical instability: site groups with distinct means were clustered."
-                            )
-                        [
-                            temp_similar_sites[index_sites[0]].add(i)
-                            for i in list(temp_similar_sites[index_sites[j]])
-                        ]
-                        del temp_similar_sites[index_sites[j]]
-                    scrubbed = True
-                    break
-                elif len(index_sites) == 0:
-                    raise RuntimeError
-            if not scrubbed:
-                valid = True
-        similar_sites[elem] = temp_similar_sites
-
-        unique_sites[elem] = [next(iter(site)) for site in similar_sites[elem]]
+        features, slices = get_site_features(site_array[elem])
+        similar_sites[elem] = cluster_similar_sites(
+            features, slices, atol=atol, rtol=rtol
+        )
+        unique_sites[elem] = [min(site) for site in similar_sites[elem]]
         degeneracies[elem] = [len(_set) for _set in similar_sites[elem]]
 
     doc["unique_site_inds"] = unique_sites
@@ -373,6 +407,44 @@ def get_unique_sites(doc, atol=1e-2, rtol=1e-2):
     doc["site_degeneracies"] = degeneracies
 
 
+def get_unique_environments(cursor, atol=1e-2, rtol=1e-2):
+    """Find the unique substructures across a list of structures, by
+    clustering the unique sites of every structure together.
+
+    Input:
+
+        | cursor: list(dict), list of structures with pre-computed unique sites.
+
+    Args:
+
+        | rtol : relative tolerance in solid angle for np.allclose,
+        | atol : absolute tolerance in solid angle for np.allclose.
+
+    Returns:
+
+        | unique_environments: dict(list), dict with element symbol keys containing
+                               a list of each unique substructure.
+        | similar_environments: dict(list(set)), dict with element symbol keys
+                                containing the indices of the equivalent
+                                substructures, as collected by collect_unique_sites.
+
+    """
+    environments = collect_unique_sites(cursor)
+    site_array, _ = create_site_array(environments)
+    unique_environments = dict()
+    similar_environments = dict()
+    for elem in environments:
+        features, slices = get_site_features(site_array[elem])
+        similar_environments[elem] = cluster_similar_sites(
+            features, slices, atol=atol, rtol=rtol
+        )
+        unique_environments[elem] = [
+            environments[elem][min(site)] for site in similar_environments[elem]
+        ]
+
+    return unique_environments, similar_environments
+
+
 def compare_docs(docA, docB, elems):
     matching = 0
     print("COMPARING", " ".join(docA["text_id"]), "vs", " ".join(docB["text_id"]))
@@ -29,9 +29,20 @@ from matador.scrapers.utils import (
     ComputationError,
     scraper_function,
     f90_float_parse,
+    f90_array_parse,
     get_flines_extension_agnostic,
 )
 
+# strings that mark the end of a CASTEP geometry optimisation, in the order
+# (success, failure, nothing to optimise)
+CASTEP_GEOM_FINISH_STRINGS = (
+    "Geometry optimization completed successfully",
+    "Geometry optimization failed to converge after",
+    "WARNING - there is nothing to optimise - skipping relaxation",
+)
+# string from the banner printed at the start of each CASTEP run
+CASTEP_RUN_HEADER_STRING = "CCC   AA    SSS  TTTTT"
+
 
 @scraper_function
 def res2dict(fname, db=True, **kwargs):
@@ -794,6 +805,27 @@ def castep2dict(fname, db=True, intermediates=False, timings=False, **kwargs):
         fname, ["castep", "history", "history.gz"]
     )
 
+    return _castep_scrape_flines(
+        flines, fname, db=db, intermediates=intermediates, timings=timings
+    )
+
+
+def _castep_scrape_flines(flines, fname, db=True, intermediates=False, timings=False):
+    """Create the castep2dict dict from the lines of a CASTEP file.
+
+    Parameters:
+        flines (list): list of lines in the file.
+        fname (str): the filename to use as the source.
+
+    Keyword arguments:
+        db (bool): whether to error on missing relaxation info
+        intermediates (bool): whether to return the list of snapshots
+        timings (bool): whether to calculate total time taken.
+
+    Returns:
+        (tuple): containing the dict of data, and True.
+
+    """
     castep = dict()
     # set source tag to castep file
     castep["source"] = [fname]
@@ -888,6 +920,158 @@ def castep2dict(fname, db=True, intermediates=False, timings=False, **kwargs):
     return castep, True
 
 
+class CastepOutputReader:
+    """Stateful reader of a (possibly still growing) CASTEP output file,
+    that remembers how far through the file it has read and only consumes
+    newly appended lines on each call to :meth:`update`.
+
+    Only the lines required to reproduce the result of
+    :func:`castep2dict` are kept in memory: once a geometry optimisation
+    finishes, all lines from before the start of that CASTEP run are
+    discarded, except for the header of the first run up to the initial
+    structure, with the number of completed geometry optimisation steps
+    counted as the lines are consumed. The result is then parsed from the
+    retained lines only, such that the cost of each update no longer grows
+    with the total length of the file for a repeatedly restarted relaxation.
+
+    Example:
+
+        >>> reader = CastepOutputReader("seed.castep", db=False)
+        >>> # run first part of relaxation
+        >>> castep_dict, success = reader.update()
+        >>> # run second part of relaxation, appending to seed.castep
+        >>> castep_dict, success = reader.update()
+
+    """
+
+    def __init__(self, fname, db=True, verbosity=0, listeners=None):
+        """Initialise the reader without reading the file.
+
+        Parameters:
+            fname (str): the filename of the CASTEP file.
+
+        Keyword arguments:
+            db (bool): whether to error on missing relaxation info,
+                as in :func:`castep2dict`.
+            verbosity (int): print errors if >= 1.
+            listeners (list): objects with an `add_lines` method that will also
+                be passed each batch of new lines as they are read, e.g. a
+                :class:`matador.compute.walltime.WalltimePredictor`.
+
+        """
+        self.fname = fname
+        self.db = db
+        self.verbosity = verbosity
+        self.listeners = listeners or []
+        self.reset()
+
+    def reset(self):
+        """Forget all previously read lines, e.g. if the file was replaced."""
+        self._offset = 0
+        self._inode = None
+        self._partial_line = b""
+        self._flines = []
+        self._head = []
+        self._head_state = None
+        self._trimmed = False
+        self._num_runs = 0
+        self._run_start = 0
+        self._num_opt_steps = 0
+
+    def update(self):
+        """Read any lines appended to the file since the last call and
+        return the up-to-date scraped data. Any incomplete final line is
+        ignored until the rest of it has been written.
+
+        Returns:
+            (tuple): containing either dict/str containing data or error, and a bool stating
+                if the scrape was successful, as in :func:`castep2dict`.
+
+        """
+        stat = os.stat(self.fname)
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            self.reset()
+            self._inode = stat.st_ino
+
+        with open(self.fname, "rb") as f:
+            f.seek(self._offset)
+            data = self._partial_line + f.read()
+            self._offset = f.tell()
+
+        # hold back any incomplete final line until it has been fully written
+        lines = data.split(b"\n")
+        self._partial_line = lines.pop()
+        lines = [self._decode(line.rstrip(b"\r")) + "\n" for line in lines]
+        self.add_lines(lines)
+        for listener in self.listeners:
+            listener.add_lines(lines)
+
+        return self.result()
+
+    def add_lines(self, lines):
+        """Consume new lines of the CASTEP file, discarding any old lines
+        that are no longer needed.
+
+        Parameters:
+            lines (list of str): the new lines, in order.
+
+        """
+        for line in lines:
+            # keep the first run up to the end of the initial structure
+            # forever, as castep2dict uses it as the fallback structure
+            if self._head_state != "done":
+                self._head.append(line)
+                if "Cell Contents" in line:
+                    self._head_state = "cell"
+                elif self._head_state == "cell" and "x------" in line:
+                    self._head_state = "atoms"
+                elif self._head_state == "atoms" and "xxxxxxxxx" in line:
+                    self._head_state = "done"
+
+            if CASTEP_RUN_HEADER_STRING in line:
+                if self._num_runs > 0:
+                    self._run_start = len(self._flines)
+                self._num_runs += 1
+            elif any(string in line for string in CASTEP_GEOM_FINISH_STRINGS):
+                if self._run_start > 0:
+                    del self._flines[: self._run_start]
+                    self._trimmed = True
+                self._run_start = 0
+            elif ": finished iteration" in line and "with enthalpy" in line:
+                # don't include the "zeroth" step before anything has been moved
+                if "0" not in line.split():
+                    self._num_opt_steps += 1
+            self._flines.append(line)
+
+    def result(self):
+        """Parse the retained lines of the file.
+
+        Returns:
+            (tuple): containing either dict/str containing data or error, and a bool stating
+                if the scrape was successful, as in :func:`castep2dict`.
+
+        """
+        flines = self._flines
+        if self._trimmed:
+            flines = self._head + flines
+        try:
+            castep, success = _castep_scrape_flines(flines, self.fname, db=self.db)
+            castep["geom_iter"] = self._num_opt_steps
+        except Exception as oops:
+            if self.verbosity >= 1:
+                print("{}: {} {}".format(self.fname, type(oops), oops))
+            return type(oops)("{}: {}\n".format(self.fname, oops)), False
+
+        return castep, success
+
+    @staticmethod
+    def _decode(line):
+        try:
+            return line.decode("utf-8")
+        except UnicodeDecodeError:
+            return line.decode("latin1")
+
+
 @scraper_function
 def bands2dict(fname, **kwargs):
     """Parse a CASTEP bands file into a dictionary, which can be used as input to
@@ -935,20 +1119,27 @@ def bands2dict(fname, **kwargs):
         (bs["num_spins"], bs["num_bands"], bs["num_kpoints"])
     )
 
+    # each k-point block has a header line, then a header line per spin
+    # followed by the eigenvalues for that spin channel
+    block_length = bs["num_spins"] * (bs["num_bands"] + 1) + 1
+    kpt_lines = data[0 : bs["num_kpoints"] * block_length : block_length]
+    kpt_inds = np.asarray([int(line.split()[1]) - 1 for line in kpt_lines])
+    kpt_data = f90_array_parse(
+        [" ".join(line.split()[-4:]) for line in kpt_lines],
+        shape=(bs["num_kpoints"], 4),
+    )
+    bs["kpoint_path"][kpt_inds] = kpt_data[:, 0:3]
+    bs["kpoint_weights"][kpt_inds] = kpt_data[:, 3]
+
+    eig_lines = []
     for nk in range(bs["num_kpoints"]):
-        kpt_ind = nk * (bs["num_spins"] * bs["num_bands"] + bs["num_spins"] + 1)
-        bs["kpoint_path"][int(data[kpt_ind].split()[1]) - 1] = np.asarray(
-            [f90_float_parse(elem) for elem in data[kpt_ind].split()[-4:-1]]
-        )
-        bs["kpoint_weights"][int(data[kpt_ind].split()[1]) - 1] = f90_float_parse(
-            data[kpt_ind].split()[-1]
-        )
-        for nb in range(bs["num_bands"]):
-            for ns in range(bs["num_spins"]):
-                line_number = kpt_ind + 2 + ns + (ns * bs["num_bands"]) + nb
-                bs["eigenvalues_k_s"][ns][nb][
-                    int(data[kpt_ind].split()[1]) - 1
-                ] = f90_float_parse(data[line_number].strip())
+        for ns in range(bs["num_spins"]):
+            start = nk * block_length + ns * (bs["num_bands"] + 1) + 2
+            eig_lines.extend(data[start : start + bs["num_bands"]])
+    eigs = f90_array_parse(
+        eig_lines, shape=(bs["num_kpoints"], bs["num_spins"], bs["num_bands"])
+    )
+    bs["eigenvalues_k_s"][:, :, kpt_inds] = np.transpose(eigs, (1, 2, 0))
 
     bs["eigenvalues_k_s"] *= HARTREE_TO_EV
     bs["eigs_s_k"] = bs["eigenvalues_k_s"]
@@ -1066,9 +1257,7 @@ def optados2dict(fname, **kwargs):
         )
 
     elif is_pdis:
-        optados["projector_weights"] = []
         optados["kpoints"] = []
-        optados["eigenvalues"] = []
         # get kpoints and count number of bands
         kpt_ind = -1
         for i, line in enumerate(flines):
@@ -1084,27 +1273,17 @@ def optados2dict(fname, **kwargs):
 
         optados["num_kpoints"] = len(optados["kpoints"])
 
+        band_lines = []
         for nk in range(optados["num_kpoints"]):
-            eigs = []
-            pdis = []
-            for nb in range(0, optados["num_bands"]):
-                eigs.append(
-                    f90_float_parse(
-                        flines[nk * (optados["num_bands"] + 1) + nb + 1].split()[0]
-                    )
-                )
-                pdis.append(
-                    [
-                        f90_float_parse(val)
-                        for val in flines[
-                            nk * (optados["num_bands"] + 1) + 1 + nb
-                        ].split()[1:]
-                    ]
-                )
-            optados["eigenvalues"].append(eigs)
-            optados["projector_weights"].append(pdis)
+            start = nk * (optados["num_bands"] + 1) + 1
+            band_lines.extend(flines[start : start + optados["num_bands"]])
 
-        optados["projector_weights"] = np.asarray(optados["projector_weights"])
+        # each line contains the eigenvalue followed by its projector weights
+        bands = f90_array_parse(
+            band_lines, shape=(optados["num_kpoints"], optados["num_bands"], -1)
+        )
+        optados["eigenvalues"] = bands[:, :, 0].tolist()
+        optados["projector_weights"] = bands[:, :, 1:]
 
     else:
         optados["dos"] = data[:, 1]
@@ -1167,14 +1346,23 @@ def phonon2dict(fname, **kwargs):
                 i += 1
         elif "end header" in line:
             data_start = line_no + 1
-        elif "begin dos" in line:
-            dos_present = True
-            projector_labels = flines[line_no].split()[5:]
-            projector_labels = [(label, None, None) for label in projector_labels]
-            begin_dos = line_no + 1
+            break
 
-        elif "q-pt" in line:
-            last_qpt_ind = int(line.split()[1])
+    # search the (potentially large) remainder of the file in one go,
+    # rather than line by line
+    body = "".join(flines[data_start:]).lower()
+    dos_offset = body.find("begin dos")
+    if dos_offset != -1:
+        dos_present = True
+        line_no = data_start + body.count("\n", 0, dos_offset)
+        projector_labels = flines[line_no].split()[5:]
+        projector_labels = [(label, None, None) for label in projector_labels]
+        begin_dos = line_no + 1
+
+    if "num_kpoints" not in ph:
+        qpt_offset = body.rfind("q-pt")
+        line_no = data_start + body.count("\n", 0, qpt_offset)
+        last_qpt_ind = int(flines[line_no].split()[1])
 
     if dos_present:
         # extra header line with GRADIENTS written when dos is present
@@ -1186,32 +1374,38 @@ def phonon2dict(fname, **kwargs):
 
     data = flines[data_start:]
 
-    ph["phonon_kpoint_list"] = []
     if "num_kpoints" not in ph:
         ph["num_kpoints"] = last_qpt_ind
-    ph["eigenvalues_q"] = np.zeros((1, ph["num_modes"], ph["num_kpoints"]))
-    raman_intensity = np.zeros_like(ph["eigenvalues_q"])
-    infrared_intensity = np.zeros_like(ph["eigenvalues_q"])
-    raman = False
-    ir = False
+    qpt_lines = data[0 : ph["num_kpoints"] * line_offset : line_offset]
+    ph["phonon_kpoint_list"] = [
+        [f90_float_parse(elem) for elem in line.split()[2:]] for line in qpt_lines
+    ]
+
+    mode_lines = []
     for qind in range(ph["num_kpoints"]):
-        ph["phonon_kpoint_list"].append(
-            [f90_float_parse(elem) for elem in data[qind * line_offset].split()[2:]]
+        start = qind * line_offset + 1
+        mode_lines.extend(data[start : start + ph["num_modes"]])
+
+    # each mode line contains the index, the frequency and optionally
+    # the IR and Raman intensities
+    num_cols = len(mode_lines[0].split())
+    try:
+        modes = f90_array_parse(
+            mode_lines, shape=(ph["num_kpoints"], ph["num_modes"], num_cols)
         )
-        for i in range(1, ph["num_modes"] + 1):
-            line_split = data[qind * line_offset + i].split()
-            ph["eigenvalues_q"][0][i - 1][qind] = f90_float_parse(line_split[1])
-            if len(line_split) > 2:
-                infrared_intensity[0][i - 1][qind] = f90_float_parse(line_split[2])
-                ir = True
-            if len(line_split) > 3:
-                raman_intensity[0][i - 1][qind] = f90_float_parse(line_split[3])
-                raman = True
-
-    if ir:
-        ph["infrared_intensity"] = infrared_intensity
-    if raman:
-        ph["raman_intensity"] = raman_intensity
+    except ValueError:
+        # not all lines have the same number of columns, so zero-pad each line
+        num_cols = max(len(line.split()) for line in mode_lines)
+        modes = np.zeros((len(mode_lines), num_cols))
+        for ind, line in enumerate(mode_lines):
+            values = f90_array_parse([line])
+            modes[ind, : len(values)] = values
+        modes = modes.reshape(ph["num_kpoints"], ph["num_modes"], num_cols)
+    ph["eigenvalues_q"] = np.transpose(modes[:, :, 1:2], (2, 1, 0)).copy()
+    if num_cols > 2:
+        ph["infrared_intensity"] = np.transpose(modes[:, :, 2:3], (2, 1, 0)).copy()
+    if num_cols > 3:
+        ph["raman_intensity"] = np.transpose(modes[:, :, 3:4], (2, 1, 0)).copy()
 
     if dos_present:
         # remove header and "END"
@@ -2038,9 +2232,7 @@ def _castep_find_final_structure(flines):
     """
     optimised = False
     finish_line = 0
-    success_string = "Geometry optimization completed successfully"
-    failure_string = "Geometry optimization failed to converge after"
-    annoying_string = "WARNING - there is nothing to optimise - skipping relaxation"
+    success_string, failure_string, annoying_string = CASTEP_GEOM_FINISH_STRINGS
     # look for final "success/failure" string in file for geometry optimisation
     for line_no, line in enumerate(reversed(flines)):
         if success_string in line:
@@ -5,15 +5,17 @@
 like custom errors and a scraper function wrapper.
 """
 
-
 import glob
 import os
 import gzip
 import traceback as tb
 
+import numpy as np
+
 from matador.orm.spectral import VibrationalDOS, VibrationalDispersion
 from matador.orm.spectral import ElectronicDOS, ElectronicDispersion
 from matador.crystal import Crystal
+from matador.utils.cache_utils import read_npz_cache, write_npz_cache
 
 MODEL_REGISTRY = {
     "phonon_dos2dict": VibrationalDOS,
@@ -27,6 +29,13 @@ MODEL_REGISTRY = {
     "pwout2dict": Crystal,
 }
 
+# increment this to invalidate all existing scraper caches, e.g. if the
+# format of any scraped data changes
+SCRAPER_CACHE_VERSION = 2
+
+# keyword arguments that do not affect the scraped data
+_CACHE_IGNORED_KWARGS = ("as_model", "cache", "debug", "noglob")
+
 
 def get_flines_extension_agnostic(fname, ext):
     """Try to open and read the filename provided, if it doesn't exist
@@ -85,16 +94,29 @@ def scraper_function(function):
     from functools import wraps
 
     @wraps(function)
-    def wrapped_scraper_function(*args, verbosity=1, fail_fast=False, **kwargs):
+    def wrapped_scraper_function(
+        *args, verbosity=1, fail_fast=False, cache=False, workers=None, **kwargs
+    ):
         """Wrap and return the scraper function, handling the
         multiplicity of file names.
 
+        If `cache` is True, the result of scraping each existing file will
+        be stored in a binary sidecar file (see `get_cache_fname`) that can
+        be read without unpickling. The cache is reused on subsequent calls
+        as long as the file path, size,
+        modification time, scraper keyword arguments and scraper version
+        are unchanged.
+
+        If `workers` is greater than 1 and multiple files are provided, the
+        files will be scraped by a pool of that many processes. The order of the
+        returned cursor matches the order of the input files, and if `fail_fast`
+        is True, the first failure (in input order) will be raised.
+
         """
 
         if kwargs.get("no_wrap"):
             return function(*args, **kwargs)
 
-        result = None
         seed = args[0]
         if isinstance(seed, str):
             if "*" in seed and not kwargs.get("noglob"):
@@ -109,37 +131,38 @@ def scraper_function(function):
             print("Nothing to scrape.")
             return
 
-        for _seed in seed:
-            # we can get away with this as each
-            # scraper function only has one arg
-            try:
-                result, success = function(_seed, verbosity=verbosity, **kwargs)
-            # UnicodeDecodeErrors require 5 arguments, so handle these separately
-            except (FileNotFoundError, UnicodeError) as oops:
-                raise oops
-            except Exception as oops:
-                success = False
-                result = type(oops)("{}: {}\n".format(_seed, oops))
-
-                if verbosity >= 1:
-                    msg = "{}: {} {}".format(_seed, type(oops), oops)
-                    print(msg)
-                if verbosity >= 2:
-                    tb.print_exc()
-
-                if fail_fast:
-                    raise oops
-
-            if len(seed) == 1:
-                if success and kwargs.get("as_model"):
-                    orm = _as_model(result, function)
-                    if orm is not None:
-                        result = orm
-                if not success and verbosity >= 1:
-                    print("Failed to scrape file {}".format(seed))
-
-                return result, success
+        if len(seed) == 1:
+            result, success = _scrape_single_file(
+                function, seed[0], verbosity, fail_fast, cache, kwargs
+            )
+            if success and kwargs.get("as_model"):
+                orm = _as_model(result, function)
+                if orm is not None:
+                    result = orm
+            if not success and verbosity >= 1:
+                print("Failed to scrape file {}".format(seed))
+
+            return result, success
+
+        if workers is not None and workers > 1:
+            results = _scrape_files_in_pool(
+                wrapped_scraper_function,
+                seed,
+                workers,
+                verbosity,
+                fail_fast,
+                cache,
+                kwargs,
+            )
+        else:
+            results = (
+                _scrape_single_file(
+                    function, _seed, verbosity, fail_fast, cache, kwargs
+                )
+                for _seed in seed
+            )
 
+        for _seed, (result, success) in zip(seed, results):
             if not success:
                 failures += [_seed]
             else:
@@ -161,6 +184,162 @@ def scraper_function(function):
     return wrapped_scraper_function
 
 
+def _scrape_single_file(function, seed, verbosity, fail_fast, cache, kwargs):
+    """Scrape a single file with the unwrapped scraper function,
+    handling any exceptions and the optional cache.
+
+    Returns:
+        (tuple): containing either dict/str containing data or error, and a bool stating
+            if the scrape was successful.
+
+    """
+    # we can get away with this as each
+    # scraper function only has one arg
+    try:
+        cache_key = None
+        result = None
+        if cache:
+            cache_key = _get_cache_key(seed, function, kwargs)
+            result = _load_cached_result(seed, function, cache_key)
+        if cache_key is not None and result is not None:
+            success = True
+        else:
+            result, success = function(seed, verbosity=verbosity, **kwargs)
+            if success and cache_key is not None:
+                _write_cached_result(
+                    seed, function, cache_key, result, verbosity=verbosity
+                )
+    # UnicodeDecodeErrors require 5 arguments, so handle these separately
+    except (FileNotFoundError, UnicodeError) as oops:
+        raise oops
+    except Exception as oops:
+        success = False
+        result = type(oops)("{}: {}\n".format(seed, oops))
+
+        if verbosity >= 1:
+            msg = "{}: {} {}".format(seed, type(oops), oops)
+            print(msg)
+        if verbosity >= 2:
+            tb.print_exc()
+
+        if fail_fast:
+            raise oops
+
+    return result, success
+
+
+def _scrape_files_in_pool(
+    wrapped_function, seeds, workers, verbosity, fail_fast, cache, kwargs
+):
+    """Scrape the files in a process pool, yielding the results in the
+    order of the input files. Any exception that would be raised when
+    scraping serially is re-raised here, after shutting down the pool.
+
+    """
+    import multiprocessing as mp
+    from functools import partial
+
+    workers = min(workers, len(seeds))
+    # for large numbers of files, send at most 64 files to each process at a time,
+    # otherwise use small chunks for improved load balancing
+    chunksize = min(max(1, int(0.25 * len(seeds) / workers)), 64)
+    worker = partial(
+        _scrape_single_file_worker,
+        wrapped_function=wrapped_function,
+        verbosity=verbosity,
+        fail_fast=fail_fast,
+        cache=cache,
+        kwargs=kwargs,
+    )
+    with mp.Pool(processes=workers) as pool:
+        for result, success, exc in pool.imap(worker, seeds, chunksize=chunksize):
+            if exc is not None:
+                pool.terminate()
+                raise exc
+            yield result, success
+
+
+def _scrape_single_file_worker(
+    seed, wrapped_function=None, verbosity=1, fail_fast=False, cache=False, kwargs=None
+):
+    """Process pool wrapper for `_scrape_single_file` that returns
+    any exceptions for the parent process to raise, rather than
+    raising them inside the pool.
+
+    """
+    try:
+        result, success = _scrape_single_file(
+            wrapped_function.__wrapped__, seed, verbosity, fail_fast, cache, kwargs
+        )
+    except Exception as exc:
+        return None, False, exc
+    return result, success, None
+
+
+def get_cache_fname(fname, function):
+    """Return the path of the sidecar cache file for the given file
+    and scraper function, e.g. `./.seed.bands.bands2dict.npz`.
+
+    """
+    name = getattr(function, "__name__", function)
+    dirname, basename = os.path.split(fname)
+    return os.path.join(dirname, f".{basename}.{name}.npz")
+
+
+def _get_cache_key(fname, function, kwargs):
+    """Return the key used to validate a cached scrape of the given file,
+    or None if the file does not exist (e.g. if the extension is missing).
+
+    """
+    from matador import __version__
+
+    if not isinstance(fname, str) or not os.path.isfile(fname):
+        return None
+
+    stat = os.stat(fname)
+    return (
+        os.path.realpath(fname),
+        stat.st_size,
+        stat.st_mtime_ns,
+        function.__name__,
+        repr(
+            sorted(
+                (key, val)
+                for key, val in kwargs.items()
+                if key not in _CACHE_IGNORED_KWARGS
+            )
+        ),
+        __version__,
+        SCRAPER_CACHE_VERSION,
+    )
+
+
+def _load_cached_result(fname, function, cache_key):
+    """Return the cached result for this file if the sidecar exists
+    and its key matches, otherwise None.
+
+    """
+    if cache_key is None:
+        return None
+
+    return read_npz_cache(get_cache_fname(fname, function), cache_key)
+
+
+def _write_cached_result(fname, function, cache_key, result, verbosity=1):
+    """Write the scraped result to the sidecar cache file, atomically
+    replacing any existing cache. Failures to write (e.g. in a read-only
+    directory, or for results that cannot be stored without pickling)
+    are not fatal.
+
+    """
+    cache_fname = get_cache_fname(fname, function)
+    try:
+        write_npz_cache(cache_fname, cache_key, result)
+    except Exception as exc:
+        if verbosity >= 1:
+            print(f"Unable to write scraper cache {cache_fname}: {exc}")
+
+
 def _as_model(doc, function, debug=True):
     """Convert the document to the appropriate orm model."""
     model = MODEL_REGISTRY.get(function.__name__)
@@ -206,6 +385,34 @@ def f90_float_parse(val):
         return float(val)
 
 
+def f90_array_parse(lines, shape=None):
+    """Convert a block of lines of whitespace-separated numbers into
+    a flat (or reshaped) array of floats in one vectorised call, falling
+    back to :func:`f90_float_parse` for each value only if the block
+    contains Fortran's exponent-less floats.
+
+    Parameters:
+        lines (list of str): the lines to parse.
+
+    Keyword arguments:
+        shape (tuple): optional shape to cast the resulting array into.
+
+    Returns:
+        np.ndarray: the parsed values.
+
+    """
+    tokens = " ".join(lines).split()
+    try:
+        values = np.asarray(tokens, dtype=np.float64)
+    except ValueError:
+        values = np.asarray([f90_float_parse(val) for val in tokens], dtype=np.float64)
+
+    if shape is not None:
+        values = values.reshape(shape)
+
+    return values
+
+
 class DFTError(Exception):
     """Quick DFT exception class for unconverged or
     non-useful calculations.
@@ -5,9 +5,13 @@
 
 
 import re
+import hashlib
 from copy import deepcopy
+from itertools import islice
+import numpy as np
 from matador.utils.print_utils import print_success, print_warning
 from matador.utils.chem_utils import get_periodic_table, get_stoich
+from matador.utils.cell_utils import abc2cart
 
 
 class AtomicSwapper:
@@ -23,6 +27,7 @@ class AtomicSwapper:
         uniq=False,
         top=None,
         maintain_num_species=True,
+        lazy=False,
         debug=False,
         **kwargs
     ):
@@ -41,6 +46,9 @@ class AtomicSwapper:
                 the cursor.
             maintain_num_species (bool): only perform swaps that maintain
                 the number of species in the structure
+            lazy (bool): rather than storing every swapped structure, set
+                `cursor` to a generator that yields them one at a time from
+                :meth:`iter_swaps`, dropping duplicates as it goes.
             debug (bool): enable debug output
             kwargs (dict): dictionary of extra arguments that should be ignored.
 
@@ -52,6 +60,20 @@ class AtomicSwapper:
         self.swap_args = swap
         del self.periodic_table["X"]
         self.template_structure = None
+        self.swap_counter = 0
+        self.num_duplicates = 0
+
+        if lazy:
+            if uniq:
+                print_warning(
+                    "Ignoring --uniq: lazy swaps only drop repeats of the same structure."
+                )
+            if top is not None:
+                cursor = islice(cursor, top)
+            self.parse_swaps(self.swap_args)
+            self.cursor = self.iter_swaps(cursor)
+            return
+
         self.cursor = list(cursor)
         if top is not None:
             self.cursor = self.cursor[:top]
@@ -59,7 +81,6 @@ class AtomicSwapper:
         if len(self.cursor) == 0:
             return
 
-        self.swap_counter = 0
         self.parse_swaps(self.swap_args)
         swap_cursor = []
         for doc in self.cursor:
@@ -187,24 +208,109 @@ class AtomicSwapper:
         Parameters:
             source_doc (dict): matador doc to swap from.
 
+        Returns:
+            (list, int): the independent swapped documents, and their number.
+
         """
-        new_doc = deepcopy(source_doc)
-        swapped_docs = []
-        unswapped_num_species = len(set(source_doc["atom_types"]))
+        swapped_docs = [deepcopy(doc) for doc in self._swapped_views(source_doc)]
+        return swapped_docs, len(swapped_docs)
+
+    def iter_swaps(self, cursor=None, dedupe=True):
+        """Lazily perform all swaps on a cursor, yielding each swapped
+        structure as it is made, such that only one is in memory at a time.
+
+        The yielded documents are shallow copies of the source documents with
+        new atom types, so their geometry is shared with the source and must
+        not be modified in place.
+
+        Keyword arguments:
+            cursor (iterable): documents to swap, defaults to `self.cursor`.
+            dedupe (bool): drop any swapped structure that has the same
+                stoichiometry, space group and cell hash (see :func:`get_cell_hash`)
+                as one already yielded, such that different prototypes that swap
+                to the same structure are only written once. Structures without
+                a lattice cannot be hashed, so are never dropped.
+
+        Yields:
+            dict: the swapped documents.
+
+        """
+        if cursor is None:
+            cursor = self.cursor
+
+        seen = set()
+        for source_doc in cursor:
+            for doc in self._swapped_views(source_doc):
+                cell_hash = get_cell_hash(doc) if dedupe else None
+                if cell_hash is not None:
+                    key = (
+                        tuple(tuple(elem) for elem in doc["stoichiometry"]),
+                        source_doc.get("space_group"),
+                        cell_hash,
+                    )
+                    if key in seen:
+                        self.num_duplicates += 1
+                        continue
+                    seen.add(key)
+                self.swap_counter += 1
+                yield doc
+
+    def _swapped_views(self, source_doc):
+        """Yield a shallow copy of the source document for each valid swap,
+        with the atom types and derived fields replaced.
+
+        Parameters:
+            source_doc (dict): matador doc to swap from.
+
+        Yields:
+            dict: the swapped documents, sharing all other fields with the source.
+
+        """
+        atom_types = source_doc["atom_types"]
+        unswapped_num_species = len(set(atom_types))
         for swap in self.swap_dict_list:
-            if any(key in source_doc["atom_types"] for key in swap):
-                new_doc["atom_types"] = [
-                    swap.get(atom, atom) for atom in source_doc["atom_types"]
-                ]
-                new_doc["_swapped_stoichiometry"] = get_stoich(source_doc["atom_types"])
-                new_doc["stoichiometry"] = get_stoich(new_doc["atom_types"])
-                new_doc["elems"] = set(new_doc["atom_types"])
-                new_doc["num_species"] = len(new_doc["elems"])
-                if (
-                    not self.maintain_num_species
-                    or new_doc["num_species"] == unswapped_num_species
-                ):
-                    swapped_doc = deepcopy(new_doc)
-                    swapped_docs.append(swapped_doc)
+            if any(key in atom_types for key in swap):
+                new_atom_types = [swap.get(atom, atom) for atom in atom_types]
+                elems = set(new_atom_types)
+                if not self.maintain_num_species or len(elems) == unswapped_num_species:
+                    new_doc = dict(source_doc)
+                    new_doc["atom_types"] = new_atom_types
+                    new_doc["_swapped_stoichiometry"] = get_stoich(atom_types)
+                    new_doc["stoichiometry"] = get_stoich(new_atom_types)
+                    new_doc["elems"] = elems
+                    new_doc["num_species"] = len(elems)
+                    yield new_doc
+
+
+def get_cell_hash(doc, decimals=3):
+    """Return a cheap hash of the lattice and sites of a structure, for
+    detecting structures that are identical up to the ordering of their
+    sites. Unlike :func:`matador.fingerprints.similarity.get_structure_hash`,
+    the hash is not independent of the choice of cell.
+
+    Parameters:
+        doc (dict): the structure to hash, containing `atom_types`,
+            `positions_frac` and `lattice_cart` or `lattice_abc`.
+
+    Keyword arguments:
+        decimals (int): number of decimal places to round to.
+
+    Returns:
+        bytes: the digest of the structure, or None if it has no lattice.
 
-        return swapped_docs, len(swapped_docs)
+    """
+    if "lattice_cart" in doc:
+        lattice = np.asarray(doc["lattice_cart"])
+    elif "lattice_abc" in doc:
+        lattice = np.asarray(abc2cart(doc["lattice_abc"]))
+    else:
+        return None
+
+    lattice = np.round(lattice, decimals) + 0.0
+    positions = np.round(np.asarray(doc["positions_frac"]) % 1, decimals) % 1 + 0.0
+    sites = sorted(
+        (species, tuple(pos.tolist()))
+        for species, pos in zip(doc["atom_types"], positions)
+    )
+    key = repr((lattice.tolist(), sites))
+    return hashlib.sha1(key.encode("utf-8")).digest()
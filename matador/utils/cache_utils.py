@@ -0,0 +1,140 @@
+# coding: utf-8
+# Distributed under the terms of the MIT License.
+
+""" This submodule implements the on-disk format shared by matador's
+caches. Each cache file is a compressed `.npz` archive holding the
+numpy arrays of the cached result, plus a JSON description of the rest
+of the result and the key it was stored under. The files are read with
+`allow_pickle=False`, so loading a cache file that someone else has
+written can never execute code.
+
+"""
+
+
+import os
+import json
+
+import numpy as np
+
+__all__ = ["read_npz_cache", "write_npz_cache"]
+
+_META_KEY = "__meta__"
+_MARKERS = ("__ndarray__", "__scalar__", "__tuple__", "__dict__")
+
+
+def _encode(value, arrays):
+    """Return a JSON-serialisable version of the value, moving any
+    numpy arrays into the `arrays` list.
+
+    Raises:
+        TypeError: if the value contains objects that cannot be stored
+            without pickling.
+
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise TypeError("Unable to cache arrays of Python objects.")
+        arrays.append(value)
+        return {"__ndarray__": len(arrays) - 1}
+    if isinstance(value, np.generic):
+        if value.dtype.hasobject:
+            raise TypeError("Unable to cache Python objects.")
+        arrays.append(np.asarray(value))
+        return {"__scalar__": len(arrays) - 1}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, list):
+        return [_encode(val, arrays) for val in value]
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(val, arrays) for val in value]}
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value) and not (
+            len(value) == 1 and next(iter(value)) in _MARKERS
+        ):
+            return {key: _encode(val, arrays) for key, val in value.items()}
+        return {
+            "__dict__": [
+                [_encode(key, arrays), _encode(val, arrays)]
+                for key, val in value.items()
+            ]
+        }
+    raise TypeError("Unable to cache object of type {}.".format(type(value)))
+
+
+def _decode(value, arrays):
+    """Invert :func:`_encode`, given the loaded arrays."""
+    if isinstance(value, list):
+        return [_decode(val, arrays) for val in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            marker = next(iter(value))
+            if marker == "__ndarray__":
+                return arrays["arr_{}".format(value[marker])]
+            if marker == "__scalar__":
+                return arrays["arr_{}".format(value[marker])][()]
+            if marker == "__tuple__":
+                return tuple(_decode(val, arrays) for val in value[marker])
+            if marker == "__dict__":
+                return {
+                    _decode(key, arrays): _decode(val, arrays)
+                    for key, val in value[marker]
+                }
+        return {key: _decode(val, arrays) for key, val in value.items()}
+    return value
+
+
+def write_npz_cache(fname, key, result):
+    """Atomically write a result and its key to a cache file.
+
+    Parameters:
+        fname (str): the path of the cache file.
+        key: the key to store with the result, which must be
+            made of JSON-compatible values, tuples and dicts.
+        result: the result to store, which may also contain numpy arrays.
+
+    Raises:
+        TypeError: if the key or result cannot be stored without pickling.
+        OSError: if the file cannot be written.
+
+    """
+    arrays = []
+    meta = json.dumps({"key": _encode(key, []), "result": _encode(result, arrays)})
+    tmp_fname = "{}.{}.tmp".format(fname, os.getpid())
+    try:
+        with open(tmp_fname, "wb") as f:
+            np.savez_compressed(
+                f,
+                **{_META_KEY: np.frombuffer(meta.encode("utf-8"), dtype=np.uint8)},
+                **{"arr_{}".format(ind): array for ind, array in enumerate(arrays)},
+            )
+        os.replace(tmp_fname, fname)
+    finally:
+        if os.path.isfile(tmp_fname):
+            os.remove(tmp_fname)
+
+
+def read_npz_cache(fname, key):
+    """Return the result stored in a cache file, if the file exists,
+    can be read without unpickling and was stored under the same key.
+
+    Parameters:
+        fname (str): the path of the cache file.
+        key: the key that the result must have been stored under.
+
+    Returns:
+        the cached result, or None.
+
+    """
+    if not os.path.isfile(fname):
+        return None
+
+    try:
+        expected_key = json.loads(json.dumps(_encode(key, [])))
+        with np.load(fname, allow_pickle=False) as data:
+            meta = json.loads(data[_META_KEY].tobytes().decode("utf-8"))
+            if meta.get("key") != expected_key:
+                return None
+            arrays = {name: data[name] for name in data.files if name != _META_KEY}
+        return _decode(meta["result"], arrays)
+    except Exception:
+        return None
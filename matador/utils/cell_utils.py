@@ -12,6 +12,7 @@ from typing import Dict, Any, Union, Tuple, List, TYPE_CHECKING
 import numpy as np
 
 from matador.data.periodic_table import PERIODIC_TABLE
+from matador.utils.symmetry_cache import get_symmetry_cache
 
 if TYPE_CHECKING:
     from matador.crystal import Crystal
@@ -554,8 +555,12 @@ def standardize_doc_cell(
     from matador.crystal import Crystal
 
     spg_cell = doc2spg(doc)
-    spg_standardized = spg.standardize_cell(
-        spg_cell, to_primitive=primitive, symprec=symprec
+    spg_standardized = get_symmetry_cache().lookup(
+        "standardize_cell",
+        spg_cell,
+        symprec,
+        lambda: spg.standardize_cell(spg_cell, to_primitive=primitive, symprec=symprec),
+        primitive=primitive,
     )
     if not isinstance(doc, Crystal):
         std_doc = deepcopy(doc)
@@ -593,13 +598,49 @@ def get_spacegroup_spg(
     import spglib as spg
 
     spg_cell = doc2spg(doc, check_occ=check_occ)
-    space_group = spg.get_spacegroup(spg_cell, symprec=symprec)
+    space_group = get_symmetry_cache().lookup(
+        "spacegroup",
+        spg_cell,
+        symprec,
+        lambda: spg.get_spacegroup(spg_cell, symprec=symprec),
+    )
     if space_group is None:
         raise RuntimeError("Spglib was unable to calculate space group.")
 
     return space_group.split(" ")[0]
 
 
+def get_symmetry_spg(
+    doc: Union[Dict[str, Any], Crystal], symprec: float = 0.01
+) -> Dict[str, np.ndarray]:
+    """Return the spglib symmetry operations of a cell.
+
+    Parameters:
+        doc: matador document or Crystal object.
+
+    Keyword arguments:
+        symprec: spglib symmetry tolerance.
+
+    Returns:
+        A dictionary containing the read-only arrays of `rotations`,
+        `translations` and `equivalent_atoms`.
+
+    """
+    import spglib as spg
+
+    spg_cell = doc2spg(doc)
+    symmetry = get_symmetry_cache().lookup(
+        "symmetry",
+        spg_cell,
+        symprec,
+        lambda: spg.get_symmetry(spg_cell, symprec=symprec),
+    )
+    if symmetry is None:
+        raise RuntimeError("Spglib was unable to calculate symmetry operations.")
+
+    return symmetry
+
+
 def get_compatible_spacegroups(
     doc: Union[Dict[str, Any], Crystal], symprec_range=(-5, 0)
 ) -> Dict[float, str]:
@@ -7,6 +7,7 @@ displaying, extracting and refining results from a Mongo cursor/list.
 """
 
 from time import strftime
+from typing import NamedTuple, Optional
 
 import numpy as np
 import pymongo as pm
@@ -89,6 +90,7 @@ def display_results(
     per_atom=False,
     eform=False,
     source=False,
+    page_size=100,
     **kwargs,
 ):
     """Print query results in a table, with many options for customisability.
@@ -118,6 +120,7 @@ def display_results(
             or, list of indices referring to those structures in the cursor.
         deletions (list): list of string text_ids to be coloured red with a (-)
             or, list of indices referring to those structures in the cursor.
+        page_size (int): when printing, the number of rows to format and print at once.
         kwargs (dict): any extra args are ignored.
 
     Returns:
@@ -142,16 +145,6 @@ def display_results(
     if markdown and latex:
         latex = False
 
-    # lists in which to accumulate the table
-    struct_strings = []
-    detail_strings = []
-    detail_substrings = []
-    source_strings = []
-    formulae = []
-
-    # tracking the last formula
-    last_formula = ""
-
     if not cursor:
         raise RuntimeError("No structures found in cursor.")
 
@@ -171,10 +164,6 @@ def display_results(
             "provenance & "
             "description \\\\ \n\n"
         )
-        latex_struct_strings = []
-        latex_sub_style = r"\mathrm"
-    else:
-        latex_sub_style = ""
 
     header_string, units_string = _construct_header_string(
         markdown, use_source, per_atom, eform, hull, summary, energy_key
@@ -191,11 +180,146 @@ def display_results(
             enumerate(cursor), key=lambda element: recursive_get(element[1], energy_key)
         )
         cursor = [ind[1] for ind in sorted_inds]
-        sorted_inds = [ind[0] for ind in sorted_inds]
+        new_inds = {
+            old_ind: new_ind for new_ind, (old_ind, _) in enumerate(sorted_inds)
+        }
         if additions is not None and add_index_mode:
-            additions = [sorted_inds.index(ind) for ind in additions]
+            additions = [new_inds[ind] for ind in additions]
         if deletions is not None and del_index_mode:
-            deletions = [sorted_inds.index(ind) for ind in deletions]
+            deletions = [new_inds[ind] for ind in deletions]
+
+    # the rows of the table are only formatted as they are needed
+    rows = _iter_display_rows(
+        cursor,
+        padding_length=len(header_string),
+        energy_key=energy_key,
+        additions=additions,
+        deletions=deletions,
+        add_index_mode=add_index_mode,
+        del_index_mode=del_index_mode,
+        hull=hull,
+        markdown=markdown,
+        latex=latex,
+        colour=colour,
+        use_source=use_source,
+        details=details,
+        per_atom=per_atom,
+        eform=eform,
+        source=source,
+    )
+
+    # filter for lowest energy phase per stoichiometry
+    if summary:
+        rows = _iter_first_row_per_formula(rows)
+
+    total_string = ""
+    total_string += len(header_string) * "─" + "\n"
+    total_string += header_string + "\n"
+    total_string += units_string + "\n"
+    total_string += len(header_string) * "─" + "\n"
+
+    # construct final string containing table
+    if markdown:
+        markdown_string += len(header_string) * "-" + "\n"
+        markdown_string += header_string + "\n"
+        markdown_string += units_string + "\n"
+        markdown_string += len(header_string) * "-" + "\n"
+        markdown_string += "\n".join(row.struct_string for row in rows)
+        markdown_string += "```"
+        return markdown_string
+
+    if latex:
+        latex_string += "\n".join(row.latex_string for row in rows)
+        latex_string += "\\end{tabular}"
+        return latex_string
+
+    if return_str:
+        return total_string + "".join(row.text for row in rows)
+
+    _print_in_pages(total_string, rows, page_size=page_size)
+
+
+def _print_in_pages(header, rows, page_size=100):
+    """Print the table header, then the rows of the table in pages as
+    they are formatted, such that output starts immediately for large
+    tables. If the output is closed early, e.g. by quitting a pager
+    or by `head`, the remaining rows are never formatted.
+
+    Parameters:
+        header (str): the header of the table.
+        rows (iterable of _DisplayRow): the lazily-formatted rows.
+
+    Keyword arguments:
+        page_size (int): the number of rows to print at once.
+
+    """
+    import sys
+    from itertools import islice
+
+    try:
+        sys.stdout.write(header)
+        rows = iter(rows)
+        while True:
+            page = "".join(row.text for row in islice(rows, page_size))
+            if not page:
+                break
+            sys.stdout.write(page)
+            sys.stdout.flush()
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # silence the error that would otherwise be raised when flushing at exit
+        import os
+
+        try:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+        except (AttributeError, OSError, ValueError):
+            pass
+
+
+class _DisplayRow(NamedTuple):
+    """The formatted output for a single structure in `display_results`."""
+
+    formula: str
+    struct_string: str
+    latex_string: Optional[str]
+    text: str
+
+
+def _iter_display_rows(
+    cursor,
+    padding_length,
+    energy_key,
+    additions,
+    deletions,
+    add_index_mode,
+    del_index_mode,
+    hull,
+    markdown,
+    latex,
+    colour,
+    use_source,
+    details,
+    per_atom,
+    eform,
+    source,
+):
+    """Lazily format each row of the table printed by `display_results`,
+    in the order of the cursor. For arguments, see the docstring of
+    `matador.utils.cursor_utils.display_results`.
+
+    Yields:
+        _DisplayRow: the formula of the structure, its row in the table,
+            its row in the LaTeX table (if requested), and its full entry
+            in the plain text table, including details and sources.
+
+    """
+    latex_sub_style = r"\mathrm" if latex else ""
+    separator = padding_length * "─" + "\n"
+
+    # tracking the last formula
+    last_formula = ""
 
     # loop over structures and create pretty output
     for ind, doc in enumerate(cursor):
@@ -212,49 +336,43 @@ def display_results(
             formula_substring += "+CNT"
         if last_formula != formula_substring:
             gs_enthalpy = 0.0
-        formulae.append(formula_substring)
 
-        struct_strings.append(
-            _construct_structure_string(
-                doc,
-                ind,
-                formula_substring,
-                gs_enthalpy,
-                use_source,
-                colour,
-                hull,
-                additions,
-                deletions,
-                add_index_mode,
-                del_index_mode,
-                energy_key,
-                per_atom,
-                eform,
-                markdown,
-                latex,
-            )
+        struct_string = _construct_structure_string(
+            doc,
+            ind,
+            formula_substring,
+            gs_enthalpy,
+            use_source,
+            colour,
+            hull,
+            additions,
+            deletions,
+            add_index_mode,
+            del_index_mode,
+            energy_key,
+            per_atom,
+            eform,
+            markdown,
+            latex,
         )
 
+        latex_struct_string = None
         if latex:
-            latex_struct_strings.append(
-                "{:^30} {:^10} & ".format(
-                    formula_substring,
-                    "$\\star$" if doc.get("hull_distance") == 0 else "",
-                )
+            latex_struct_string = "{:^30} {:^10} & ".format(
+                formula_substring,
+                "$\\star$" if doc.get("hull_distance") == 0 else "",
             )
-            latex_struct_strings[-1] += (
+            latex_struct_string += (
                 "{:^20.0f} & ".format(doc.get("hull_distance") * 1000)
                 if doc.get("hull_distance", 0) > 0
                 else "{:^20} &".format("-")
             )
-            latex_struct_strings[-1] += "{:^20} & ".format(
-                doc.get("space_group", "xxx")
-            )
+            latex_struct_string += "{:^20} & ".format(doc.get("space_group", "xxx"))
             prov = get_guess_doc_provenance(doc["source"], doc.get("icsd"))
             if doc.get("icsd"):
                 prov += " {}".format(doc["icsd"])
-            latex_struct_strings[-1] += "{:^30} & ".format(prov)
-            latex_struct_strings[-1] += "{:^30} \\\\".format("")
+            latex_struct_string += "{:^30} & ".format(prov)
+            latex_struct_string += "{:^30} \\\\".format("")
 
         if last_formula != formula_substring:
             if per_atom:
@@ -266,70 +384,33 @@ def display_results(
 
         last_formula = formula_substring
 
+        text = struct_string + "\n"
         if details:
             detail_string, detail_substring = _construct_detail_strings(
-                doc, padding_length=len(header_string), source=source
+                doc, padding_length=padding_length, source=source
             )
-            detail_strings.append(detail_string)
-            detail_substrings.append(detail_substring)
+            text += detail_string + "\n"
+            text += detail_substring + "\n"
 
         if source:
-            source_strings.append(_construct_source_string(doc["source"]))
+            text += _construct_source_string(doc["source"]) + "\n"
 
-    total_string = ""
-    total_string += len(header_string) * "─" + "\n"
-    total_string += header_string + "\n"
-    total_string += units_string + "\n"
-    total_string += len(header_string) * "─" + "\n"
+        if details or source:
+            text += separator
 
-    if markdown:
-        markdown_string += len(header_string) * "-" + "\n"
-        markdown_string += header_string + "\n"
-        markdown_string += units_string + "\n"
-        markdown_string += len(header_string) * "-" + "\n"
+        yield _DisplayRow(formula_substring, struct_string, latex_struct_string, text)
 
-    summary_inds = []
-    # filter for lowest energy phase per stoichiometry
-    if summary:
-        current_formula = ""
-        formula_list = {}
-        for ind, substring in enumerate(formulae):
-            if substring != current_formula and substring not in formula_list:
-                current_formula = substring
-                formula_list[substring] = 0
-                summary_inds.append(ind)
-            formula_list[substring] += 1
-    else:
-        summary_inds = range(len(struct_strings))
 
-    # construct final string containing table
-    if markdown:
-        markdown_string += "\n".join(struct_strings[ind] for ind in summary_inds)
-    elif latex:
-        latex_string += "\n".join(latex_struct_strings[ind] for ind in summary_inds)
-    else:
-        for ind in summary_inds:
-            total_string += struct_strings[ind] + "\n"
-            if details:
-                total_string += detail_strings[ind] + "\n"
-                total_string += detail_substrings[ind] + "\n"
-            if source:
-                total_string += source_strings[ind] + "\n"
-            if details or source:
-                total_string += len(header_string) * "─" + "\n"
+def _iter_first_row_per_formula(rows):
+    """Filter the rows of the table for the first (i.e. lowest energy)
+    structure of each formula.
 
-    if markdown:
-        markdown_string += "```"
-        return markdown_string
-
-    if latex:
-        latex_string += "\\end{tabular}"
-        return latex_string
-
-    if return_str:
-        return total_string
-
-    print(total_string)
+    """
+    seen_formulae = set()
+    for row in rows:
+        if row.formula not in seen_formulae:
+            seen_formulae.add(row.formula)
+            yield row
 
 
 def loading_bar(iterable, width=80, verbosity=0):
@@ -471,6 +552,10 @@ def filter_unique_structures(cursor, quiet=False, **kwargs):
     """
     from matador.fingerprints.similarity import get_uniq_cursor
 
+    if not cursor:
+        print("Filtered 0 down to 0")
+        return []
+
     uniq_inds, dupe_dict, _, _ = get_uniq_cursor(cursor, **kwargs)
     filtered_cursor = [cursor[ind] for ind in uniq_inds]
 
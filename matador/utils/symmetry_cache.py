@@ -0,0 +1,278 @@
+# coding: utf-8
+# Distributed under the terms of the MIT License.
+
+""" This submodule implements a cache of spglib results (space groups,
+standardized cells and symmetry operations), keyed on a hash of the
+structure and the symmetry tolerance, so that repeated symmetry
+analysis of the same structure only calls spglib once.
+
+Results are held in memory with a least-recently-used policy and can
+optionally also be stored on disk, to be reused across sessions, with
+:func:`configure_symmetry_cache`.
+
+"""
+
+
+import os
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from matador.utils.cache_utils import read_npz_cache, write_npz_cache
+
+__all__ = [
+    "SymmetryCache",
+    "structure_hash",
+    "get_symmetry_cache",
+    "configure_symmetry_cache",
+]
+
+SYMMETRY_CACHE_VERSION = 2
+
+
+def structure_hash(spg_cell, symprec=None, *extra):
+    """Return a hash of an spglib cell and symmetry tolerance.
+
+    Parameters:
+        spg_cell (tuple): spglib-style tuple of lattice, fractional
+            positions and atomic numbers.
+
+    Keyword arguments:
+        symprec (float): spglib symmetry tolerance.
+        extra: any other values that the result depends on, which
+            must have a deterministic `repr`.
+
+    Returns:
+        str: the hexadecimal digest.
+
+    """
+    lattice, positions, numbers = spg_cell[:3]
+    digest = hashlib.blake2b(digest_size=20)
+    for array, dtype in (
+        (lattice, np.float64),
+        (positions, np.float64),
+        (numbers, np.int64),
+    ):
+        array = np.ascontiguousarray(array, dtype=dtype)
+        digest.update(repr(array.shape).encode("utf-8"))
+        digest.update(array.tobytes())
+    digest.update(repr((symprec,) + extra).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _freeze(value):
+    """Return a copy of the value with any arrays made read-only."""
+    if isinstance(value, np.ndarray):
+        value = value.copy()
+        value.setflags(write=False)
+        return value
+    if isinstance(value, tuple):
+        return tuple(_freeze(val) for val in value)
+    if isinstance(value, list):
+        return [_freeze(val) for val in value]
+    if isinstance(value, dict):
+        return {key: _freeze(val) for key, val in value.items()}
+    return copy.deepcopy(value)
+
+
+def _thaw(value):
+    """Return a copy of a frozen value that shares its read-only arrays,
+    so that callers cannot modify the cached value.
+
+    """
+    if isinstance(value, np.ndarray):
+        return value
+    if isinstance(value, tuple):
+        return tuple(_thaw(val) for val in value)
+    if isinstance(value, list):
+        return [_thaw(val) for val in value]
+    if isinstance(value, dict):
+        return {key: _thaw(val) for key, val in value.items()}
+    return copy.deepcopy(value)
+
+
+class SymmetryCache:
+    """A least-recently-used cache of spglib results, optionally backed
+    by a directory of `.npz` files that are read without unpickling.
+
+    Cached values are stored with read-only arrays and every lookup
+    returns new containers, so modifying a result cannot corrupt the cache.
+
+    Example:
+
+        >>> cache = SymmetryCache(maxsize=100)
+        >>> cache.lookup(
+        ...     "spacegroup", spg_cell, 1e-2,
+        ...     lambda: spglib.get_spacegroup(spg_cell, symprec=1e-2)
+        ... )
+
+    """
+
+    def __init__(self, maxsize=4096, path=None):
+        """Initialise an empty cache.
+
+        Keyword arguments:
+            maxsize (int): the maximum number of results to keep in memory,
+                0 disables the in-memory cache.
+            path (str): a directory in which to also store results on
+                disk, or None to only cache in memory.
+
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, kind, spg_cell, symprec, function, **kwargs):
+        """Return the cached result of an spglib call for this cell,
+        computing and caching it if it is missing.
+
+        Parameters:
+            kind (str): the name of the result, e.g. "spacegroup".
+            spg_cell (tuple): spglib-style cell that the result is for.
+            symprec (float): the symmetry tolerance of the result.
+            function (callable): called with no arguments to compute the
+                result if it is not cached. Results of None are not cached.
+
+        Keyword arguments:
+            kwargs: any other parameters that the result depends on.
+
+        Returns:
+            the (possibly cached) result, with read-only arrays.
+
+        """
+        key = self.get_key(kind, spg_cell, symprec, **kwargs)
+        result = self.get(key)
+        if result is not None:
+            return result
+
+        result = function()
+        if result is None:
+            return None
+        return _thaw(self.set(key, result))
+
+    @staticmethod
+    def get_key(kind, spg_cell, symprec, **kwargs):
+        """Return the key of a result in the cache, which includes the
+        spglib version so that stored results are not reused across versions.
+
+        """
+        import spglib
+
+        return structure_hash(
+            spg_cell,
+            symprec,
+            kind,
+            repr(sorted(kwargs.items())),
+            getattr(spglib, "__version__", None),
+            SYMMETRY_CACHE_VERSION,
+        )
+
+    def get(self, key):
+        """Return a copy of the cached result under this key, or None."""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return _thaw(self._cache[key])
+
+        result = self._load(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, result)
+        return _thaw(result)
+
+    def set(self, key, result):
+        """Store a copy of the result in memory and, if a path was given,
+        on disk, returning the stored copy.
+
+        """
+        result = _freeze(result)
+        with self._lock:
+            self._insert(key, result)
+        self._write(key, result)
+        return result
+
+    def clear(self):
+        """Empty the in-memory cache, leaving any stored results on disk."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _insert(self, key, result):
+        if self.maxsize <= 0:
+            return
+        self._cache[key] = result
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def _get_fname(self, key):
+        return os.path.join(self.path, key[:2], "{}.npz".format(key))
+
+    def _load(self, key):
+        """Return the result stored on disk under this key, or None."""
+        if self.path is None:
+            return None
+        result = read_npz_cache(self._get_fname(key), key)
+        if result is None:
+            return None
+        return _freeze(result)
+
+    def _write(self, key, result):
+        """Atomically write the result to disk, if a path was given.
+        Failures to write are not fatal.
+
+        """
+        if self.path is None:
+            return
+        fname = self._get_fname(key)
+        try:
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            write_npz_cache(fname, key, result)
+        except Exception as exc:
+            print("Unable to write symmetry cache {}: {}".format(fname, exc))
+
+
+_SYMMETRY_CACHE = SymmetryCache()
+
+
+def get_symmetry_cache():
+    """Return the cache used by the spglib wrappers in
+    :mod:`matador.utils.cell_utils`.
+
+    """
+    return _SYMMETRY_CACHE
+
+
+def configure_symmetry_cache(maxsize=4096, path=None):
+    """Replace the cache used by the spglib wrappers in
+    :mod:`matador.utils.cell_utils`.
+
+    Keyword arguments:
+        maxsize (int): the maximum number of results to keep in memory,
+            0 disables the in-memory cache.
+        path (str): a directory in which to also store results on disk,
+            to be reused across sessions, or None to only cache in memory.
+
+    Returns:
+        SymmetryCache: the new cache.
+
+    """
+    global _SYMMETRY_CACHE
+    if path is not None:
+        path = os.path.expanduser(path)
+    _SYMMETRY_CACHE = SymmetryCache(maxsize=maxsize, path=path)
+    return _SYMMETRY_CACHE
@@ -137,6 +137,17 @@ class CastepMagresWorkflow(Workflow):
             },
         }
 
+        # the DOS branch and the magres step only need the SCF, so can be run
+        # at the same time when the workflow is passed max_workers > 1
+        depends = {
+            "relax": {"provides": ["structure"]},
+            "scf": {"requires": ["structure"], "provides": ["scf"]},
+            "dos": {"requires": ["scf"], "provides": ["dos"]},
+            "pdos": {"requires": ["dos"]},
+            "broadening": {"requires": ["dos"]},
+            "magres": {"requires": ["scf"]},
+        }
+
         odi_fname = _get_optados_fname(self.seed)
         if odi_fname is not None:
             odi_dict, _ = arbitrary2dict(odi_fname)
@@ -168,6 +179,8 @@ class CastepMagresWorkflow(Workflow):
                     key,
                     input_exts=exts[key].get("input"),
                     output_exts=exts[key].get("output"),
+                    requires=depends[key].get("requires"),
+                    provides=depends[key].get("provides"),
                 )
 
 
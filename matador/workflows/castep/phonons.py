@@ -109,6 +109,16 @@ class CastepPhononWorkflow(Workflow):
             },
         }
 
+        # the interpolations only need the dynamical matrix, so can be run at
+        # the same time when the workflow is passed max_workers > 1
+        depends = {
+            "relax": {"provides": ["structure"]},
+            "dynmat": {"requires": ["structure"], "provides": ["dynmat"]},
+            "vdos": {"requires": ["dynmat"]},
+            "dispersion": {"requires": ["dynmat"]},
+            "thermodynamics": {"requires": ["dynmat"]},
+        }
+
         if self.calc_doc.get("task").lower() in [
             "phonon",
             "thermodynamics",
@@ -141,6 +151,8 @@ class CastepPhononWorkflow(Workflow):
                     key,
                     input_exts=exts[key].get("input"),
                     output_exts=exts[key].get("output"),
+                    requires=depends[key].get("requires"),
+                    provides=depends[key].get("provides"),
                 )
 
         # always standardise the cell so that any phonon calculation can have
@@ -257,6 +269,8 @@ def castep_phonon_dos(computer, calc_doc, seed):
     dos_doc["task"] = "phonon"
     dos_doc["phonon_calculate_dos"] = True
     dos_doc["continuation"] = "default"
+    # disable checkpointing for interpolations, leaving just the dynmat
+    dos_doc["write_checkpoint"] = "none"
 
     required = ["phonon_fine_kpoint_mp_spacing"]
     forbidden = [
@@ -285,6 +299,8 @@ def castep_phonon_dispersion(computer, calc_doc, seed):
     disp_doc["task"] = "phonon"
     disp_doc["phonon_calculate_dos"] = False
     disp_doc["continuation"] = "default"
+    # disable checkpointing for interpolations, leaving just the dynmat
+    disp_doc["write_checkpoint"] = "none"
 
     required = []
     forbidden = ["phonon_fine_kpoint_mp_spacing"]
@@ -307,6 +323,8 @@ def castep_phonon_thermodynamics(computer, calc_doc, seed):
     LOG.info("Performing CASTEP thermodynamics calculation...")
     thermo_doc = copy.deepcopy(calc_doc)
     thermo_doc["continuation"] = "default"
+    # disable checkpointing for interpolations, leaving just the dynmat
+    thermo_doc["write_checkpoint"] = "none"
     thermo_doc["task"] = "thermodynamics"
     thermo_doc["phonon_calculate_dos"] = False
 
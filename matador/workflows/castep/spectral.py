@@ -45,7 +45,7 @@ def castep_full_spectral(computer, calc_doc, seed, **kwargs):
         bool: True if Workflow completed successfully, or False otherwise.
 
     """
-    workflow = CastepSpectralWorkflow(computer, calc_doc, seed)
+    workflow = CastepSpectralWorkflow(computer, calc_doc, seed, **kwargs)
     return workflow.success
 
 
@@ -127,6 +127,17 @@ class CastepSpectralWorkflow(Workflow):
             },
         }
 
+        # the DOS and dispersion branches only need the SCF, so can be run at
+        # the same time when the workflow is passed max_workers > 1
+        depends = {
+            "scf": {"provides": ["scf"]},
+            "dos": {"requires": ["scf"], "provides": ["dos"]},
+            "pdos": {"requires": ["dos"]},
+            "broadening": {"requires": ["dos"]},
+            "dispersion": {"requires": ["scf"], "provides": ["dispersion"]},
+            "pdis": {"requires": ["dispersion"]},
+        }
+
         if os.path.isfile(self.seed + ".check"):
             LOG.info("Found {}.check, so skipping initial SCF.".format(self.seed))
             todo["scf"] = False
@@ -161,6 +172,8 @@ class CastepSpectralWorkflow(Workflow):
                     key,
                     input_exts=exts[key].get("input"),
                     output_exts=exts[key].get("output"),
+                    requires=depends[key].get("requires"),
+                    provides=depends[key].get("provides"),
                 )
 
         # if not using a user-requested path, use seekpath and spglib
@@ -7,6 +7,8 @@ of chaining up different calculations at high-throughput.
 """
 
 import abc
+import copy
+import glob
 import os
 import logging
 from matador.utils.print_utils import dumps
@@ -33,6 +35,14 @@ class Workflow:
         steps (:obj:`list` of :obj:`WorkflowStep`): list of steps to be
             completed.
 
+    Steps are run in the order they were added, unless `max_workers` > 1
+    is passed as a workflow keyword argument (e.g. with `run3
+    --workflow_workers`). In this case, steps that declare the data they
+    require and provide (see :meth:`add_step`) are run as a dependency graph,
+    with up to `max_workers` independent steps run concurrently in their own
+    processes and directories, without exceeding `max_cores` (default
+    `computer.ncores`) across all running steps.
+
     """
 
     def __init__(self, computer, calc_doc, seed, **workflow_kwargs):
@@ -163,6 +173,9 @@ class Workflow:
         input_exts=None,
         output_exts=None,
         clean_after=False,
+        requires=None,
+        provides=None,
+        ncores=None,
         **func_kwargs
     ):
         """Add a step to the workflow.
@@ -174,30 +187,48 @@ class Workflow:
 
         Keyword arguments:
             clean_after (bool): whether or not to clean up after this step is called
+            requires (:obj:`list` of :obj:`str`): labels of the data this step needs
+                from earlier steps, e.g. `["scf"]`.
+            provides (:obj:`list` of :obj:`str`): labels of the data this step
+                produces for later steps. If neither `requires` nor `provides` is
+                set, the step waits for all earlier steps, and all later steps
+                wait for it.
+            ncores (int): number of cores to run this step on, overriding
+                `computer.ncores`.
             func_kwargs (dict): any arguments to pass to function when called.
 
         """
         self.steps.append(
             WorkflowStep(
-                function, name, self.compute_dir, input_exts, output_exts, **func_kwargs
+                function,
+                name,
+                self.compute_dir,
+                input_exts,
+                output_exts,
+                requires=requires,
+                provides=provides,
+                ncores=ncores,
+                **func_kwargs
             )
         )
         self.clean_after_step.append(clean_after)
 
     def run_steps(self):
-        """Loop over steps and run them."""
+        """Run the steps, either in order or as a dependency graph."""
         try:
             if not self.steps:
                 msg = "No steps added to Workflow!"
                 LOG.error(msg)
                 raise RuntimeError(msg)
 
-            for ind, step in enumerate(self.steps):
-                LOG.info("Running step {step.name}: {step.function}".format(step=step))
-                LOG.debug("Current state: " + dumps(self.calc_doc, indent=None))
-                success = step.run_step(self.computer, self.calc_doc, self.seed)
-                if self.clean_after_step[ind]:
-                    self._clean_up(success=success)
+            max_workers = self.workflow_params.get("max_workers", 1)
+            if max_workers > 1:
+                self._run_step_graph(max_workers)
+            else:
+                for ind, step in enumerate(self.steps):
+                    success = self._run_step(step)
+                    if self.clean_after_step[ind]:
+                        self._clean_up(success=success)
 
             self.success = True
 
@@ -207,6 +238,380 @@ class Workflow:
             LOG.error(msg)
             raise RuntimeError(msg)
 
+    def _run_step(self, step):
+        """Run a single step, on the number of cores requested by
+        the step, if any.
+
+        """
+        LOG.info("Running step {step.name}: {step.function}".format(step=step))
+        LOG.debug("Current state: " + dumps(self.calc_doc, indent=None))
+        if step.ncores is None or step.ncores == self.computer.ncores:
+            return step.run_step(self.computer, self.calc_doc, self.seed)
+
+        ncores = self.computer.ncores
+        self.computer.ncores = step.ncores
+        try:
+            return step.run_step(self.computer, self.calc_doc, self.seed)
+        finally:
+            self.computer.ncores = ncores
+
+    def _run_step_graph(self, max_workers):
+        """Run the steps as soon as the steps they depend on have finished
+        and enough cores are free, starting them in the order they were added.
+
+        A step that is ready when no other step is running or ready runs in
+        this process on all of `computer.ncores`, as it would in sequence.
+        Otherwise, each step runs in its own process (see
+        :meth:`_run_step_in_subdir`) on its own `ncores`, or an equal share of
+        `max_cores` between `max_workers`, with its own copy of the computer
+        and calc_doc, inside its own directory. Once it has finished, the files
+        it wrote and its changes to calc_doc are collected (see
+        :meth:`_finish_step_process`). If any step fails, or two steps that ran
+        at the same time wrote different versions of the same file or calc_doc
+        key, no further steps are started, and the error is raised once the
+        running steps finish.
+
+        Parameters:
+            max_workers (int): the maximum number of steps to run at once.
+
+        Raises:
+            RuntimeError: if any step fails.
+
+        """
+        from multiprocessing.connection import wait
+
+        max_cores = self.workflow_params.get("max_cores", self.computer.ncores)
+        if max_cores is None:
+            max_cores = max_workers
+        dependencies = self.get_step_dependencies()
+        share = max(max_cores // max_workers, 1)
+        step_cores = [min(step.ncores or share, max_cores) for step in self.steps]
+
+        pending = list(range(len(self.steps)))
+        finished = set()
+        running = {}
+        changes = []
+        free_cores = max_cores
+        error = None
+
+        while pending or running:
+            if error is not None:
+                pending = []
+            ready = [ind for ind in pending if dependencies[ind] <= finished]
+
+            # nothing could run alongside this step, so run it here
+            if not running and len(ready) == 1:
+                ind = ready[0]
+                pending.remove(ind)
+                try:
+                    success = self._run_step(self.steps[ind])
+                except RuntimeError as exc:
+                    error = exc
+                    continue
+                finished.add(ind)
+                if self.clean_after_step[ind]:
+                    self._clean_up(success=success)
+                continue
+
+            for ind in ready:
+                if len(running) >= max_workers:
+                    break
+                # do not let smaller steps overtake earlier ready steps
+                if step_cores[ind] > free_cores:
+                    break
+                calc_doc = copy.deepcopy(self.calc_doc)
+                receiver, process, compute_dir = self._start_step_process(
+                    ind, step_cores[ind]
+                )
+                running[receiver] = (ind, process, compute_dir, calc_doc, len(changes))
+                free_cores -= step_cores[ind]
+                pending.remove(ind)
+
+            if not running:
+                break
+
+            for receiver in wait(list(running)):
+                ind, process, compute_dir, calc_doc, started = running.pop(receiver)
+                free_cores += step_cores[ind]
+                try:
+                    success = self._finish_step_process(
+                        ind, receiver, process, compute_dir, calc_doc, changes, started
+                    )
+                except Exception as exc:
+                    if error is None:
+                        error = exc
+                    continue
+                finished.add(ind)
+                if self.clean_after_step[ind]:
+                    self._clean_up(success=success)
+
+        if error is not None:
+            raise error
+
+    def _start_step_process(self, ind, ncores):
+        """Start a process that runs a step inside its own directory.
+
+        Parameters:
+            ind (int): the index of the step to run.
+            ncores (int): the number of cores to run the step on.
+
+        Returns:
+            (multiprocessing.connection.Connection, multiprocessing.Process, str):
+                the connection that the result will be sent through, the
+                started process and the directory of the step.
+
+        """
+        import multiprocessing as mp
+
+        step = self.steps[ind]
+        compute_dir = os.path.join(
+            self.compute_dir or ".",
+            "{}_{}".format(self.seed, step.name).replace(" ", "_").replace("/", "_"),
+        )
+        receiver, sender = mp.Pipe(duplex=False)
+        process = mp.Process(
+            target=self._run_step_in_subdir, args=(step, compute_dir, ncores, sender)
+        )
+        process.start()
+        sender.close()
+        return receiver, process, compute_dir
+
+    def _run_step_in_subdir(self, step, compute_dir, ncores, connection):
+        """Run a step inside its own directory, as if it were the root folder,
+        then send its success, the resulting calc_doc, the files it wrote and
+        any error raised through the connection. This is the target of the
+        processes started by `_start_step_process`, and so only changes this
+        process's copy of the workflow.
+
+        The seed files (and any OptaDOS inputs) in the root folder and then the
+        workflow's compute directory are copied into the step's directory, and
+        the pseudopotentials are linked, before it is run. Afterwards, the
+        files that are new or were changed are reported, except those that the
+        step also cached under its own name, i.e. `<seed>.<ext>` is dropped in
+        favour of `<seed>.<ext>_<step>`. Files that were deleted are ignored.
+
+        """
+        from matador.compute.staging import stage_files
+
+        os.makedirs(compute_dir, exist_ok=True)
+        fnames = glob.glob(self.seed + "*") + glob.glob("*.odi")
+        if self.compute_dir is not None:
+            fnames += glob.glob(os.path.join(self.compute_dir, self.seed + "*"))
+        stage_files([fname for fname in fnames if os.path.isfile(fname)], compute_dir)
+        cell_dict = getattr(self.computer, "cell_dict", None)
+        if cell_dict is not None:
+            pspots = [
+                pspot
+                for pspot in set(cell_dict.get("species_pot", {}).values())
+                if os.path.isfile(pspot)
+            ]
+            stage_files(pspots, compute_dir, link=True)
+
+        os.chdir(compute_dir)
+        staged = _stat_files(".")
+        self.computer.root_folder = os.getcwd()
+        self.computer.compute_dir = None
+        self.computer.ncores = ncores
+        self.compute_dir = None
+        step.compute_dir = None
+        error = None
+        try:
+            success = self._run_step(step)
+        except Exception as exc:
+            success = False
+            error = exc
+
+        fnames = [
+            fname
+            for fname, stat in _stat_files(".").items()
+            if staged.get(fname) != stat
+        ]
+        fnames = [
+            fname for fname in fnames if "{}_{}".format(fname, step.name) not in fnames
+        ]
+
+        try:
+            connection.send((success, self.calc_doc, fnames, error))
+        except Exception:
+            # the error or calc_doc may not be picklable
+            connection.send(
+                (
+                    False,
+                    None,
+                    fnames,
+                    RuntimeError("WorkflowStep {} failed: {}".format(step.name, error)),
+                )
+            )
+        connection.close()
+
+    def _finish_step_process(
+        self, ind, receiver, process, compute_dir, calc_doc, changes, started
+    ):
+        """Collect the result of a step that was run in its own process,
+        moving the files it wrote into the workflow's directory (either the
+        compute directory, or the root folder), merging its changes to
+        calc_doc, and removing its directory.
+
+        If a step that finished while this step was running wrote a different
+        version of any of the same files or calc_doc keys, neither is
+        collected, and this step's directory is left in place.
+
+        Parameters:
+            ind (int): the index of the step.
+            receiver (multiprocessing.connection.Connection): the connection
+                the result is sent through.
+            process (multiprocessing.Process): the process running the step.
+            compute_dir (str): the directory of the step.
+            calc_doc (dict): the calc_doc at the time the step was started.
+            changes (list): the index, file names and calc_doc keys written
+                by each step collected so far, to which this step is added.
+            started (int): the number of steps collected before this step
+                was started.
+
+        Raises:
+            RuntimeError: if this step conflicts with another step.
+            Exception: any error raised by the step.
+
+        Returns:
+            bool: the success of the step.
+
+        """
+        import filecmp
+        import shutil
+
+        step = self.steps[ind]
+        try:
+            success, step_doc, fnames, error = receiver.recv()
+        except EOFError:
+            raise RuntimeError(
+                "WorkflowStep {} exited with code {}; leaving its files in {}".format(
+                    step.name, process.exitcode, compute_dir
+                )
+            )
+        finally:
+            receiver.close()
+            process.join()
+
+        keys = set()
+        if step_doc is not None:
+            keys = {key for key in calc_doc if key not in step_doc}
+            keys |= {
+                key
+                for key, value in step_doc.items()
+                if key not in calc_doc or not _is_equal(calc_doc[key], value)
+            }
+
+        work_dir = self.compute_dir or "."
+        for other_ind, other_fnames, other_keys in changes[started:]:
+            clashes = [
+                fname
+                for fname in sorted(set(fnames) & other_fnames)
+                if not filecmp.cmp(
+                    os.path.join(compute_dir, fname),
+                    os.path.join(work_dir, fname),
+                    shallow=False,
+                )
+            ]
+            clashes += [
+                key
+                for key in sorted(keys & other_keys)
+                if key not in step_doc
+                or key not in self.calc_doc
+                or not _is_equal(step_doc[key], self.calc_doc[key])
+            ]
+            if clashes:
+                changes.append((ind, set(), set()))
+                raise RuntimeError(
+                    "WorkflowSteps {} and {} ran at the same time and wrote different "
+                    "{}; leaving the files of {} in {}".format(
+                        self.steps[other_ind].name,
+                        step.name,
+                        clashes,
+                        step.name,
+                        compute_dir,
+                    )
+                )
+        changes.append((ind, set(fnames), keys))
+
+        for fname in fnames:
+            dst = os.path.join(work_dir, fname)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            os.replace(os.path.join(compute_dir, fname), dst)
+        shutil.rmtree(compute_dir, ignore_errors=True)
+
+        for key in keys:
+            if key in step_doc:
+                self.calc_doc[key] = step_doc[key]
+            else:
+                self.calc_doc.pop(key, None)
+
+        if error is not None:
+            raise error
+
+        return success
+
+    def get_step_dependencies(self):
+        """Work out which earlier steps each step must wait for, from the
+        data each step requires and provides.
+
+        A step waits for the most recent earlier steps that provide any data
+        it requires, and for any earlier steps that use data it provides.
+        Steps that declare neither act as barriers: they wait for all earlier
+        steps, and all later steps wait for them.
+
+        Returns:
+            :obj:`list` of :obj:`set` of :obj:`int`: the indices of the
+                steps that each step depends on.
+
+        """
+        dependencies = []
+        for ind, step in enumerate(self.steps):
+            depends = set()
+            undeclared = step.requires is None and step.provides is None
+            requires = set(step.requires or [])
+            provides = set(step.provides or [])
+            unresolved = set(requires)
+            for prev_ind in range(ind - 1, -1, -1):
+                prev = self.steps[prev_ind]
+                prev_requires = set(prev.requires or [])
+                prev_provides = set(prev.provides or [])
+                if (
+                    undeclared
+                    or (prev.requires is None and prev.provides is None)
+                    or unresolved & prev_provides
+                    or provides & (prev_requires | prev_provides)
+                ):
+                    depends.add(prev_ind)
+                unresolved -= prev_provides
+            dependencies.append(depends)
+
+        return dependencies
+
+
+def _stat_files(folder):
+    """Return the size and modification time of every file below a folder,
+    keyed by their paths relative to it.
+
+    """
+    stats = {}
+    for root, _, fnames in os.walk(folder):
+        for fname in fnames:
+            path = os.path.join(root, fname)
+            stat = os.stat(path)
+            stats[os.path.relpath(path, folder)] = (stat.st_size, stat.st_mtime_ns)
+    return stats
+
+
+def _is_equal(first, second):
+    """Compare two values of a calc_doc, treating any that cannot be
+    compared directly (e.g. numpy arrays) as different.
+
+    """
+    try:
+        return bool(first == second)
+    except (TypeError, ValueError):
+        return False
+
 
 class WorkflowStep:
     """An individual step in a Workflow, defined by a Python function
@@ -220,6 +625,10 @@ class WorkflowStep:
         func_kwargs (dict): any extra kwargs to pass to the function.
         input_exts (list): list of input file extensions to cache after running.
         output_exts (list): list of output file extensions to cache after running.
+        requires (list): labels of the data the step needs from earlier steps.
+        provides (list): labels of the data the step produces for later steps.
+        ncores (int): number of cores to run the step on, if different from the
+            workflow's computer.
 
     """
 
@@ -232,6 +641,9 @@ class WorkflowStep:
         compute_dir=None,
         input_exts=None,
         output_exts=None,
+        requires=None,
+        provides=None,
+        ncores=None,
         **func_kwargs
     ):
         """Construct a WorkflowStep from a function."""
@@ -242,6 +654,9 @@ class WorkflowStep:
         self.func_kwargs = func_kwargs
         self.input_exts = input_exts
         self.output_exts = output_exts
+        self.requires = requires
+        self.provides = provides
+        self.ncores = ncores
 
     def _cache_files(self, seed, exts, mode, directory=None):
         """Copy any files <seed>.<ext> for ext in exts to
@@ -253,8 +668,8 @@ class WorkflowStep:
             mode (str): either 'in' (warning printed if file missing) or 'out' (no warning).
 
         """
-        import shutil
         import glob
+        from matador.compute.staging import stage_file
 
         for ext in exts:
             if "*" in ext:
@@ -264,7 +679,8 @@ class WorkflowStep:
             for src in srcs:
                 dst = src + "_{}".format(self.name)
                 if os.path.isfile(src):
-                    shutil.copy2(src, dst, follow_symlinks=True)
+                    # skips the copy if the backup is already up to date
+                    stage_file(src, dst)
                     LOG.info("Backed up {} file {} to {}.".format(mode, src, dst))
                 else:
                     if mode == "in":
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Stand-in for CASTEP that writes the canned output for the requested seed
+seed="${@: -1}"
+cat "$(dirname "$0")"/completed_*/"$seed".castep > "$seed".castep
+sleep 1
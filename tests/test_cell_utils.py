@@ -408,6 +408,78 @@ class SymmetriesAndSupercellsTest(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             std_doc = standardize_doc_cell(doc)
 
+    def test_symmetry_cache(self):
+        import copy
+        import glob
+        import tempfile
+        from matador.utils.cell_utils import (
+            get_spacegroup_spg,
+            get_symmetry_spg,
+            standardize_doc_cell,
+        )
+        from matador.utils.symmetry_cache import (
+            configure_symmetry_cache,
+            get_symmetry_cache,
+        )
+
+        doc, s = castep2dict(REAL_PATH + "data/Na3Zn4-swap-ReOs-OQMD_759599.castep")
+        default_cache = get_symmetry_cache()
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                cache = configure_symmetry_cache(maxsize=2, path=tmpdir)
+                space_group = get_spacegroup_spg(doc)
+                self.assertEqual(get_spacegroup_spg(doc), space_group)
+                self.assertEqual((cache.hits, cache.misses), (1, 1))
+                self.assertNotEqual(get_spacegroup_spg(doc, symprec=1e-5), None)
+                self.assertEqual(cache.misses, 2)
+
+                symmetry = get_symmetry_spg(doc)
+                symmetry_rotations = symmetry["rotations"].copy()
+                self.assertEqual(len(cache), 2)
+                with self.assertRaises(ValueError):
+                    symmetry["rotations"][0, 0, 0] = 5
+                symmetry["rotations"] = None
+                self.assertEqual(
+                    len(get_symmetry_spg(doc)["rotations"]),
+                    len(get_symmetry_spg(doc)["translations"]),
+                )
+
+                std_doc = standardize_doc_cell(doc)
+                std_positions = copy.deepcopy(std_doc["positions_frac"])
+                std_doc["positions_frac"][0][0] += 0.5
+                self.assertEqual(
+                    standardize_doc_cell(doc)["positions_frac"][0][0] + 0.5,
+                    std_doc["positions_frac"][0][0],
+                )
+
+                # a new session reads the results back from disk
+                cache = configure_symmetry_cache(path=tmpdir)
+                self.assertEqual(get_spacegroup_spg(doc), space_group)
+                self.assertEqual((cache.hits, cache.misses), (1, 0))
+                np.testing.assert_array_equal(
+                    get_symmetry_spg(doc)["rotations"], symmetry_rotations
+                )
+                self.assertEqual(
+                    standardize_doc_cell(doc)["positions_frac"], std_positions
+                )
+                self.assertEqual(cache.misses, 0)
+
+                # files that would need unpickling are never loaded
+                cache = configure_symmetry_cache(path=tmpdir)
+                for fname in glob.glob(os.path.join(tmpdir, "*", "*.npz")):
+                    with open(fname, "wb") as f:
+                        np.savez(f, __meta__=np.array([{"key": None}], dtype=object))
+                self.assertEqual(get_spacegroup_spg(doc), space_group)
+                self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+                doc["positions_frac"][0][0] += 0.01
+                get_spacegroup_spg(doc)
+                self.assertEqual(cache.misses, 2)
+        finally:
+            configure_symmetry_cache(
+                maxsize=default_cache.maxsize, path=default_cache.path
+            )
+
 
 def pdf_sim_dist(doc_test, doc_supercell):
     doc_test["text_id"] = ["test", "cell"]
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+""" Test the export of structures to columnar tables. """
+
+import glob
+import json
+import unittest
+
+import numpy as np
+
+try:
+    import pyarrow  # noqa
+
+    PYARROW_IMPORTED = True
+except ImportError:
+    PYARROW_IMPORTED = False
+
+try:
+    import h5py  # noqa
+
+    H5PY_IMPORTED = True
+except ImportError:
+    H5PY_IMPORTED = False
+
+from matador.scrapers import castep2dict, res2dict
+from matador.export import query2table, table2query
+from matador.export.columnar import RaggedArray
+from .utils import REAL_PATH, MatadorUnitTest
+
+
+class ColumnarExportTest(MatadorUnitTest):
+    """Test round trips of real structures through Parquet and HDF5 tables."""
+
+    def setUp(self):
+        super().setUp()
+        self.cursor = []
+        for fname in sorted(glob.glob(REAL_PATH + "data/structures/*.res")):
+            doc, s = res2dict(fname, as_model=False)
+            if s:
+                self.cursor.append(doc)
+        for fname in [
+            "Na3Zn4-swap-ReOs-OQMD_759599.castep",
+            "KP-castep17.castep",
+        ]:
+            doc, s = castep2dict(REAL_PATH + "data/castep_files/" + fname)
+            self.assertTrue(s, msg=doc)
+            self.cursor.append(doc)
+        for fname in sorted(glob.glob(REAL_PATH + "data/json_query_files/*.json")):
+            with open(fname, "r") as f:
+                self.cursor.append(json.load(f))
+
+    def round_trip(self, fname):
+        table = query2table(self.cursor, fname)
+        self.assertEqual(table.kinds["enthalpy"], "scalar")
+        self.assertEqual(table.kinds["lattice_cart"], "array")
+        self.assertEqual(table.kinds["positions_frac"], "ragged")
+        self.assertEqual(table.kinds["atom_types"], "ragged")
+        self.assertEqual(table.kinds["forces"], "ragged")
+        self.assertEqual(table.kinds["stoichiometry"], "json")
+
+        read_table = table2query(fname)
+        self.assertEqual(len(read_table), len(self.cursor))
+        self.assertEqual(set(read_table.fields), set(table.fields))
+        positions = read_table["positions_frac"]
+        self.assertIsInstance(positions, RaggedArray)
+        self.assertEqual(positions.values.shape[1:], (3,))
+        np.testing.assert_array_equal(
+            positions.lengths, [doc["num_atoms"] for doc in self.cursor]
+        )
+        np.testing.assert_array_equal(
+            read_table["lattice_cart"][0], self.cursor[0]["lattice_cart"]
+        )
+        self.assertEqual(
+            list(read_table["atom_types"][-1]), self.cursor[-1]["atom_types"]
+        )
+
+        docs = read_table.to_dicts()
+        self.assertEqual(len(docs), len(self.cursor))
+        for doc, original in zip(docs, self.cursor):
+            # forces are only present in the castep files
+            self.assertEqual(set(doc), set(original))
+            for key in original:
+                self.assertEqual(doc[key], original[key], msg=key)
+
+        subset = table2query(fname, fields=["forces", "num_atoms"])
+        self.assertEqual(set(subset.fields), {"forces", "num_atoms"})
+        self.assertEqual(
+            sum("forces" in doc for doc in subset.to_dicts()),
+            sum("forces" in doc for doc in self.cursor),
+        )
+
+    @unittest.skipIf(not PYARROW_IMPORTED, "pyarrow not found")
+    def test_parquet_round_trip(self):
+        self.round_trip("structures.parquet")
+
+    @unittest.skipIf(not H5PY_IMPORTED, "h5py not found")
+    def test_hdf5_round_trip(self):
+        self.round_trip("structures.h5")
+
+    def test_bad_format(self):
+        with self.assertRaises(RuntimeError):
+            query2table(self.cursor, "structures.csv")
+
+    @unittest.skipIf(not H5PY_IMPORTED, "h5py not found")
+    def test_large_table_read(self):
+        """Check that 10^5 structures can be read back quickly."""
+        rng = np.random.default_rng(seed=0)
+        cursor = []
+        for ind in range(100_000):
+            num_atoms = int(rng.integers(1, 20))
+            cursor.append(
+                {
+                    "source": ["structure-{}.res".format(ind)],
+                    "enthalpy_per_atom": float(rng.random()),
+                    "num_atoms": num_atoms,
+                    "atom_types": ["K"] * (num_atoms // 2)
+                    + ["P"] * (num_atoms - num_atoms // 2),
+                    "positions_frac": rng.random((num_atoms, 3)),
+                    "lattice_cart": rng.random((3, 3)),
+                }
+            )
+        query2table(cursor, "large.h5")
+        table = table2query("large.h5")
+        self.assertEqual(len(table), 100_000)
+        self.assertEqual(table["atom_types"][10].tolist(), cursor[10]["atom_types"])
+        np.testing.assert_array_equal(
+            table["positions_frac"][-1], cursor[-1]["positions_frac"]
+        )
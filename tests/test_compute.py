@@ -8,10 +8,13 @@ from os.path import isfile, isdir
 import glob
 import copy
 import shutil
+import filecmp
 import time
+import logging
 import warnings
 import multiprocessing as mp
 
+import numpy as np
 import psutil
 
 from matador.utils.errors import (
@@ -22,6 +25,16 @@ from matador.utils.errors import (
     InputError,
 )
 from matador.compute import ComputeTask, BatchRun, reset_job_folder
+from matador.compute.batch import JobQueue
+from matador.compute.memcheck import (
+    MemcheckCache,
+    MemcheckModel,
+    get_memcheck_features,
+)
+from matador.compute.scheduler import job_ncores, pack_jobs, schedule_jobs
+from matador.compute.staging import stage_file, stage_files
+from matador.compute.supervisor import ProcessSupervisor
+from matador.compute.walltime import WalltimePredictor
 from matador.compute.slurm import SlurmQueueManager
 from matador.compute.pbs import PBSQueueManager
 from matador.scrapers.castep_scrapers import (
@@ -29,6 +42,8 @@ from matador.scrapers.castep_scrapers import (
     param2dict,
     res2dict,
     castep2dict,
+    CastepOutputReader,
+    CASTEP_RUN_HEADER_STRING,
 )
 from .utils import REAL_PATH, MatadorUnitTest, detect_program
 
@@ -775,6 +790,72 @@ class ComputeTest(MatadorUnitTest):
         self.assertTrue(all(files_exist))
         self.assertFalse(any(do_bad_files_exist))
 
+    def test_concurrent_convergence_tests(self):
+        """Run convergence tests on two concurrent workers with an executable
+        that writes canned CASTEP files, and summarise the results.
+
+        """
+        from matador.export import doc2res
+        from matador.plotting.convergence_plotting import (
+            get_convergence_files,
+            get_convergence_data,
+        )
+
+        res_dict, s = castep2dict(
+            REAL_PATH + "data/convergence/completed_cutoff/Li-bcc_300eV.castep",
+            db=False,
+        )
+        assert s
+        doc2res(res_dict, "Li-bcc.res", info=False)
+        param_dict = {
+            "task": "singlepoint",
+            "cut_off_energy": 300,
+            "xc_functional": "PBE",
+        }
+        cell_dict = {"kpoints_mp_spacing": 0.1}
+
+        relaxer = ComputeTask(
+            ncores=2,
+            nnodes=None,
+            node=None,
+            res="Li-bcc.res",
+            param_dict=param_dict,
+            cell_dict=cell_dict,
+            verbosity=VERBOSITY,
+            executable=REAL_PATH + "data/convergence/fake_castep.sh",
+            exec_test=False,
+            polltime=1,
+            conv_cutoff=[300, 400],
+            conv_kpt=[0.1, 0.07],
+            conv_workers=2,
+        )
+        self.assertTrue(relaxer.success)
+
+        for fname in [
+            "completed_cutoff/Li-bcc_300eV.castep",
+            "completed_cutoff/Li-bcc_400eV.castep",
+            "completed_kpts/Li-bcc_0.1A.castep",
+            "completed_kpts/Li-bcc_0.07A.castep",
+        ]:
+            self.assertTrue(isfile(fname), msg="Missing {}".format(fname))
+        self.assertFalse(isdir("bad_castep"))
+        self.assertEqual(glob.glob("conv_*"), [])
+
+        cutoff_data = get_convergence_data(
+            get_convergence_files("completed_cutoff"), conv_parameter="cut_off_energy"
+        )
+        kpt_data = get_convergence_data(
+            get_convergence_files("completed_kpts"), conv_parameter="kpoints_mp_spacing"
+        )
+        self.assertEqual(
+            sorted(cutoff_data["Li-bcc"]["cut_off_energy"]["cut_off_energy"]),
+            [300, 400],
+        )
+        self.assertEqual(
+            sorted(kpt_data["Li-bcc"]["kpoints_mp_spacing"]["kpoints_mp_spacing"]),
+            [0.07, 0.1],
+        )
+
     @unittest.skipIf(
         (not CASTEP_PRESENT or not MPI_PRESENT),
         "castep or mpirun executable not found in PATH",
@@ -1046,6 +1127,935 @@ class ComputeTest(MatadorUnitTest):
 
         self.assertTrue(all(errors))
 
+    def test_pack_requires_ncores(self):
+        """Check that run3 --pack falls over without the number of cores per job."""
+        for file in glob.glob(REAL_PATH + "data/file_collision/LiAs.*"):
+            shutil.copy(file, ".")
+        with self.assertRaises(InputError):
+            BatchRun(
+                seed=["LiAs"],
+                pack=True,
+                verbosity=VERBOSITY,
+                executable=EXECUTABLE,
+            )
+
+    def test_pack_releases_unstarted_jobs(self):
+        """Check that run3 --pack only claims the jobs it has room for, and
+        releases those it never started after a fatal error.
+
+        """
+        from unittest import mock
+
+        for file in glob.glob(REAL_PATH + "data/no_steps_left_todo/NaP.*"):
+            shutil.copy(file, ".")
+        jobs = ["job_{}.res".format(ind) for ind in range(6)]
+        for job in jobs:
+            shutil.copy(
+                REAL_PATH
+                + "data/no_steps_left_todo/cache/NaP_intermediates_stopped_early.res",
+                job,
+            )
+
+        def fail(job, error_queue, proc_id, result_queue=None):
+            error_queue.put((proc_id, CriticalError("Fatal"), job["res"]))
+
+        runner = BatchRun(
+            seed=["NaP"],
+            pack=True,
+            ncores=1,
+            maxmem=1000,
+            verbosity=VERBOSITY,
+            executable=EXECUTABLE,
+        )
+        with mock.patch.object(
+            runner, "estimate_memory", return_value=100
+        ) as estimate, mock.patch.object(
+            runner, "_perform_packed_calculation", side_effect=fail
+        ):
+            with self.assertRaises(CriticalError):
+                runner.spawn_packed()
+
+        # only the jobs that fitted in the first window were estimated
+        self.assertLess(estimate.call_count, len(jobs))
+        locked = [job for job in jobs if isfile(job + ".lock")]
+        with open("jobs.txt", "r") as f:
+            listed = [line.strip() for line in f if line.strip()]
+        # only the started jobs keep their claim
+        self.assertEqual(sorted(listed), sorted(locked))
+        self.assertTrue(0 < len(locked) <= min(ACTUAL_NCORES, len(jobs)))
+
+    def test_pack_mixed_core_counts(self):
+        """Check that run3 --pack runs each job on the same share of the cores
+        as its memory estimate is of the max memory, up to --ncores.
+
+        """
+        from unittest import mock
+
+        for file in glob.glob(REAL_PATH + "data/no_steps_left_todo/NaP.*"):
+            shutil.copy(file, ".")
+        mems = {"job_0.res": 100, "job_1.res": 400, "job_2.res": 800, "job_3.res": 50}
+        for job in mems:
+            shutil.copy(
+                REAL_PATH
+                + "data/no_steps_left_todo/cache/NaP_intermediates_stopped_early.res",
+                job,
+            )
+
+        def record(job, error_queue, proc_id, result_queue=None):
+            with open(job["res"] + ".ncores", "w") as f:
+                f.write(str(job["ncores"]))
+            error_queue.put((proc_id, 0, job["res"]))
+
+        runner = BatchRun(
+            seed=["NaP"],
+            pack=True,
+            ncores=6,
+            maxmem=1000,
+            verbosity=VERBOSITY,
+            executable=EXECUTABLE,
+        )
+        runner.all_cores = 8
+        with mock.patch.object(
+            runner, "estimate_memory", side_effect=lambda res: mems[res]
+        ), mock.patch.object(runner, "_perform_packed_calculation", side_effect=record):
+            runner.spawn_packed()
+
+        ncores = {}
+        for job in mems:
+            with open(job + ".ncores") as f:
+                ncores[job] = int(f.read())
+        self.assertEqual(
+            ncores, {"job_0.res": 1, "job_1.res": 4, "job_2.res": 6, "job_3.res": 1}
+        )
+
+    def test_pack_batches_results_in_one_sink(self):
+        """Check that run3 --pack pushes the results of all packed jobs
+        through one result sink in the parent process.
+
+        """
+        from unittest import mock
+        import mongomock
+        from matador.db.sink import DatabaseSink, QueueSink
+
+        for file in glob.glob(REAL_PATH + "data/no_steps_left_todo/NaP.*"):
+            shutil.copy(file, ".")
+        jobs = ["job_{}.res".format(ind) for ind in range(4)]
+        for job in jobs:
+            shutil.copy(
+                REAL_PATH
+                + "data/no_steps_left_todo/cache/NaP_intermediates_stopped_early.res",
+                job,
+            )
+        result, s = castep2dict(
+            REAL_PATH + "data/castep_files/Na3Zn4-swap-ReOs-OQMD_759599.castep",
+            db=True,
+        )
+        self.assertTrue(s)
+
+        def finish(res_list, error_queue, proc_id, claimed=False, result_sink=None):
+            self.assertIsInstance(result_sink, QueueSink)
+            doc = copy.deepcopy(result)
+            doc["source"] = ["completed/{}".format(res_list[0])]
+            result_sink.push(doc)
+            result_sink.flush()
+            error_queue.put((proc_id, 1, ""))
+
+        collection = mongomock.MongoClient().db["pack_test"]
+        runner = BatchRun(
+            seed=["NaP"],
+            pack=True,
+            ncores=1,
+            maxmem=1000,
+            db="pack_test",
+            db_batch_size=10,
+            verbosity=VERBOSITY,
+            executable=EXECUTABLE,
+        )
+        with mock.patch.object(
+            runner, "estimate_memory", return_value=100
+        ), mock.patch.object(
+            runner, "perform_new_calculations", side_effect=finish
+        ), mock.patch.object(
+            runner,
+            "_make_result_sink",
+            return_value=DatabaseSink(collection, batch_size=10),
+        ) as make_sink:
+            runner.spawn_packed()
+
+        self.assertEqual(make_sink.call_count, 1)
+        self.assertEqual(collection.count_documents({}), len(jobs))
+        changelog = collection.database["__changelog_pack_test"]
+        self.assertEqual([change["count"] for change in changelog.find()], [4])
+
+
+def _claim_jobs(jobs, queue):
+    """Try to claim every job, pushing the list of successful claims to the queue."""
+    import random
+
+    job_queue = JobQueue()
+    claimed = [job for job in random.sample(jobs, len(jobs)) if job_queue.claim(job)]
+    queue.put(claimed)
+
+
+class JobQueueTest(MatadorUnitTest):
+    """Test that jobs are claimed exactly once by competing processes."""
+
+    def test_job_queue_stress(self):
+        num_jobs = 2000
+        num_workers = 16
+        jobs = ["job_{:05d}.res".format(ind) for ind in range(num_jobs)]
+        queue = mp.Queue()
+        procs = [
+            mp.Process(target=_claim_jobs, args=(jobs, queue))
+            for _ in range(num_workers)
+        ]
+        for proc in procs:
+            proc.start()
+        results = [queue.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+
+        claimed = [job for result in results for job in result]
+        self.assertEqual(len(claimed), num_jobs)
+        self.assertEqual(sorted(claimed), jobs)
+        self.assertTrue(all(isfile(job + ".lock") for job in jobs))
+        with open("jobs.txt", "r") as f:
+            self.assertEqual(sorted(line.strip() for line in f), jobs)
+
+        job_queue = JobQueue()
+        self.assertTrue(job_queue.is_taken(jobs[0]))
+        self.assertFalse(job_queue.claim(jobs[0]))
+        job_queue.release(jobs[0])
+        self.assertFalse(isfile(jobs[0] + ".lock"))
+        self.assertFalse(job_queue.is_taken(jobs[0]))
+        self.assertTrue(job_queue.claim(jobs[0]))
+
+    def test_job_queue_rereads_jobs_file(self):
+        job_queue = JobQueue()
+        self.assertFalse(job_queue.is_taken("a.res"))
+        # another worker that timed out releases its lock but leaves its listing
+        with open("jobs.txt", "a") as f:
+            f.write("a.res\nb.res\n")
+        self.assertTrue(job_queue.is_taken("a.res"))
+        self.assertFalse(JobQueue(ignore_jobs_file=True).is_taken("b.res"))
+
+        job_queue.release("a.res")
+        other_queue = JobQueue()
+        self.assertFalse(other_queue.is_taken("a.res"))
+        self.assertTrue(other_queue.is_taken("b.res"))
+
+        # only the lines appended since the last read are read
+        self.assertFalse(job_queue.is_taken("a.res"))
+        offset = job_queue._jobs_file_offset
+        with open("jobs.txt", "a") as f:
+            f.write("c.res\n")
+        self.assertTrue(job_queue.is_taken("c.res"))
+        self.assertEqual(job_queue._jobs_file_offset, offset + len("c.res\n"))
+
+        # a partially written line is not listed until it is complete
+        with open("jobs.txt", "a") as f:
+            f.write("d.r")
+        self.assertFalse(job_queue.is_taken("d.res"))
+        with open("jobs.txt", "a") as f:
+            f.write("es\n")
+        self.assertTrue(job_queue.is_taken("d.res"))
+
+        # a release by another worker rewrites the file, which is re-read in full
+        other_queue.release("b.res")
+        with open("jobs.txt", "a") as f:
+            f.write("e.res\n")
+        self.assertFalse(job_queue.is_taken("b.res"))
+        self.assertTrue(job_queue.is_taken("e.res"))
+        self.assertEqual(job_queue.listed, {"c.res", "d.res", "e.res"})
+
+    def test_failed_jobs_are_released(self):
+        """Check that jobs that fail their memory check or inputs are released
+        through the job queue, keeping the other jobs listed line by line.
+
+        """
+        from unittest import mock
+
+        for file in glob.glob(REAL_PATH + "data/no_steps_left_todo/NaP.*"):
+            shutil.copy(file, ".")
+        for job in ["job_0.res", "job_1.res"]:
+            shutil.copy(
+                REAL_PATH
+                + "data/no_steps_left_todo/cache/NaP_intermediates_stopped_early.res",
+                job,
+            )
+        with open("jobs.txt", "w") as f:
+            f.write("a.res\nb.res\n")
+
+        runner = BatchRun(
+            seed=["NaP"], ncores=1, verbosity=VERBOSITY, executable=EXECUTABLE
+        )
+        error_queue = mp.Queue()
+        with mock.patch(
+            "matador.compute.batch.ComputeTask",
+            side_effect=[MaxMemoryEstimateExceeded("Too big"), InputError("Bad")],
+        ):
+            runner.perform_new_calculations(["job_0.res", "job_1.res"], error_queue, 0)
+        self.assertIsInstance(error_queue.get(timeout=5)[1], InputError)
+
+        with open("jobs.txt") as f:
+            self.assertEqual(f.read(), "a.res\nb.res\n")
+        self.assertFalse(isfile("job_0.res.lock"))
+        self.assertFalse(isfile("job_1.res.lock"))
+        job_queue = JobQueue()
+        self.assertTrue(job_queue.is_taken("b.res"))
+        self.assertFalse(job_queue.is_taken("job_0.res"))
+
+
+def _fake_castep(name, duration):
+    """Stand-in for a CASTEP job that records when it ran."""
+    start = time.time()
+    time.sleep(duration)
+    with open("{}.timings".format(name), "w") as f:
+        f.write("{} {}".format(start, time.time()))
+
+
+class SchedulerTest(MatadorUnitTest):
+    """Test the packing of jobs of different sizes onto a node."""
+
+    def test_pack_jobs(self):
+        jobs = [
+            {"ncores": 4, "mem": 1000},
+            {"ncores": 8, "mem": 6000},
+            {"ncores": 4, "mem": 3000},
+            {"ncores": 2, "mem": 500},
+            {"ncores": 2, "mem": 500},
+        ]
+        # largest job goes first, then fill the remaining space in order
+        self.assertEqual(pack_jobs(jobs, 16, 8000), [0, 1, 3, 4])
+        self.assertEqual(pack_jobs(jobs, 16, 7000), [0, 1])
+        # limited by cores
+        self.assertEqual(pack_jobs(jobs, 8, 100000), [1])
+        self.assertEqual(pack_jobs(jobs, 7, 100000), [2, 3])
+        # nothing fits
+        self.assertEqual(pack_jobs(jobs, 1, 100000), [])
+        self.assertEqual(pack_jobs(jobs, 16, 100), [])
+        self.assertEqual(pack_jobs([], 16, 100), [])
+
+        for chosen in (pack_jobs(jobs, 12, 4000), pack_jobs(jobs, 16, 9000)):
+            self.assertTrue(sum(jobs[ind]["ncores"] for ind in chosen) <= 16)
+
+    def test_job_ncores(self):
+        # the same share of the 16 cores as of the 8000 MB, rounded up
+        self.assertEqual(job_ncores(1000, 8000, 16), 2)
+        self.assertEqual(job_ncores(1100, 8000, 16), 3)
+        self.assertEqual(job_ncores(8000, 8000, 16), 16)
+        # never fewer than one, nor more than the limit or the node
+        self.assertEqual(job_ncores(1, 8000, 16), 1)
+        self.assertEqual(job_ncores(0, 8000, 16), 1)
+        self.assertEqual(job_ncores(8000, 8000, 16, max_ncores=4), 4)
+        self.assertEqual(job_ncores(4000, 8000, 16, max_ncores=32), 8)
+        self.assertEqual(job_ncores(8000, 8000, 16, max_ncores=32), 16)
+        self.assertEqual(job_ncores(100, 0, 16, max_ncores=4), 4)
+
+    def test_schedule_jobs(self):
+        total_cores = 8
+        max_mem = 4000
+        jobs = [
+            {"name": "a", "ncores": 4, "mem": 3000, "duration": 0.4},
+            {"name": "b", "ncores": 2, "mem": 1000, "duration": 0.2},
+            {"name": "c", "ncores": 2, "mem": 500, "duration": 0.1},
+            {"name": "d", "ncores": 6, "mem": 1000, "duration": 0.2},
+            {"name": "e", "ncores": 1, "mem": 2500, "duration": 0.3},
+            {"name": "f", "ncores": 2, "mem": 5000, "duration": 0.1},
+            {"name": "g", "ncores": 16, "mem": 100, "duration": 0.1},
+            {"name": "h", "ncores": 1, "mem": 100, "duration": 0.1},
+        ]
+
+        def launch(job):
+            proc = mp.Process(target=_fake_castep, args=(job["name"], job["duration"]))
+            proc.start()
+            return proc
+
+        finished_jobs = []
+        finished, oversized = schedule_jobs(
+            jobs,
+            launch,
+            total_cores,
+            max_mem,
+            on_finish=lambda job, proc: finished_jobs.append(proc.exitcode),
+        )
+        self.assertEqual(sorted(job["name"] for job in oversized), ["f", "g"])
+        self.assertEqual(
+            sorted(job["name"] for job in finished), ["a", "b", "c", "d", "e", "h"]
+        )
+        self.assertEqual(finished_jobs, len(finished) * [0])
+
+        timings = {}
+        for job in finished:
+            with open("{}.timings".format(job["name"]), "r") as f:
+                timings[job["name"]] = [float(val) for val in f.read().split()]
+
+        # at the start of each job, check the resources used by all running jobs
+        for start, _ in timings.values():
+            running = [
+                job
+                for job in finished
+                if timings[job["name"]][0] <= start < timings[job["name"]][1]
+            ]
+            self.assertTrue(sum(job["ncores"] for job in running) <= total_cores)
+            self.assertTrue(sum(job["mem"] for job in running) <= max_mem)
+
+        # check that stopping early still waits for running jobs
+        finished, oversized = schedule_jobs(
+            jobs, launch, total_cores, max_mem, on_finish=lambda job, proc: False
+        )
+        self.assertTrue(0 < len(finished) < 6)
+
+    def test_schedule_jobs_lazily(self):
+        """Check that jobs are only taken as the node has room for them."""
+        taken = []
+        taken_at_launch = []
+
+        def generate_jobs():
+            for ind in range(20):
+                taken.append(ind)
+                yield {"name": str(ind), "ncores": 2, "mem": 100, "duration": 0.05}
+
+        def launch(job):
+            taken_at_launch.append(len(taken))
+            proc = mp.Process(target=_fake_castep, args=(job["name"], job["duration"]))
+            proc.start()
+            return proc
+
+        finished, oversized = schedule_jobs(generate_jobs(), launch, 4, 1000)
+        self.assertEqual(len(finished), 20)
+        self.assertEqual(oversized, [])
+        # never more jobs taken than fit on the node, plus the one that did not
+        self.assertTrue(
+            all(
+                num_taken <= num_launched + 2
+                for num_launched, num_taken in enumerate(taken_at_launch)
+            )
+        )
+
+        # no more jobs are taken after stopping
+        taken.clear()
+        finished, _ = schedule_jobs(
+            generate_jobs(), launch, 4, 1000, on_finish=lambda job, proc: False
+        )
+        self.assertEqual(len(taken), 2)
+        self.assertEqual(len(finished), 2)
+
+
+class SupervisorTest(unittest.TestCase):
+    """Test the event-driven supervision of dummy executables."""
+
+    def _run_many(self):
+        import subprocess as sp
+        import sys
+
+        durations = [0.05 * (ind % 5) for ind in range(20)]
+        with ProcessSupervisor() as supervisor:
+            for ind, duration in enumerate(durations):
+                process = sp.Popen(
+                    [
+                        sys.executable,
+                        "-c",
+                        "import time; time.sleep({}); print({}); exit({})".format(
+                            duration, ind, ind % 3
+                        ),
+                    ],
+                    stdout=sp.PIPE,
+                    stderr=sp.PIPE,
+                )
+                supervisor.register(process)
+
+            outputs = {}
+            while supervisor.processes:
+                for process, event in supervisor.wait():
+                    self.assertEqual(event, "exit")
+                    out, err = supervisor.output(process)
+                    outputs[int(out)] = process.returncode
+                    supervisor.unregister(process)
+
+        self.assertEqual(outputs, {ind: ind % 3 for ind in range(20)})
+
+    def test_many_processes(self):
+        self._run_many()
+
+    def test_many_processes_without_pidfd(self):
+        from unittest import mock
+
+        with mock.patch("os.pidfd_open", side_effect=OSError, create=True):
+            self._run_many()
+
+    def test_deadline_and_output(self):
+        import subprocess as sp
+        import sys
+
+        with ProcessSupervisor() as supervisor:
+            slow = sp.Popen(["sleep", "10"])
+            supervisor.register(slow, deadline=time.time() + 0.2)
+            chatty = sp.Popen(
+                [sys.executable, "-c", "print('x' * 200000)"], stdout=sp.PIPE
+            )
+            supervisor.register(chatty)
+
+            # no events before the timeout
+            self.assertEqual(supervisor.wait(timeout=0.0), [])
+
+            # the chatty process must not block on a full pipe
+            events = supervisor.wait()
+            self.assertEqual(events, [(chatty, "exit")])
+            out, err = supervisor.output(chatty)
+            self.assertEqual(len(out.strip()), 200000)
+            self.assertEqual(err, b"")
+
+            # the slow process would only exit after 10 s
+            events = supervisor.wait()
+            self.assertEqual(events, [(slow, "deadline")])
+            self.assertIsNone(slow.poll())
+            slow.terminate()
+            events = supervisor.wait()
+            self.assertEqual(events, [(slow, "exit")])
+            self.assertEqual(supervisor.wait(timeout=0.1), [])
+
+
+class MemcheckCacheTest(MatadorUnitTest):
+    """Test the caching and prediction of memcheck results."""
+
+    recorded_dryruns = [
+        "data/Na3Zn4-swap-ReOs-OQMD_759599.castep",
+        "data/fix_cell_test/TiNb2O7-JVAa6LNI-0K-prim.castep",
+        "data/beef_files/K3P_BEEF.castep",
+        "data/beef_files/P_BEEF.castep",
+        "data/beef_files/K_BEEF.castep",
+        "data/benchmark/castep181_cluster/_LiC_2core_castep18.1.castep",
+    ]
+
+    @staticmethod
+    def _synthetic_entries(num_samples, seed=0, **fixed_features):
+        """Generate entries following a power law in each feature, with noise."""
+        rng = np.random.default_rng(seed)
+        entries = []
+        for ind in range(num_samples):
+            features = {
+                "species": ["K", "P"],
+                "num_atoms": 2 + ind % 48,
+                "cut_off_energy": float(rng.choice([300, 400, 500])),
+                "num_kpoints": int(rng.integers(1, 200)),
+                "param_hash": "abc",
+                "ncores": 4,
+                "nnodes": None,
+                "volume": float(rng.uniform(50, 1000)),
+            }
+            features.update(fixed_features)
+            mem = (
+                2
+                * features["num_atoms"] ** 0.5
+                * features["volume"] ** 0.8
+                * features["num_kpoints"] ** 0.3
+                * (features["cut_off_energy"] / 100) ** 1.5
+                * rng.lognormal(0, 0.02)
+            )
+            entries.append({"features": features, "mem_MB": mem, "time_secs": None})
+        return entries
+
+    def test_cache_recorded_dryruns(self):
+        features_list = []
+        cache = MemcheckCache("memcheck_cache.jsonl")
+        self.assertEqual(cache.entries, [])
+        for fname in self.recorded_dryruns:
+            doc, s = castep2dict(REAL_PATH + fname, db=False, verbosity=VERBOSITY)
+            self.assertTrue(s)
+            param_dict = {
+                key: doc[key] for key in ("task", "xc_functional", "cut_off_energy")
+            }
+            features = get_memcheck_features(doc, param_dict, ncores=4)
+            self.assertEqual(features["num_atoms"], doc["num_atoms"])
+            self.assertEqual(features["num_kpoints"], np.prod(doc["kpoints_mp_grid"]))
+            self.assertIsNone(cache.lookup(features))
+            cache.add(features, mem_MB=doc["estimated_mem_per_process_MB"])
+            features_list.append((features, doc["estimated_mem_per_process_MB"]))
+
+        # partially written lines from other processes are ignored
+        with open("memcheck_cache.jsonl", "a") as f:
+            f.write('{"features": {"species": ["K"], "num_at')
+
+        new_cache = MemcheckCache("memcheck_cache.jsonl")
+        self.assertEqual(len(new_cache.entries), len(self.recorded_dryruns))
+        for features, mem in features_list:
+            self.assertEqual(new_cache.lookup(features)["mem_MB"], mem)
+            self.assertIsNone(new_cache.lookup(features)["time_secs"])
+            self.assertIsNone(new_cache.lookup({**features, "ncores": 8}))
+            self.assertIsNone(new_cache.lookup({**features, "param_hash": "abc"}))
+
+        # results from other processes are picked up and merged
+        features, mem = features_list[0]
+        with open("memcheck_cache.jsonl", "a") as f:
+            f.write("\n")
+        MemcheckCache("memcheck_cache.jsonl").add(features, time_secs=100)
+        self.assertEqual(cache.lookup(features)["mem_MB"], mem)
+        self.assertEqual(cache.lookup(features)["time_secs"], 100)
+
+    def test_memcheck_model(self):
+        entries = self._synthetic_entries(40)
+        unseen = self._synthetic_entries(50, seed=1)
+        model = MemcheckModel(entries)
+        num_predictions = 0
+        for entry in unseen:
+            prediction = model.predict(entry["features"])
+            if prediction is None:
+                continue
+            num_predictions += 1
+            self.assertAlmostEqual(prediction[0] / entry["mem_MB"], 1, delta=0.1)
+            self.assertGreater(prediction[1], entry["mem_MB"])
+        self.assertGreater(num_predictions, 25)
+
+        features = dict(entries[0]["features"])
+        # no predictions outside of the range of the data
+        self.assertIsNone(model.predict({**features, "num_atoms": 1000}))
+        # no predictions for other parameters
+        self.assertIsNone(model.predict({**features, "param_hash": "def"}))
+        self.assertIsNone(model.predict({**features, "ncores": 8}))
+        # no predictions without enough data
+        self.assertIsNone(MemcheckModel(entries[:5]).predict(features))
+        # no predictions for missing targets
+        self.assertIsNone(MemcheckModel(entries, target="time_secs").predict(features))
+
+    def test_memcheck_skips_dryrun(self):
+        """Check that do_memcheck uses the cache and model without
+        calling the (missing) executable.
+
+        """
+        seed = REAL_PATH + "data/symmetry_failure/Sb.res"
+        cell_dict, s = cell2dict(
+            REAL_PATH + "/data/symmetry_failure/KSb.cell", verbosity=VERBOSITY, db=False
+        )
+        assert s
+        param_dict, s = param2dict(
+            REAL_PATH + "/data/symmetry_failure/KSb.param",
+            verbosity=VERBOSITY,
+            db=False,
+        )
+        assert s
+
+        relaxer = ComputeTask(
+            ncores=4,
+            nnodes=None,
+            node=None,
+            res=seed,
+            param_dict=param_dict,
+            cell_dict=cell_dict,
+            verbosity=VERBOSITY,
+            executable=REAL_PATH + "data/memcheck/this_is_not_castep",
+            exec_test=False,
+            memcheck=True,
+            memcheck_cache=True,
+            maxmem=100000,
+            start=False,
+        )
+        with self.assertRaises((MaxMemoryEstimateExceeded, FileNotFoundError)):
+            relaxer.estimate_memory()
+
+        features = relaxer._memcheck_features
+        self.assertEqual(features["num_atoms"], 2)
+
+        # fit a model to similar structures, with the same parameters
+        cache = MemcheckCache("memcheck_cache.jsonl")
+        entries = self._synthetic_entries(
+            40,
+            param_hash=features["param_hash"],
+            volume=features["volume"],
+            cut_off_energy=features["cut_off_energy"],
+            num_kpoints=features["num_kpoints"],
+        )
+        for entry in entries:
+            cache.add(entry["features"], mem_MB=entry["mem_MB"])
+        prediction = MemcheckModel(cache.entries).predict(features)
+        self.assertIsNotNone(prediction)
+        self.assertEqual(relaxer.estimate_memory(), prediction[1])
+
+        # but only if the prediction is comfortably within limits
+        relaxer.maxmem = prediction[1]
+        with self.assertRaises((MaxMemoryEstimateExceeded, FileNotFoundError)):
+            relaxer.estimate_memory()
+
+        # exact matches are always used
+        cache.add(features, mem_MB=1234)
+        self.assertEqual(relaxer.estimate_memory(), 1234)
+
+
+class WalltimePredictorTest(MatadorUnitTest):
+    """Test the prediction of relaxation block times from recorded CASTEP timings."""
+
+    def test_recorded_timings(self):
+        fname = REAL_PATH + "data/castep_files/NaP_intermediates.castep"
+        with open(fname, "r") as f:
+            flines = f.readlines()
+
+        predictor = WalltimePredictor()
+        predictor.add_lines(flines)
+        # 8 CASTEP runs, with 78 geometry iterations including the initial SCFs
+        self.assertEqual(len(predictor.startup_times), 8)
+        self.assertEqual(len(predictor.step_times), 70)
+        self.assertEqual(predictor.startup_times[:3], [20.37, 21.12, 22.65])
+        self.assertAlmostEqual(predictor.step_times[0], 60.50 - 20.37)
+        self.assertAlmostEqual(predictor.scf_cycle_times[0], 2.79 - 0.64)
+        self.assertEqual(len(predictor.scf_cycles_per_step), 78)
+
+        # the same timings are found when reading the file as it is written
+        chunked_predictor = WalltimePredictor()
+        reader = CastepOutputReader(
+            "partial.castep", db=False, listeners=[chunked_predictor]
+        )
+        with open("partial.castep", "w") as f:
+            for ind in range(0, len(flines), 997):
+                f.write("".join(flines[ind : ind + 997]))
+                f.flush()
+                reader.update()
+        self.assertEqual(chunked_predictor.step_times, predictor.step_times)
+        self.assertEqual(chunked_predictor.startup_times, predictor.startup_times)
+        self.assertEqual(chunked_predictor.scf_cycle_times, predictor.scf_cycle_times)
+
+        # predictions scale with the number of steps, and follow the recent steps
+        recent = np.asarray(predictor.step_times[-10:])
+        expected = 1.2 * (
+            np.mean(predictor.startup_times) + 2 * (recent.mean() + recent.std())
+        )
+        self.assertAlmostEqual(predictor.predict_block_time(2), expected)
+        self.assertAlmostEqual(
+            predictor.predict_block_time(20) - predictor.predict_block_time(2),
+            1.2 * 18 * (recent.mean() + recent.std()),
+        )
+        self.assertTrue(predictor.will_finish(2, expected + 1))
+        self.assertFalse(predictor.will_finish(2, expected - 1))
+
+    def test_timing_sequences(self):
+        predictor = WalltimePredictor(safety_factor=1)
+        self.assertIsNone(predictor.predict_block_time(10))
+        self.assertTrue(predictor.will_finish(10, 0))
+
+        # steps that take 10 s, after 5 s of startup and with 2 s of overhead
+        for _ in range(3):
+            lines = [" |      CCC   AA    SSS  TTTTT  EEEEE  PPPP        |\n"]
+            timer = 0.0
+            for step in range(4):
+                for cycle in range(5):
+                    timer += 1 if step == 0 else 2
+                    lines.append(
+                        "{:>7} -8.5E+003  3.5E+000  1.0E-005 {:>10.2f}  <-- SCF\n".format(
+                            cycle + 1, timer
+                        )
+                    )
+                lines.append(
+                    " LBFGS: finished iteration {:>5} with enthalpy= -8.5E+003 eV\n".format(
+                        step
+                    )
+                )
+            predictor.add_lines(lines)
+            predictor.end_block(timer + 2)
+
+        # with only the initial SCF timed, steps are estimated from its 5 cycles
+        first_scf = WalltimePredictor(safety_factor=1)
+        first_scf.add_lines(lines[:7])
+        self.assertEqual(first_scf.scf_cycle_times, 4 * [1.0])
+        self.assertEqual(first_scf.scf_cycles_per_step, [5])
+        self.assertFalse(first_scf.step_times)
+        self.assertAlmostEqual(first_scf.predict_block_time(10), 5 + 10 * 5 * 1.0)
+
+        self.assertEqual(predictor.startup_times, 3 * [5.0])
+        self.assertEqual(predictor.scf_cycles_per_step, 12 * [5])
+        self.assertEqual(predictor.step_times, 9 * [10.0])
+        self.assertEqual(predictor.overhead_times, 3 * [2.0])
+        self.assertAlmostEqual(predictor.predict_block_time(10), 107)
+        self.assertTrue(predictor.will_finish(10, 107))
+        self.assertFalse(predictor.will_finish(11, 107))
+
+        # a slow step raises the prediction
+        predictor.step_times.append(40)
+        self.assertGreater(predictor.predict_block_time(10), 130)
+
+    def test_release_before_walltime(self):
+        """Run a relaxation with an executable that appends recorded
+        CASTEP output, with less walltime than the next block is predicted
+        to take, and check that the job stops cleanly before the deadline.
+
+        """
+        shutil.copy(
+            REAL_PATH
+            + "data/no_steps_left_todo/cache/NaP_intermediates_stopped_early.res",
+            "NaP.res",
+        )
+        cell_dict, s = cell2dict(
+            REAL_PATH + "data/no_steps_left_todo/NaP.cell",
+            verbosity=VERBOSITY,
+            db=False,
+        )
+        self.assertTrue(s)
+        param_dict, s = param2dict(
+            REAL_PATH + "data/no_steps_left_todo/NaP.param",
+            verbosity=VERBOSITY,
+            db=False,
+        )
+        self.assertTrue(s)
+        with open("NaP.res", "r") as f:
+            initial_res = f.read()
+        with open("NaP.res.lock", "w") as f:
+            pass
+
+        start = time.time()
+        with self.assertRaises(WalltimeError):
+            ComputeTask(
+                ncores=1,
+                nnodes=None,
+                node=None,
+                res="NaP.res",
+                param_dict=param_dict,
+                cell_dict=cell_dict,
+                verbosity=VERBOSITY,
+                executable=REAL_PATH + "data/walltime_prediction/fake_castep_relax.sh",
+                exec_test=False,
+                polltime=1,
+                timings=(100, start),
+            )
+
+        # the task's log handlers are detached once it stops
+        self.assertFalse(logging.getLogger("run3").handlers)
+        # one block ran, then the job stopped without waiting for the deadline
+        with open("NaP.castep", "r") as f:
+            self.assertEqual(sum(CASTEP_RUN_HEADER_STRING in line for line in f), 1)
+        self.assertFalse(isfile("NaP.res.lock"))
+        self.assertFalse(isdir("bad_castep"))
+        with open("NaP.res", "r") as f:
+            self.assertNotEqual(f.read(), initial_res)
+
+
+class ResultSinkTest(MatadorUnitTest):
+    """Test that finished calculations are pushed to a result sink."""
+
+    class ListSink:
+        """An in-process stand-in for a database sink."""
+
+        def __init__(self):
+            self.docs = []
+
+        def push(self, doc):
+            self.docs.append(doc)
+
+    def test_relax_to_result_sink(self):
+        shutil.copy(
+            REAL_PATH
+            + "data/no_steps_left_todo/cache/NaP_intermediates_stopped_early.res",
+            "NaP.res",
+        )
+        cell_dict, s = cell2dict(
+            REAL_PATH + "data/no_steps_left_todo/NaP.cell",
+            verbosity=VERBOSITY,
+            db=False,
+        )
+        self.assertTrue(s)
+        param_dict, s = param2dict(
+            REAL_PATH + "data/no_steps_left_todo/NaP.param",
+            verbosity=VERBOSITY,
+            db=False,
+        )
+        self.assertTrue(s)
+
+        self.addCleanup(setattr, logging.getLogger("run3"), "handlers", [])
+        sink = self.ListSink()
+        relaxer = ComputeTask(
+            ncores=1,
+            nnodes=None,
+            node=None,
+            res="NaP.res",
+            param_dict=param_dict,
+            cell_dict=cell_dict,
+            verbosity=VERBOSITY,
+            executable=REAL_PATH + "data/result_sink/fake_castep_optimised.sh",
+            exec_test=False,
+            polltime=1,
+            result_sink=sink,
+        )
+
+        self.assertTrue(relaxer.success)
+        self.assertTrue(isfile("completed/NaP.res"))
+        self.assertTrue(isfile("completed/NaP.castep"))
+        self.assertEqual(len(sink.docs), 1)
+        doc = sink.docs[0]
+        # the sources point at the completed files, and the inputs are included
+        self.assertEqual(
+            sorted(doc["source"]),
+            sorted(
+                [
+                    os.path.abspath("completed/NaP.castep"),
+                    os.path.abspath("completed/NaP.res"),
+                ]
+            ),
+        )
+        self.assertTrue(doc["optimised"])
+        self.assertEqual(doc["xc_functional"], "PBE")
+        self.assertEqual(doc["kpoints_mp_spacing"], 0.1)
+        self.assertAlmostEqual(doc["enthalpy"], relaxer.final_result["enthalpy"])
+
+
+class StagingTest(MatadorUnitTest):
+    """Test the staging of files into compute directories."""
+
+    def test_stage_large_files(self):
+        from unittest import mock
+
+        os.makedirs("src")
+        os.makedirs("dst")
+        size = 32 * 1024**2
+        fnames = []
+        for ind in range(4):
+            fname = "src/dummy_{}.check".format(ind)
+            with open(fname, "wb") as f:
+                f.write(os.urandom(1024) * (size // 1024))
+            fnames.append(fname)
+
+        actions = stage_files(fnames, "dst")
+        self.assertTrue(all(action in ["copied", "reflinked"] for action in actions))
+        for fname in fnames:
+            self.assertTrue(
+                filecmp.cmp(fname, "dst/" + os.path.basename(fname), shallow=False)
+            )
+
+        # restaging unchanged files does not copy or even read any data
+        with mock.patch("shutil.copy2", wraps=shutil.copy2) as copy2, mock.patch(
+            "matador.compute.staging._checksum"
+        ) as checksum:
+            actions = stage_files(fnames, "dst")
+        self.assertEqual(actions, 4 * ["skipped"])
+        self.assertEqual(copy2.call_count, 0)
+        self.assertEqual(checksum.call_count, 0)
+
+        # touched files with the same contents are skipped after a checksum
+        os.utime(fnames[0])
+        self.assertEqual(stage_file(fnames[0], "dst"), "skipped")
+        self.assertEqual(
+            os.stat(fnames[0]).st_mtime_ns,
+            os.stat("dst/dummy_0.check").st_mtime_ns,
+        )
+
+        # modified files are copied again
+        with open(fnames[1], "r+b") as f:
+            f.write(b"modified")
+        self.assertIn(stage_file(fnames[1], "dst"), ["copied", "reflinked"])
+        self.assertTrue(filecmp.cmp(fnames[1], "dst/dummy_1.check", shallow=False))
+
+        # files on the same filesystem can be hardlinked
+        self.assertEqual(stage_file(fnames[2], "dst", link=True), "linked")
+        self.assertTrue(os.path.samefile(fnames[2], "dst/dummy_2.check"))
+        self.assertEqual(stage_file(fnames[2], "dst", link=True), "skipped")
+
+        # a failed hardlink leaves the existing file in place and falls back to copying
+        with open(fnames[3], "r+b") as f:
+            f.write(b"modified")
+        with mock.patch("os.link", side_effect=PermissionError("protected")):
+            self.assertIn(
+                stage_file(fnames[3], "dst", link=True), ["copied", "reflinked"]
+            )
+        self.assertTrue(filecmp.cmp(fnames[3], "dst/dummy_3.check", shallow=False))
+        self.assertFalse(os.path.samefile(fnames[3], "dst/dummy_3.check"))
+        self.assertEqual(sorted(os.listdir("dst")), sorted(os.listdir("src")))
+
 
 class BenchmarkCastep(MatadorUnitTest):
     """Run some short CASTEP calculations and compare the timings
@@ -283,6 +283,96 @@ class CrystalTest(unittest.TestCase):
         crystal = Crystal(doc)
         print(crystal.bonding_stats)
 
+    @unittest.skipIf(not imported_networkx, "NetworkX missing")
+    def testSparseNetwork(self):
+        import networkx as nx
+        from matador.utils.cell_utils import create_simple_supercell
+
+        doc, s = res2dict(REAL_PATH + "data/structures/LiAs_testcase.res")
+        crystal = Crystal(create_simple_supercell(doc, (2, 2, 2)))
+        sparse = crystal.sparse_network
+        network = crystal.network
+        self.assertIs(network.sparse_graph, sparse)
+        self.assertEqual(network.number_of_nodes(), crystal.num_atoms)
+        self.assertEqual(network.number_of_edges(), sparse.num_bonds)
+        self.assertEqual(sparse.adjacency.sum(), sparse.num_bonds)
+        np.testing.assert_array_equal(
+            sparse.coordination,
+            [network.out_degree(node) for node in range(crystal.num_atoms)],
+        )
+        for i, j, data in network.edges.data():
+            self.assertIsInstance(data["image"], bool)
+            self.assertLessEqual(data["dist"], 5)
+
+        for connection, components in (
+            ("strong", nx.strongly_connected_components(network)),
+            ("weak", nx.weakly_connected_components(network)),
+        ):
+            num_components, labels = sparse.get_connected_components(
+                connection=connection
+            )
+            components = list(components)
+            self.assertEqual(num_components, len(components))
+            for component in components:
+                self.assertEqual(len({labels[node] for node in component}), 1)
+
+
+class VoronoiSimilarityTest(unittest.TestCase):
+    """Test the clustering of sites with precomputed Voronoi substructures."""
+
+    def testUniqueSites(self):
+        from matador.plugins.voronoi_interface.voronoi_similarity import (
+            are_sites_the_same,
+            get_unique_environments,
+            get_unique_sites,
+        )
+
+        rng = np.random.default_rng(seed=0)
+        environments = [
+            [("K", 0.4), ("K", 0.3), ("P", 0.2)],
+            [("K", 0.1), ("P", 0.5), ("P", 0.4)],
+            [("P", 0.9)],
+        ]
+        atom_types = []
+        substrucs = []
+        for ind in range(60):
+            elem = "K" if ind % 2 else "P"
+            env = environments[ind % 3]
+            atom_types.append(elem)
+            substrucs.append(
+                (
+                    elem,
+                    [(species, angle + rng.normal(0, 0.002)) for species, angle in env],
+                )
+            )
+        # chain of sites each within tolerance of the next
+        for shift in (0.015, 0.03, 0.045):
+            atom_types.append("K")
+            substrucs.append(("K", [("P", 0.9 + shift)]))
+        doc = {"atom_types": atom_types, "voronoi_substruc": substrucs}
+
+        get_unique_sites(doc)
+        for elem in ("K", "P"):
+            sites = doc["site_array"][elem]
+            similar_sites = doc["similar_sites"][elem]
+            self.assertEqual(sorted(set.union(*similar_sites)), list(range(len(sites))))
+            self.assertEqual(
+                doc["unique_site_inds"][elem], [min(s) for s in similar_sites]
+            )
+            labels = {ind: label for label, s in enumerate(similar_sites) for ind in s}
+            for i in range(len(sites)):
+                for j in range(i + 1, len(sites)):
+                    if are_sites_the_same(sites[i], sites[j]):
+                        self.assertEqual(labels[i], labels[j])
+
+        self.assertEqual(len(doc["similar_sites"]["P"]), 3)
+        self.assertEqual(len(doc["similar_sites"]["K"]), 3)
+        self.assertEqual(doc["site_degeneracies"]["K"], [10, 10, 13])
+
+        unique_environments, similar_environments = get_unique_environments([doc, doc])
+        self.assertEqual(len(unique_environments["K"]), 3)
+        self.assertEqual([len(s) for s in similar_environments["P"]], [2, 2, 2])
+
 
 class ElasticCrystalTest(unittest.TestCase):
     """Test the elastic functionality of the Crystal module."""
@@ -81,6 +81,47 @@ class CursorUtilTest(unittest.TestCase):
         filtered = filter_cursor(cursor, "field", [-2, 100])
         self.assertEqual(len(filtered), len(cursor) - 2)
 
+    def test_display_results_in_pages(self):
+        import io
+        import glob
+        import contextlib
+        from matador.scrapers import res2dict
+        from matador.utils.cursor_utils import display_results
+
+        cursor = [
+            res2dict(fname, as_model=False)[0]
+            for fname in sorted(glob.glob(REAL_PATH + "data/hull-KPSn-KP/*.res"))
+        ]
+        self.assertGreater(len(cursor), 5)
+        for kwargs in [{}, {"details": True, "source": True}, {"summary": True}]:
+            expected = display_results(cursor, return_str=True, **kwargs)
+            for page_size in [2, 100]:
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    display_results(cursor, page_size=page_size, **kwargs)
+                self.assertEqual(output.getvalue(), expected + "\n")
+
+        class ClosedPipe(io.StringIO):
+            """Raises BrokenPipeError for any write after the table header."""
+
+            def write(self, string):
+                if self.tell() > 0:
+                    raise BrokenPipeError
+                return super().write(string)
+
+        num_formatted = 0
+
+        def lazy_cursor():
+            nonlocal num_formatted
+            for _ in range(1000):
+                num_formatted += 1
+                yield cursor[0]
+
+        with contextlib.redirect_stdout(ClosedPipe()):
+            display_results(lazy_cursor(), sort=False, page_size=10)
+        # formatting stops after the first page fails to be written
+        self.assertEqual(num_formatted, 10)
+
     def test_recursive_get_set(self):
         from matador.utils.cursor_utils import recursive_get, recursive_set
 
@@ -3,9 +3,14 @@
 import unittest
 import os
 import glob
+import copy
+import json
 import mongomock
 
 from matador.db.importer import Spatula
+from matador.db.changes import DatabaseChanges
+from matador.db.sink import DatabaseSink
+from matador.scrapers.castep_scrapers import castep2dict
 from matador.query import DBQuery
 
 REAL_PATH = "/".join(os.path.realpath(__file__).split("/")[:-1]) + "/"
@@ -97,3 +102,414 @@ class TestDatabaseImport(unittest.TestCase):
 
         query = DBQuery(db=DB_NAME, mongo_settings=self.settings, id="no chance")
         self.assertEqual(len(query.cursor), 0)
+
+
+class TestDatabaseSink(unittest.TestCase):
+    """Tests the DatabaseSink class."""
+
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db["sink_test"]
+        self.doc, s = castep2dict(
+            REAL_PATH + "data/castep_files/Na3Zn4-swap-ReOs-OQMD_759599.castep", db=True
+        )
+        self.assertTrue(s)
+
+    def test_batched_insert(self):
+        sink = DatabaseSink(self.collection, batch_size=3)
+
+        docs = []
+        for ind in range(5):
+            doc = copy.deepcopy(self.doc)
+            doc["source"] = ["completed/NaZn-{}.castep".format(ind)]
+            docs.append(doc)
+
+        for doc in docs[:2]:
+            self.assertTrue(sink.push(doc))
+        self.assertEqual(self.collection.count_documents({}), 0)
+        self.assertTrue(sink.push(docs[2]))
+        self.assertEqual(self.collection.count_documents({}), 3)
+
+        # duplicates within the sink are never buffered
+        self.assertFalse(sink.push(docs[0]))
+
+        with sink:
+            self.assertTrue(sink.push(docs[3]))
+            self.assertEqual(self.collection.count_documents({}), 3)
+        self.assertEqual(self.collection.count_documents({}), 4)
+        self.assertEqual(sink.num_inserted, 4)
+        self.assertEqual(sink.num_skipped, 1)
+
+        inserted = self.collection.find_one({"root_source": "NaZn-0"})
+        self.assertEqual(inserted["quality"], 5)
+        self.assertEqual(len(inserted["text_id"]), 2)
+        self.assertEqual(inserted["elems"], ["Na", "Zn"])
+
+        # documents already in the collection are skipped on flush
+        new_sink = DatabaseSink(self.collection, batch_size=10, tags=["sink"])
+        self.assertTrue(new_sink.push(docs[1]))
+        self.assertTrue(new_sink.push(docs[4]))
+        self.assertEqual(new_sink.flush(), 1)
+        self.assertEqual(self.collection.count_documents({}), 5)
+        self.assertEqual(self.collection.count_documents({"tags": "sink"}), 1)
+        self.assertEqual(new_sink.num_skipped, 1)
+
+        # each flush is recorded as a changeset that can be undone
+        changelog = self.collection.database["__changelog_sink_test"]
+        changesets = list(changelog.find({}))
+        self.assertEqual([change["count"] for change in changesets], [3, 1, 1])
+        self.assertEqual(changesets[-1]["src_list"], ["NaZn-4"])
+        self.assertEqual(changesets[-1]["path_list"], ["completed"])
+        DatabaseChanges.undo_changeset(changelog, self.collection, changesets[0])
+        self.assertEqual(self.collection.count_documents({}), 2)
+        self.assertIsNone(self.collection.find_one({"root_source": "NaZn-0"}))
+
+    def test_failed_insert(self):
+        sink = DatabaseSink(self.collection, batch_size=10)
+        existing_id = self.collection.insert_one({"root_source": "other"}).inserted_id
+
+        docs = []
+        for ind in range(3):
+            doc = copy.deepcopy(self.doc)
+            doc["source"] = ["completed/NaZn-{}.castep".format(ind)]
+            docs.append(doc)
+        # this document cannot be inserted, but the others must still be recorded
+        docs[1]["_id"] = existing_id
+        for doc in docs:
+            self.assertTrue(sink.push(doc))
+
+        self.assertEqual(sink.flush(), 2)
+        self.assertEqual(sink.buffer, [])
+        self.assertEqual(sink.num_inserted, 2)
+        self.assertEqual(sink.num_skipped, 1)
+        changelog = self.collection.database["__changelog_sink_test"]
+        changesets = list(changelog.find({}))
+        self.assertEqual(len(changesets), 1)
+        self.assertEqual(changesets[0]["src_list"], ["NaZn-0", "NaZn-2"])
+        DatabaseChanges.undo_changeset(changelog, self.collection, changesets[0])
+        self.assertEqual(self.collection.count_documents({}), 1)
+
+    def test_failed_quality_checks(self):
+        sink = DatabaseSink(self.collection)
+        del self.doc["xc_functional"]
+        self.assertFalse(sink.push(self.doc))
+        sink.flush()
+        self.assertEqual(self.collection.count_documents({}), 0)
+
+
+class _InterruptedCollection:
+    """Wraps a collection so that bulk writes fail after a number of calls."""
+
+    def __init__(self, collection, num_writes):
+        self.collection = collection
+        self.num_writes = num_writes
+
+    def bulk_write(self, requests, **kwargs):
+        if self.num_writes == 0:
+            raise KeyboardInterrupt
+        self.num_writes -= 1
+        return self.collection.bulk_write(requests, **kwargs)
+
+
+class TestRefiner(unittest.TestCase):
+    """Tests the Refiner class on a synthetic collection."""
+
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db["refine_test"]
+        docs = []
+        for ind in range(47):
+            docs.append(
+                {
+                    "text_id": ["refine", str(ind)],
+                    "source": ["/data/CsCl-{}.res".format(ind)],
+                    "lattice_cart": [
+                        [4.0 + 0.01 * ind, 0, 0],
+                        [0, 4.0 + 0.01 * ind, 0],
+                        [0, 0, 4.0 + 0.01 * ind],
+                    ],
+                    "positions_frac": [[0, 0, 0], [0.5, 0.5, 0.5]],
+                    "atom_types": ["Cs", "Cl"],
+                    "space_group": "P1" if ind % 2 else "Pm-3m",
+                    "species_pot": {"Cs": "Cs.usp", "Cl": "Cl.usp", "K": "K.usp"},
+                }
+            )
+        self.collection.insert_many(docs)
+        self.checkpoint = REAL_PATH + "refine_test.checkpoint"
+
+    def tearDown(self):
+        if os.path.isfile(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def test_parallel_chunked_tasks(self):
+        import multiprocessing as mp
+        from unittest import mock
+        from matador.db import Refiner
+
+        # the pool must be started once, not once per chunk
+        with mock.patch("multiprocessing.Pool", wraps=mp.Pool) as pool:
+            refiner = Refiner(
+                self.collection.find(),
+                self.collection,
+                task="sym",
+                mode="overwrite",
+                workers=2,
+                chunk_size=10,
+                checkpoint=self.checkpoint,
+            )
+        self.assertEqual(pool.call_count, 1)
+        self.assertIsNone(refiner._pool)
+        self.assertEqual(refiner.changed_count, 23)
+        self.assertEqual(refiner.failed_count, 0)
+        self.assertEqual(self.collection.count_documents({"space_group": "Pm-3m"}), 47)
+        self.assertFalse(os.path.isfile(self.checkpoint))
+
+        for task, field, expected in [
+            ("elem_set", "elems", ["Cl", "Cs"]),
+            ("source", "root_source", "CsCl-0"),
+            ("pspot", "species_pot", {"Cs": "Cs.usp", "Cl": "Cl.usp"}),
+        ]:
+            refiner = Refiner(
+                self.collection.find(),
+                self.collection,
+                task=task,
+                mode="set" if task == "source" else "overwrite",
+                workers=2,
+                chunk_size=10,
+            )
+            self.assertEqual(refiner.changed_count, 47, msg=task)
+            doc = self.collection.find_one({"text_id": ["refine", "0"]})
+            if task == "elem_set":
+                self.assertEqual(sorted(doc[field]), expected)
+            else:
+                self.assertEqual(doc[field], expected)
+
+    def test_resume_interrupted_refine(self):
+        from matador.db import Refiner
+
+        with self.assertRaises(KeyboardInterrupt):
+            Refiner(
+                self.collection.find(),
+                _InterruptedCollection(self.collection, 2),
+                task="tag",
+                mode="overwrite",
+                new_tag="refined",
+                chunk_size=10,
+                checkpoint=self.checkpoint,
+            )
+        self.assertEqual(self.collection.count_documents({"tags": "refined"}), 20)
+        with open(self.checkpoint, "r") as f:
+            self.assertEqual(json.load(f)["num_written"], 20)
+
+        # a different task, tag or query must not use the checkpoint
+        for kwargs in [
+            {"query": {}, "task": "elem_set"},
+            {"query": {}, "task": "tag", "new_tag": "other"},
+            {"query": {"space_group": "P1"}, "task": "tag", "new_tag": "refined"},
+        ]:
+            query = kwargs.pop("query")
+            with self.assertRaises(SystemExit):
+                Refiner(
+                    self.collection.find(query),
+                    self.collection,
+                    mode="overwrite",
+                    checkpoint=self.checkpoint,
+                    **kwargs,
+                )
+        self.assertEqual(self.collection.count_documents({"elems": "Cs"}), 0)
+        self.assertEqual(self.collection.count_documents({"tags": "other"}), 0)
+
+        refiner = Refiner(
+            self.collection.find(),
+            self.collection,
+            task="tag",
+            mode="overwrite",
+            new_tag="refined",
+            chunk_size=10,
+            checkpoint=self.checkpoint,
+        )
+        self.assertEqual(refiner.changed_count, 27)
+        self.assertFalse(os.path.isfile(self.checkpoint))
+        for doc in self.collection.find():
+            self.assertEqual(doc["tags"], ["refined"])
+
+    def test_resume_refine_interrupted_while_refining(self):
+        from matador.db import Refiner
+
+        num_chunks = []
+        interrupt_after = [2]
+
+        def add_flag(docs):
+            if len(num_chunks) == interrupt_after[0]:
+                raise KeyboardInterrupt
+            num_chunks.append(len(docs))
+            for doc in docs:
+                doc["flag"] = True
+            return docs, "flag"
+
+        with self.assertRaises(KeyboardInterrupt):
+            Refiner(
+                self.collection.find(),
+                self.collection,
+                task=add_flag,
+                mode="set",
+                chunk_size=10,
+                checkpoint=self.checkpoint,
+            )
+        # the chunks refined before the interrupt were already written
+        self.assertEqual(self.collection.count_documents({"flag": True}), 20)
+        with open(self.checkpoint, "r") as f:
+            self.assertEqual(json.load(f)["num_written"], 20)
+
+        num_chunks.clear()
+        interrupt_after[0] = None
+        refiner = Refiner(
+            self.collection.find(),
+            self.collection,
+            task=add_flag,
+            mode="set",
+            chunk_size=10,
+            checkpoint=self.checkpoint,
+        )
+        self.assertEqual(num_chunks, [10, 10, 7])
+        self.assertEqual(refiner.changed_count, 27)
+        self.assertEqual(self.collection.count_documents({"flag": True}), 47)
+        self.assertFalse(os.path.isfile(self.checkpoint))
+
+
+class TestRawData(unittest.TestCase):
+    """Tests the compressed storage of raw files."""
+
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db["raw_test"]
+        self.fname = REAL_PATH + "data/castep_files/Na3Zn4-swap-ReOs-OQMD_759599.castep"
+        with open(self.fname, "r") as f:
+            self.lines = f.readlines()
+
+    def test_refine_raw_data(self):
+        from matador.db import Refiner, get_raw_files
+
+        self.collection.insert_many(
+            [{"source": [self.fname, "missing.res"]}, {"source": [self.fname]}]
+        )
+        refiner = Refiner(
+            self.collection.find(), self.collection, task="raw", mode="overwrite"
+        )
+        self.assertEqual(refiner.changed_count, 2)
+        for doc in self.collection.find():
+            self.assertEqual(len(doc["_raw"]), 1)
+            entry = doc["_raw"][0]
+            self.assertEqual(entry["encoding"], "zlib")
+            self.assertEqual(entry["size"], os.path.getsize(self.fname))
+            self.assertLess(len(entry["data"]), entry["size"] / 4)
+            self.assertEqual(get_raw_files(doc), [(self.fname, self.lines)])
+
+        Refiner(
+            self.collection.find(),
+            self.collection,
+            task="raw",
+            mode="overwrite",
+            raw_max_size=10,
+        )
+        for doc in self.collection.find():
+            self.assertEqual(doc["_raw"], [])
+
+    def test_raw_data_budget_and_charset(self):
+        from matador.db import Refiner, get_raw_files
+        from matador.db.raw import compress_raw_file
+
+        latin1_fname = REAL_PATH + "raw_test_latin1.castep"
+        self.addCleanup(os.remove, latin1_fname)
+        with open(latin1_fname, "w", encoding="latin1") as f:
+            f.write("Calculation by Ånd\u00e9r\n")
+
+        entry_size = len(compress_raw_file(self.fname)["data"])
+        self.collection.insert_one({"source": [self.fname, latin1_fname, self.fname]})
+        Refiner(
+            self.collection.find(),
+            self.collection,
+            task="raw",
+            mode="overwrite",
+            raw_max_size=entry_size + 100,
+        )
+        # the second copy of the large file does not fit in the document's budget
+        doc = self.collection.find_one()
+        self.assertEqual(
+            [entry["source"] for entry in doc["_raw"]], [self.fname, latin1_fname]
+        )
+        self.assertEqual(doc["_raw"][1]["charset"], "latin1")
+        self.assertEqual(
+            get_raw_files(doc)[1], (latin1_fname, ["Calculation by Ånd\u00e9r\n"])
+        )
+
+        # older entries without a charset fall back to latin1
+        del doc["_raw"][1]["charset"]
+        self.assertEqual(get_raw_files(doc)[1][1], ["Calculation by Ånd\u00e9r\n"])
+
+    def test_migrate_raw_data(self):
+        from matador.db import migrate_raw_data, get_raw_files
+
+        docs = [{"_raw": [[self.fname, self.lines]]} for _ in range(5)]
+        docs.append({"source": [self.fname]})
+        self.collection.insert_many(docs)
+
+        self.assertEqual(migrate_raw_data(self.collection, batch_size=2), 5)
+        for doc in self.collection.find({"_raw": {"$exists": True}}):
+            self.assertEqual(doc["_raw"][0]["encoding"], "zlib")
+            self.assertEqual(get_raw_files(doc), [(self.fname, self.lines)])
+        self.assertEqual(migrate_raw_data(self.collection, batch_size=2), 0)
+
+
+class _InterruptedDeletes:
+    """Wraps a collection so that deletions fail after a number of calls."""
+
+    def __init__(self, collection, num_deletes):
+        self.collection = collection
+        self.num_deletes = num_deletes
+
+    def delete_many(self, *args, **kwargs):
+        if self.num_deletes == 0:
+            raise KeyboardInterrupt
+        self.num_deletes -= 1
+        return self.collection.delete_many(*args, **kwargs)
+
+
+class TestDatabaseChanges(unittest.TestCase):
+    """Tests the batched undoing of changesets."""
+
+    def test_batched_undo(self):
+        from bson.objectid import ObjectId
+        from matador.db import DatabaseChanges
+
+        client = mongomock.MongoClient()
+        collection = client.db["changes_test"]
+        changelog = client.db["__changelog_changes_test"]
+
+        # a large changeset, of which only every 1000th structure remains
+        id_list = [ObjectId() for _ in range(100_000)]
+        collection.insert_many([{"_id": _id} for _id in id_list[::1000]])
+        collection.insert_one({"source": ["not_in_changeset.res"]})
+        changelog.insert_one({"id_list": id_list, "count": len(id_list)})
+
+        changeset = changelog.find_one()
+        batch_counts = DatabaseChanges.undo_changeset(
+            changelog, collection, changeset, batch_size=5000, dry_run=True
+        )
+        self.assertEqual(batch_counts, 20 * [5])
+        self.assertEqual(collection.count_documents({}), 101)
+        self.assertNotIn("num_reverted", changelog.find_one())
+
+        with self.assertRaises(KeyboardInterrupt):
+            DatabaseChanges.undo_changeset(
+                changelog,
+                _InterruptedDeletes(collection, 6),
+                changelog.find_one(),
+                batch_size=5000,
+            )
+        self.assertEqual(changelog.find_one()["num_reverted"], 30_000)
+        self.assertEqual(collection.count_documents({}), 101 - 30)
+
+        batch_counts = DatabaseChanges.undo_changeset(
+            changelog, collection, changelog.find_one(), batch_size=5000
+        )
+        self.assertEqual(batch_counts, 14 * [5])
+        self.assertEqual(changelog.find_one()["num_reverted"], 100_000)
+        self.assertEqual(collection.count_documents({}), 1)
@@ -5,6 +5,8 @@ import json
 import os
 import glob
 import itertools
+import logging
+import time
 import numpy as np
 
 from matador.scrapers import castep2dict, res2dict, cell2dict
@@ -25,8 +27,11 @@ from matador.orm.spectral import (
     VibrationalDOS,
 )
 from matador.utils.chem_utils import INVERSE_CM_TO_EV
+from matador.crystal import Crystal
 from .utils import REAL_PATH, MatadorUnitTest
 
+LOG = logging.getLogger(__name__)
+
 VERBOSITY = 10
 
 
@@ -945,6 +950,50 @@ class CastepScraperTests(MatadorUnitTest):
         self.assertTrue(test_dict["fix_all_cell"])
         self.assertTrue("cell_constraints" not in test_dict)
 
+    def test_incremental_castep_reader(self):
+        from matador.scrapers.castep_scrapers import CastepOutputReader
+
+        fnames = [
+            "data/castep_files/NaP_intermediates.castep",
+            "data/castep_files/KP-castep17.castep",
+            "data/castep_files/TiO2_unconverged-MP-10101.castep",
+            "data/castep_files/Fe-spin.castep",
+            "data/castep_phonon_files/K-CollCode44670.castep",
+        ]
+        os.makedirs("full")
+        for fname in fnames:
+            with open(REAL_PATH + fname, "rb") as f:
+                data = f.read()
+            seed = os.path.basename(fname)
+            open(seed, "wb").close()
+            reader = CastepOutputReader(seed, db=False)
+            # write the file in chunks, splitting lines between chunks
+            chunk_size = len(data) // 7 + 1
+            for ind in range(0, len(data), chunk_size):
+                with open(seed, "ab") as f:
+                    f.write(data[ind : ind + chunk_size])
+                incremental, s = reader.update()
+                # compare with a full scrape of the complete lines written so far
+                full_data = data[: ind + chunk_size]
+                full_data = full_data[: full_data.rfind(b"\n") + 1]
+                with open("full/" + seed, "wb") as f:
+                    f.write(full_data)
+                full, full_s = castep2dict("full/" + seed, db=False, verbosity=0)
+                self.assertEqual(s, full_s, msg=fname)
+                if not s:
+                    continue
+                self.assertEqual(set(incremental), set(full), msg=fname)
+                for key in full:
+                    if key == "source":
+                        continue
+                    if isinstance(full[key], dict):
+                        self.assertEqual(incremental[key], full[key], msg=key)
+                    else:
+                        np.testing.assert_array_equal(
+                            incremental[key], full[key], err_msg=key
+                        )
+            self.assertEqual(incremental["source"], [seed])
+
 
 class ResScraperTests(MatadorUnitTest):
     def test_res(self):
@@ -1526,6 +1575,195 @@ class ScraperMiscTest(MatadorUnitTest):
         bs, s = bands2dict(bands_fname, as_model=True)
         self.assertTrue(isinstance(bs, ElectronicDispersion))
 
+    def test_large_synthetic_bands(self):
+        """Check the vectorised bands parser on a large, shuffled file,
+        including some of Fortran's exponent-less floats.
+
+        """
+        from matador.utils.chem_utils import HARTREE_TO_EV
+
+        num_kpoints, num_spins, num_bands = 2000, 2, 50
+        rng = np.random.default_rng(0)
+        eigs = np.round(rng.uniform(-1, 1, (num_kpoints, num_spins, num_bands)), 8)
+        eigs[0, 0, 0] = 1e-100
+        order = rng.permutation(num_kpoints)
+        with open("large.bands", "w") as f:
+            f.write(
+                f"Number of k-points {num_kpoints}\n"
+                f"Number of spin components {num_spins}\n"
+                "Number of electrons 10.0 10.0\n"
+                f"Number of eigenvalues {num_bands} {num_bands}\n"
+                "Fermi energy (in atomic units) 0.1 0.1\n"
+                "Unit cell vectors\n"
+                "1.0 0.0 0.0\n0.0 1.0 0.0\n0.0 0.0 1.0\n"
+            )
+            for nk in order:
+                f.write(f"K-point {nk + 1:5d} {nk / num_kpoints:.8f} 0.0 0.0 0.0005\n")
+                for ns in range(num_spins):
+                    f.write(f"Spin component {ns + 1}\n")
+                    for eig in eigs[nk, ns]:
+                        if eig == 1e-100:
+                            f.write("   0.10000000-99\n")
+                        else:
+                            f.write(f"{eig:14.8f}\n")
+
+        # time the parse for comparison (see --log-cli-level=INFO), but do not assert on it
+        start = time.perf_counter()
+        bs_dict, s = bands2dict("large.bands")
+        LOG.info("Scraped large.bands in {:.3f} s".format(time.perf_counter() - start))
+        self.assertTrue(s, msg=bs_dict)
+        self.assertEqual(np.shape(bs_dict["eigs_s_k"]), (2, 50, 2000))
+        np.testing.assert_array_almost_equal(
+            bs_dict["eigs_s_k"] / HARTREE_TO_EV, np.transpose(eigs, (1, 2, 0))
+        )
+        np.testing.assert_array_almost_equal(
+            bs_dict["kpoint_path"][:, 0], np.arange(num_kpoints) / num_kpoints
+        )
+        self.assertEqual(bs_dict["kpoint_weights"][-1], 0.0005)
+
+    def test_large_synthetic_phonon(self):
+        num_atoms, num_kpoints = 4, 1000
+        num_modes = 3 * num_atoms
+        rng = np.random.default_rng(0)
+        freqs = np.round(rng.uniform(0, 500, (num_kpoints, num_modes)), 6)
+        with open("large.phonon", "w") as f:
+            f.write(
+                " BEGIN header\n"
+                f" Number of ions {num_atoms}\n"
+                f" Number of branches {num_modes}\n"
+                f" Number of wavevectors {num_kpoints}\n"
+                " Frequencies in         cm-1\n"
+                " Unit cell vectors (A)\n"
+                " 1.0 0.0 0.0\n 0.0 1.0 0.0\n 0.0 0.0 1.0\n"
+                " Fractional Co-ordinates\n"
+            )
+            for i in range(num_atoms):
+                f.write(f" {i + 1} 0.1 0.2 0.3 K 39.0983\n")
+            f.write(" END header\n")
+            for nq in range(num_kpoints):
+                f.write(f"   q-pt= {nq + 1:4d} {nq / num_kpoints:.6f} 0.0 0.0 0.001\n")
+                for nm in range(num_modes):
+                    f.write(f"  {nm + 1:6d} {freqs[nq, nm]:14.6f}\n")
+                f.write(" Phonon Eigenvectors\nMode Ion X Y Z\n")
+                for nm in range(num_modes):
+                    for i in range(num_atoms):
+                        f.write(f" {nm + 1} {i + 1} 0.1 0.0 0.1 0.0 0.1 0.0\n")
+
+        start = time.perf_counter()
+        ph_dict, s = phonon2dict("large.phonon")
+        LOG.info("Scraped large.phonon in {:.3f} s".format(time.perf_counter() - start))
+        self.assertTrue(s, msg=ph_dict)
+        self.assertEqual(np.shape(ph_dict["eigs_q"]), (1, num_modes, num_kpoints))
+        np.testing.assert_array_almost_equal(
+            ph_dict["eigs_q"][0] / INVERSE_CM_TO_EV, freqs.T
+        )
+        self.assertEqual(len(ph_dict["phonon_kpoint_list"]), num_kpoints)
+        self.assertNotIn("infrared_intensity", ph_dict)
+
+    def test_scraper_cache(self):
+        import json
+        import shutil
+        from matador.scrapers.utils import get_cache_fname
+
+        def tamper(cache_fname):
+            """Mark the cached result, to check that it is actually reused."""
+            with np.load(cache_fname, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+            meta = json.loads(arrays["__meta__"].tobytes().decode("utf-8"))
+            meta["result"]["from_cache"] = True
+            arrays["__meta__"] = np.frombuffer(
+                json.dumps(meta).encode("utf-8"), dtype=np.uint8
+            )
+            with open(cache_fname, "wb") as f:
+                np.savez(f, **arrays)
+
+        shutil.copy(REAL_PATH + "data/bands_files/KPSn.bands", "KPSn.bands")
+        cache_fname = get_cache_fname("KPSn.bands", "bands2dict")
+        self.assertEqual(cache_fname, ".KPSn.bands.bands2dict.npz")
+
+        bs_dict, s = bands2dict("KPSn.bands")
+        self.assertTrue(s)
+        self.assertFalse(os.path.isfile(cache_fname))
+
+        cached_dict, s = bands2dict("KPSn.bands", cache=True)
+        self.assertTrue(s)
+        self.assertTrue(os.path.isfile(cache_fname))
+        self.assertLess(os.path.getsize(cache_fname), os.path.getsize("KPSn.bands"))
+        np.testing.assert_array_equal(
+            cached_dict["eigenvalues_k_s"], bs_dict["eigenvalues_k_s"]
+        )
+
+        tamper(cache_fname)
+        cached_dict, s = bands2dict("KPSn.bands", cache=True)
+        self.assertTrue(s)
+        self.assertTrue(cached_dict.get("from_cache"))
+        self.assertIsInstance(cached_dict["eigenvalues_k_s"], np.ndarray)
+        np.testing.assert_array_equal(
+            cached_dict["eigenvalues_k_s"], bs_dict["eigenvalues_k_s"]
+        )
+        self.assertEqual(set(cached_dict), set(bs_dict) | {"from_cache"})
+        for key in bs_dict:
+            self.assertEqual(type(cached_dict[key]), type(bs_dict[key]), msg=key)
+        disp, s = bands2dict("KPSn.bands", cache=True, as_model=True)
+        self.assertIsInstance(disp, ElectronicDispersion)
+
+        # cache is ignored when it is not requested...
+        cached_dict, s = bands2dict("KPSn.bands")
+        self.assertIsNone(cached_dict.get("from_cache"))
+        # ...or if different keyword arguments are provided...
+        cached_dict, s = bands2dict("KPSn.bands", cache=True, some_kwarg=True)
+        self.assertIsNone(cached_dict.get("from_cache"))
+
+        # ...or if the file has changed
+        bands2dict("KPSn.bands", cache=True)
+        tamper(cache_fname)
+        stat = os.stat("KPSn.bands")
+        os.utime("KPSn.bands", ns=(stat.st_atime_ns, stat.st_mtime_ns + int(1e9)))
+        cached_dict, s = bands2dict("KPSn.bands", cache=True)
+        self.assertTrue(s)
+        self.assertIsNone(cached_dict.get("from_cache"))
+
+        # ...or if the cache would need to be unpickled
+        with open(cache_fname, "wb") as f:
+            np.savez(f, __meta__=np.array([{"key": None}], dtype=object))
+        cached_dict, s = bands2dict("KPSn.bands", cache=True)
+        self.assertTrue(s)
+        np.testing.assert_array_equal(
+            cached_dict["eigenvalues_k_s"], bs_dict["eigenvalues_k_s"]
+        )
+
+        # check that caching works with multiple files
+        shutil.copy(REAL_PATH + "data/bands_files/KPSn_2.bands", "KPSn_2.bands")
+        cursor, failures = bands2dict("*.bands", cache=True)
+        self.assertEqual(len(cursor), 2)
+        self.assertEqual(len(failures), 0)
+        self.assertTrue(os.path.isfile(".KPSn_2.bands.bands2dict.npz"))
+
+    def test_parallel_scraping(self):
+        castep_files = sorted(glob.glob(REAL_PATH + "data/castep_files/*.castep"))
+        cursor, failures = castep2dict(castep_files, db=False)
+        par_cursor, par_failures = castep2dict(castep_files, db=False, workers=2)
+        self.assertEqual(failures, par_failures)
+        self.assertEqual(len(cursor), len(par_cursor))
+        for doc, par_doc in zip(cursor, par_cursor):
+            self.assertEqual(doc["source"], par_doc["source"])
+            self.assertEqual(doc.get("enthalpy"), par_doc.get("enthalpy"))
+            np.testing.assert_array_equal(
+                doc["positions_frac"], par_doc["positions_frac"]
+            )
+
+        par_cursor, par_failures = castep2dict(
+            castep_files, db=False, workers=2, as_model=True
+        )
+        self.assertEqual(failures, par_failures)
+        self.assertEqual(len(par_cursor), len(cursor))
+        self.assertTrue(all(isinstance(doc, Crystal) for doc in par_cursor))
+
+        # check that the first failure is raised with fail_fast
+        res_files = sorted(glob.glob(REAL_PATH + "data/res_files/*.res"))
+        with self.assertRaises(Exception):
+            res2dict(res_files + castep_files, workers=2, fail_fast=True)
+
     def test_qe_magres(self):
         magres_fname = REAL_PATH + "data/magres_files/NaP_QE6.magres"
         magres_dict, s = magres2dict(magres_fname, as_model=True)
@@ -2576,6 +2814,58 @@ class ExportTest(MatadorUnitTest):
                 msg="Missing {}.{}".format(name, ext),
             )
 
+    def test_query2files_parallel_and_archives(self):
+        """Test that formatting in a pool and streaming into archives
+        reproduces the per-file output exactly.
+        """
+        import tarfile
+        import zipfile
+
+        def load_cursor():
+            cursor = []
+            for f in sorted(glob.glob(REAL_PATH + "data/json_query_files/*.json")):
+                with open(f, "r") as _f:
+                    cursor.append(json.load(_f))
+            return cursor
+
+        kwargs = dict(res=True, cell=True, param=True, json=True, latex=True)
+        query2files(load_cursor(), dirname="serial", **kwargs)
+        expected = {}
+        for fname in glob.glob("serial/*"):
+            with open(fname, "rb") as f:
+                expected[os.path.basename(fname)] = f.read()
+        self.assertEqual(len(expected), 14)
+
+        query2files(load_cursor(), dirname="parallel", workers=2, **kwargs)
+        for name, contents in expected.items():
+            name = name.replace("serial", "parallel")
+            with open("parallel/{}".format(name), "rb") as f:
+                self.assertEqual(f.read(), contents, msg=name)
+
+        for archive in ["tar", "tar.gz", "zip"]:
+            dirname = "archived_{}".format(archive.replace(".", "_"))
+            query2files(
+                load_cursor(), dirname=dirname, archive=archive, max_files=1, **kwargs
+            )
+            self.assertFalse(os.path.isdir(dirname))
+            fname = "{}.{}".format(dirname, archive)
+            if archive == "zip":
+                with zipfile.ZipFile(fname) as zf:
+                    members = {name: zf.read(name) for name in zf.namelist()}
+            else:
+                with tarfile.open(fname) as tf:
+                    members = {
+                        member.name: tf.extractfile(member).read()
+                        for member in tf.getmembers()
+                    }
+            self.assertEqual(len(members), len(expected))
+            for name, contents in expected.items():
+                name = "{}/{}".format(dirname, name.replace("serial", dirname))
+                self.assertEqual(members[name], contents, msg=name)
+
+        with self.assertRaises(RuntimeError):
+            query2files(load_cursor(), pdb=True, archive="zip")
+
     def test_large_writes(self):
         """Fake some large queries and make sure they are not written."""
         fake_cursor = 100 * [{"dummy": "data"}]
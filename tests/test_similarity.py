@@ -2,8 +2,16 @@
 import unittest
 from os.path import realpath
 import numpy as np
-from matador.fingerprints.similarity import get_uniq_cursor
+from matador.fingerprints.similarity import (
+    get_uniq_cursor,
+    get_structure_hash,
+    get_structure_descriptor,
+    _get_candidate_pairs,
+    _get_duplicate_clusters,
+    _enforce_hierarchy,
+)
 from matador.fingerprints import Fingerprint
+from matador.utils.cursor_utils import filter_unique_structures
 from matador.scrapers.castep_scrapers import res2dict
 
 REAL_PATH = "/".join(realpath(__file__).split("/")[:-1]) + "/"
@@ -33,6 +41,12 @@ class SimilarityFilterTest(unittest.TestCase):
         )
         self.assertEqual(uniq_inds, [6])
 
+    def test_empty_cursor(self):
+        for kwargs in ({}, {"prefilter": True}, {"transitive": True}):
+            with self.assertRaises(RuntimeError):
+                get_uniq_cursor([], **kwargs)
+            self.assertEqual(filter_unique_structures([], quiet=True, **kwargs), [])
+
     def test_k3p_uniq_default(self):
         cursor, _ = res2dict(REAL_PATH + "data/K3P_uniq/*.res")
         cursor = sorted(cursor, key=lambda x: x["enthalpy_per_atom"])
@@ -192,6 +206,100 @@ class SimilarityFilterTest(unittest.TestCase):
         filtered_cursor = filter_unique_structures(cursor, energy_tol=0.003)
         self.assertEqual(len(filtered_cursor), 8)
 
+    def test_prefilter_agrees_with_full_comparison(self):
+        cursor, _ = res2dict(REAL_PATH + "data/K3P_uniq/*.res")
+        cursor = sorted(cursor, key=lambda x: x["enthalpy_per_atom"])
+        uniq_inds, _, _, sim_mat = get_uniq_cursor(cursor)
+        prefilter_uniq_inds, _, _, prefilter_sim_mat = get_uniq_cursor(
+            cursor, prefilter=True
+        )
+        self.assertEqual(uniq_inds, prefilter_uniq_inds)
+        self.assertLess(len(prefilter_sim_mat), len(sim_mat))
+
+        import glob
+
+        files = glob.glob(REAL_PATH + "data/uniqueness_hierarchy/*.res")
+        cursor = sorted(
+            [res2dict(f)[0] for f in files], key=lambda x: x["enthalpy_per_atom"]
+        )
+        kwargs = {"sim_tol": 0.08, "energy_tol": 0.05, "dr": 0.1}
+        uniq_inds, _, _, _ = get_uniq_cursor(cursor, **kwargs)
+        prefilter_uniq_inds, _, _, _ = get_uniq_cursor(cursor, prefilter=True, **kwargs)
+        self.assertEqual(uniq_inds, prefilter_uniq_inds)
+
+    def test_prefilter_exact_duplicates(self):
+        import copy
+
+        primitive, _ = res2dict(REAL_PATH + "data/KP_primitive.res", db=False)
+        supercell, _ = res2dict(REAL_PATH + "data/KP_supercell.res", db=False)
+        self.assertEqual(get_structure_hash(primitive), get_structure_hash(supercell))
+        self.assertAlmostEqual(
+            np.max(
+                np.abs(
+                    get_structure_descriptor(primitive)
+                    - get_structure_descriptor(supercell)
+                )
+            ),
+            0.0,
+            places=4,
+        )
+
+        cursor = [copy.deepcopy(primitive) for _ in range(5)]
+        uniq_inds, dupe_dict, _, sim_mat = get_uniq_cursor(cursor, prefilter=True)
+        self.assertEqual(uniq_inds, [0])
+        self.assertEqual(dupe_dict[0], {1, 2, 3, 4})
+        self.assertEqual(sim_mat[0, 4], 0.0)
+
+    def test_candidate_pairs(self):
+        cursor = [
+            {"stoichiometry": [["K", 1], ["P", 1]], "enthalpy_per_atom": -1.0},
+            {"stoichiometry": [["P", 1], ["K", 1]], "enthalpy_per_atom": -1.004},
+            {"stoichiometry": [["K", 3], ["P", 1]], "enthalpy_per_atom": -1.0},
+            {"stoichiometry": [["K", 1], ["P", 1]], "enthalpy_per_atom": -1.02},
+            {"stoichiometry": [["K", 1], ["P", 1]], "enthalpy_per_atom": -0.996},
+        ]
+        brute_force = [
+            (i, j)
+            for i in range(len(cursor))
+            for j in range(i + 1, len(cursor))
+            if sorted(cursor[i]["stoichiometry"]) == sorted(cursor[j]["stoichiometry"])
+            and abs(cursor[i]["enthalpy_per_atom"] - cursor[j]["enthalpy_per_atom"])
+            < 1e-2
+        ]
+        self.assertEqual(_get_candidate_pairs(cursor, 1e-2, True), brute_force)
+        self.assertEqual(
+            _get_candidate_pairs(cursor, 1e-2, True), [(0, 1), (0, 4), (1, 4)]
+        )
+        self.assertEqual(len(_get_candidate_pairs(cursor, 1e-2, False)), 10)
+
+    def test_duplicate_clusters(self):
+        from collections import defaultdict
+
+        # 0 ~ 1 ~ 2 form a chain, 3 ~ 4, 5 is isolated
+        sim_mat = defaultdict(lambda: 1e10)
+        for (i, j), sim in {
+            (0, 1): 0.05,
+            (1, 2): 0.05,
+            (0, 2): 0.2,
+            (3, 4): 0.0,
+        }.items():
+            sim_mat[i, j] = sim
+            sim_mat[j, i] = sim
+
+        clusters = _get_duplicate_clusters(sim_mat, 0.1, 6)
+        self.assertEqual(clusters, [[0, 1], [2], [3, 4], [5]])
+        clusters = _get_duplicate_clusters(sim_mat, 0.1, 6, transitive=True)
+        self.assertEqual(clusters, [[0, 1, 2], [3, 4], [5]])
+        # exact duplicates always follow their representative
+        clusters = _get_duplicate_clusters(sim_mat, 0.1, 6, exact_dupes={5: 1})
+        self.assertEqual(clusters, [[0, 1, 5], [2], [3, 4]])
+
+        values = ["AIRSS", "ICSD", "GA", "GA", "OQMD", "ICSD"]
+        dupe_dict = _enforce_hierarchy(
+            [[0, 1, 5], [2], [3, 4]], values, ["ICSD", "OQMD", "AIRSS"]
+        )
+        self.assertEqual(dupe_dict, {1: {0, 5}, 2: set(), 4: {3}})
+
 
 class TestBroadening(unittest.TestCase):
     def test_broadening_agreement(self):
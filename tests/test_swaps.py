@@ -1,6 +1,13 @@
 #!/usr/bin/env python
 import unittest
+import os
+import tempfile
+import tracemalloc
+
+import numpy as np
+
 from matador.swaps import AtomicSwapper
+from matador.export import query2files
 from matador.utils.chem_utils import get_periodic_table
 
 
@@ -198,5 +205,112 @@ class SwapTest(unittest.TestCase):
         self.assertEqual(num_swapped, 0)
 
 
+class LazySwapTest(unittest.TestCase):
+    """Test the lazy swap generator."""
+
+    @staticmethod
+    def _synthetic_cursor(num_prototypes, seed=0):
+        """Make pairs of prototypes with the same geometry, one
+        containing As and the other P.
+        """
+        rng = np.random.default_rng(seed)
+        for ind in range(num_prototypes):
+            if ind % 2 == 0:
+                lattice_cart = (np.diag(rng.uniform(3, 6, size=3))).tolist()
+                positions_frac = rng.random((8, 3)).tolist()
+            anion = "As" if ind % 2 == 0 else "P"
+            atom_types = 4 * ["K"] + 4 * [anion]
+            yield {
+                "atom_types": atom_types,
+                "stoichiometry": [["K", 1.0], [anion, 1.0]],
+                "lattice_cart": lattice_cart,
+                "positions_frac": positions_frac,
+                "space_group": "P1",
+                "source": ["proto-{}.res".format(ind)],
+                "enthalpy_per_atom": -1.0,
+            }
+
+    def test_lazy_swaps(self):
+        cursor = list(self._synthetic_cursor(4))
+        swapper = AtomicSwapper(cursor, swap=["[As,P][Sb,Bi]"], lazy=True)
+        self.assertEqual(swapper.swap_counter, 0)
+        swapped = list(swapper.cursor)
+        # each pair of prototypes swaps to the same two structures
+        self.assertEqual(len(swapped), 4)
+        self.assertEqual(swapper.swap_counter, 4)
+        self.assertEqual(swapper.num_duplicates, 4)
+        self.assertEqual(swapped[0]["atom_types"], 4 * ["K"] + 4 * ["Sb"])
+        self.assertEqual(swapped[0]["_swapped_stoichiometry"], [["As", 1], ["K", 1]])
+        self.assertEqual(swapped[0]["stoichiometry"], [["K", 1], ["Sb", 1]])
+        # the geometry is shared with, and the source left unchanged
+        self.assertIs(swapped[0]["positions_frac"], cursor[0]["positions_frac"])
+        self.assertEqual(cursor[0]["atom_types"], 4 * ["K"] + 4 * ["As"])
+
+        # the eager and lazy swaps agree without deduplication
+        eager = AtomicSwapper(cursor, swap=["[As,P][Sb,Bi]"])
+        lazy = AtomicSwapper(cursor, swap=["[As,P][Sb,Bi]"], lazy=True)
+        self.assertEqual(eager.cursor, list(lazy.iter_swaps(cursor, dedupe=False)))
+
+        # top only swaps the first structures
+        swapper = AtomicSwapper(cursor, swap=["[As,P][Sb,Bi]"], lazy=True, top=1)
+        self.assertEqual(len(list(swapper.cursor)), 2)
+
+    def test_swaps_without_lattice(self):
+        # structures that cannot be hashed are never dropped as duplicates
+        cursor = []
+        for doc in self._synthetic_cursor(4):
+            del doc["lattice_cart"]
+            cursor.append(doc)
+        swapper = AtomicSwapper(cursor, swap=["[As,P][Sb,Bi]"], lazy=True)
+        self.assertEqual(len(list(swapper.cursor)), 8)
+        self.assertEqual(swapper.num_duplicates, 0)
+
+    def test_stream_to_files(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chdir(tmpdir)
+            try:
+                swapper = AtomicSwapper(
+                    self._synthetic_cursor(6), swap=["[As,P]Sb"], lazy=True
+                )
+                query2files(swapper, res=True, dirname="swapped")
+                self.assertEqual(len(os.listdir("swapped")), 3)
+
+                swapper = AtomicSwapper(
+                    self._synthetic_cursor(6), swap=["[As,P]Sb"], lazy=True
+                )
+                with self.assertRaises(RuntimeError):
+                    query2files(swapper, res=True, dirname="limited", max_files=2)
+                self.assertEqual(len(os.listdir("limited")), 2)
+            finally:
+                os.chdir(cwd)
+
+    def test_peak_memory(self):
+        num_prototypes = 10**4
+        swap = ["[As,P]Sb"]
+        cursor = list(self._synthetic_cursor(num_prototypes))
+
+        # measure each peak in its own session, as reset_peak needs Python 3.9
+        tracemalloc.start()
+        try:
+            swapper = AtomicSwapper(cursor, swap=swap, lazy=True)
+            num_lazy = sum(1 for _ in swapper.cursor)
+            _, lazy_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        tracemalloc.start()
+        try:
+            eager = AtomicSwapper(cursor, swap=swap)
+            num_eager = len(eager.cursor)
+            _, eager_peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(num_eager, num_prototypes)
+        self.assertEqual(num_lazy, num_prototypes // 2)
+        self.assertLess(lazy_peak, 0.2 * eager_peak)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -6,12 +6,14 @@ import unittest
 import os
 import shutil
 import glob
+import time
 
 import psutil
 import numpy as np
 
 from .utils import MatadorUnitTest, REAL_PATH, detect_program
 from matador.compute import ComputeTask
+from matador.workflows.workflows import Workflow
 from matador.scrapers import cell2dict, param2dict, phonon2dict, magres2dict
 
 
@@ -406,5 +408,266 @@ class SpectralWorkflowTest(MatadorUnitTest):
         self.assertTrue(os.path.isfile("completed/Si2.res"))
 
 
+class _StubComputer:
+    """Stand-in for a ComputeTask that only records clean ups."""
+
+    compute_dir = None
+    run3_settings = {}
+
+    def __init__(self, ncores):
+        self.ncores = ncores
+        self.seed = "stub"
+        self.cleaned = []
+
+    def mv_to_completed(self, seed, **kwargs):
+        self.cleaned.append(True)
+
+    def mv_to_bad(self, seed):
+        self.cleaned.append(False)
+
+
+def _stub_step(
+    computer,
+    calc_doc,
+    seed,
+    name_tag=None,
+    duration=0.1,
+    fail=False,
+    fname=None,
+    key=None,
+    text=None,
+):
+    """Stand-in for a calculation that records when, where and on how many cores
+    it ran, both in calc_doc and in an output file, named after the step unless
+    `key` and `fname` are passed, containing the step name unless `text` is passed.
+
+    """
+    start = time.time()
+    time.sleep(duration)
+    if fail:
+        raise RuntimeError("Stub step failed.")
+    if fname is None:
+        fname = "{}.{}".format(seed, name_tag)
+    with open(os.path.join(computer.compute_dir or ".", fname), "w") as f:
+        f.write(text or name_tag)
+    calc_doc[key or name_tag] = {
+        "start": start,
+        "end": time.time(),
+        "ncores": computer.ncores,
+        "pid": os.getpid(),
+        "cwd": os.path.basename(os.getcwd()),
+    }
+    return True
+
+
+class _StubWorkflow(Workflow):
+    """Workflow of stub steps, passed as a list of (name, add_step kwargs)."""
+
+    def preprocess(self):
+        for name, kwargs in self.workflow_params["stub_steps"]:
+            self.add_step(_stub_step, name, **kwargs)
+
+    def postprocess(self):
+        return True
+
+
+class WorkflowGraphTest(MatadorUnitTest):
+    """Test running workflow steps in order and as a dependency graph,
+    with stub steps.
+
+    """
+
+    stub_steps = [
+        ("relax", {"provides": ["structure"], "ncores": 4}),
+        ("dos", {"requires": ["structure"], "provides": ["dos"], "ncores": 2}),
+        ("disp", {"requires": ["structure"], "provides": ["disp"], "ncores": 2}),
+        ("thermo", {"requires": ["structure"], "ncores": 2}),
+        ("plot", {"requires": ["dos", "disp"], "ncores": 1}),
+        ("final", {}),
+    ]
+
+    def _run(self, stub_steps=None, calc_doc=None, **workflow_kwargs):
+        if stub_steps is None:
+            stub_steps = self.stub_steps
+        if calc_doc is None:
+            calc_doc = {}
+        computer = _StubComputer(ncores=4)
+        workflow = _StubWorkflow(
+            computer,
+            calc_doc,
+            "stub",
+            stub_steps=[
+                (name, dict(kwargs, name_tag=name)) for name, kwargs in stub_steps
+            ],
+            **workflow_kwargs
+        )
+        records = {
+            name: workflow.calc_doc[name]
+            for name, _ in stub_steps
+            if name in workflow.calc_doc
+        }
+        return workflow, records, computer
+
+    def test_step_dependencies(self):
+        workflow, _, _ = self._run()
+        self.assertEqual(
+            workflow.get_step_dependencies(),
+            [set(), {0}, {0}, {0}, {1, 2}, {0, 1, 2, 3, 4}],
+        )
+
+    def test_sequential_steps(self):
+        workflow, records, computer = self._run()
+        self.assertTrue(workflow.success)
+        self.assertEqual(computer.cleaned, [True])
+        order = sorted(records, key=lambda name: records[name]["start"])
+        self.assertEqual(order, [name for name, _ in self.stub_steps])
+        for prev, step in zip(order[:-1], order[1:]):
+            self.assertLessEqual(records[prev]["end"], records[step]["start"])
+        self.assertEqual(
+            [records[name]["ncores"] for name in order], [4, 2, 2, 2, 1, 4]
+        )
+        self.assertEqual({record["pid"] for record in records.values()}, {os.getpid()})
+        self.assertEqual(computer.ncores, 4)
+
+    def test_concurrent_steps(self):
+        workflow, records, computer = self._run(max_workers=4)
+        self.assertTrue(workflow.success)
+        self.assertEqual(computer.cleaned, [True])
+        self.assertEqual(computer.ncores, 4)
+
+        # dependencies are respected
+        dependencies = workflow.get_step_dependencies()
+        names = [name for name, _ in self.stub_steps]
+        for ind, name in enumerate(names):
+            for dep in dependencies[ind]:
+                self.assertLessEqual(records[names[dep]]["end"], records[name]["start"])
+
+        # independent branches overlap, but never exceed the available cores
+        self.assertLess(records["dos"]["start"], records["disp"]["end"])
+        self.assertLess(records["disp"]["start"], records["dos"]["end"])
+        for record in records.values():
+            running = [
+                other
+                for other in records.values()
+                if other["start"] <= record["start"] < other["end"]
+            ]
+            self.assertLessEqual(sum(other["ncores"] for other in running), 4)
+
+        # steps with nothing to run alongside run here, others in their own
+        # process and directory, whose new files are moved into the workflow's
+        self.assertEqual(records["relax"]["pid"], os.getpid())
+        self.assertEqual(records["final"]["pid"], os.getpid())
+        self.assertEqual(records["relax"]["cwd"], "tmp_test")
+        self.assertNotEqual(records["dos"]["pid"], os.getpid())
+        self.assertNotEqual(records["dos"]["pid"], records["disp"]["pid"])
+        self.assertEqual(records["dos"]["cwd"], "stub_dos")
+        self.assertEqual(records["disp"]["cwd"], "stub_disp")
+        for name in names:
+            self.assertTrue(os.path.isfile("stub.{}".format(name)))
+            self.assertFalse(os.path.isdir("stub_{}".format(name)))
+
+    def test_concurrent_calc_doc(self):
+        calc_doc = {"cutoff": 300, "kpoints_mp_spacing": 0.05}
+        workflow, _, _ = self._run(
+            stub_steps=self.stub_steps[:3], calc_doc=calc_doc, max_workers=2
+        )
+        # changes made by each concurrent step are merged back
+        self.assertIs(workflow.calc_doc, calc_doc)
+        self.assertEqual(
+            sorted(calc_doc), ["cutoff", "disp", "dos", "kpoints_mp_spacing", "relax"]
+        )
+
+    def test_conflicting_files(self):
+        stub_steps = [
+            ("relax", {"provides": ["structure"]}),
+            ("dos", {"requires": ["structure"], "fname": "stub.castep"}),
+            (
+                "disp",
+                {"requires": ["structure"], "fname": "stub.castep", "duration": 0.3},
+            ),
+        ]
+        with self.assertRaises(RuntimeError):
+            self._run(stub_steps=stub_steps, max_workers=2, max_cores=8)
+        # the first file is collected, the clashing one is left in its step's directory
+        with open("stub.castep") as f:
+            self.assertEqual(f.read(), "dos")
+        with open("stub_disp/stub.castep") as f:
+            self.assertEqual(f.read(), "disp")
+
+    def test_conflicting_calc_doc_keys(self):
+        stub_steps = [
+            ("relax", {"provides": ["structure"]}),
+            ("dos", {"requires": ["structure"], "key": "bands"}),
+            ("disp", {"requires": ["structure"], "key": "bands", "duration": 0.3}),
+        ]
+        calc_doc = {}
+        with self.assertRaises(RuntimeError):
+            self._run(
+                stub_steps=stub_steps, calc_doc=calc_doc, max_workers=2, max_cores=8
+            )
+        self.assertEqual(calc_doc["bands"]["cwd"], "stub_dos")
+
+    def test_identical_files(self):
+        stub_steps = [
+            ("relax", {"provides": ["structure"]}),
+            ("dos", {"requires": ["structure"], "fname": "stub.res", "text": "Si"}),
+            ("disp", {"requires": ["structure"], "fname": "stub.res", "text": "Si"}),
+        ]
+        workflow, _, _ = self._run(stub_steps=stub_steps, max_workers=2)
+        self.assertTrue(workflow.success)
+        with open("stub.res") as f:
+            self.assertEqual(f.read(), "Si")
+
+    def test_cached_outputs(self):
+        # both steps write stub.out, but it is only collected under each step's name
+        stub_steps = [
+            ("relax", {"provides": ["structure"]}),
+            ("dos", {"requires": ["structure"], "fname": "stub.out"}),
+            ("disp", {"requires": ["structure"], "fname": "stub.out"}),
+        ]
+        stub_steps = [
+            (name, dict(kwargs, output_exts=[".out"])) for name, kwargs in stub_steps
+        ]
+        with open("stub.cell", "w") as f:
+            f.write("staged")
+        workflow, _, _ = self._run(stub_steps=stub_steps, max_workers=2)
+        self.assertTrue(workflow.success)
+        self.assertFalse(os.path.isfile("stub.out"))
+        for name in ["dos", "disp"]:
+            with open("stub.out_{}".format(name)) as f:
+                self.assertEqual(f.read(), name)
+            self.assertFalse(os.path.isdir("stub_{}".format(name)))
+
+    def test_failed_step(self):
+        stub_steps = [
+            ("relax", {"provides": ["structure"]}),
+            ("dos", {"requires": ["structure"], "provides": ["dos"], "fail": True}),
+            (
+                "disp",
+                {"requires": ["structure"], "provides": ["disp"], "duration": 0.3},
+            ),
+            ("plot", {"requires": ["dos", "disp"]}),
+        ]
+        calc_doc = {}
+        with self.assertRaises(RuntimeError):
+            self._run(
+                stub_steps=stub_steps, calc_doc=calc_doc, max_workers=4, max_cores=8
+            )
+        # the running branch is allowed to finish, but dependent steps never start
+        self.assertEqual(sorted(calc_doc), ["disp", "relax"])
+
+    def test_failed_sequential_step(self):
+        stub_steps = [
+            ("relax", {}),
+            ("dos", {"ncores": 2, "fail": True}),
+            ("plot", {}),
+        ]
+        calc_doc = {}
+        with self.assertRaises(RuntimeError):
+            self._run(stub_steps=stub_steps, calc_doc=calc_doc)
+        # later steps never start
+        self.assertEqual(sorted(calc_doc), ["relax"])
+
+
 if __name__ == "__main__":
     unittest.main()